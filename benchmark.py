@@ -0,0 +1,592 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+'''
+性能测试
+'''
+
+from main import run
+from lk_engine import Engine, compileSource, cacheTag, BACKENDS
+from lk_batch import runBatch
+from lk_lexer import Lexer
+from lk_parser import Parser
+from lk_type import Value
+from lk_session import Session
+from lk_position import sources
+from lk_optimizer import INLINE_SIZE
+from lk_cache import cachePath, cacheKey, load, store
+
+import argparse
+import contextlib
+import io
+import os
+import subprocess
+import sys
+import tempfile
+import time
+import tracemalloc
+
+# 测试脚本
+WORKLOADS = {
+    # example.lk中阶乘的递归实现
+    'factorial': '''
+func factorial(n) -> {
+    if n == 1 {
+        return 1
+    }
+    return n * factorial(n - 1)
+}
+var res = 0
+for i = 1 to 200 {
+    res = factorial(60)
+}
+res
+''',
+    'fib': '''
+func fib(n) -> {
+    if n < 2 {
+        return n
+    }
+    return fib(n - 1) + fib(n - 2)
+}
+fib(18)
+''',
+    # example.lk中阶乘的递推实现
+    'loop': '''
+var res = 1
+for i = 1 to 100000 {
+    res *= 3
+    res %= 1000007
+}
+res
+''',
+    # 累加器形式的尾递归, 递归深度超过Python的递归限制
+    'tail': '''
+func sum(n, acc) -> {
+    if n == 0 {
+        return acc
+    }
+    return sum(n - 1, acc + n)
+}
+sum(200000, 0)
+''',
+    # 记忆化的递归, 没有缓存时调用次数随参数指数增长
+    'memo': '''
+func paths(r, c) -> {
+    if r == 0 or c == 0 {
+        return 1
+    }
+    return paths(r - 1, c) + paths(r, c - 1)
+}
+paths = memo(paths, 10000)
+paths(60, 60)
+''',
+    # 循环中反复调用同一个函数和内建函数
+    'calls': '''
+func inc(x) -> {
+    return x + 1
+}
+var s = 0
+for i = 1 to 50000 {
+    s = inc(s)
+    var t = str(i)
+}
+s
+''',
+    'while': '''
+var i = 0
+var s = 0
+while i < 50000 {
+    i += 1
+    s += i * i
+}
+s
+'''
+}
+
+# 统计每次迭代创建的值, 循环次数由{n}替换
+ALLOC_WORKLOAD = '''
+var s = 0
+for i = 1 to {n} {
+    s = s + i
+}
+'''
+
+# 用+=逐个追加构建数组, 长度由{n}替换
+LIST_WORKLOAD = '''
+func build(n) -> {
+    var acc = []
+    for i = 1 to n {
+        acc += [i]
+    }
+    return acc
+}
+var res = build({n})
+'''
+
+# 循环中调用小的箭头函数, 用于比较-O内联前后的时间
+INLINE_WORKLOAD = '''
+func sq(x) -> x * x
+
+func dist(a, b) -> sq(a - b)
+
+var s = 0
+for i = 1 to 50000 {
+    s += dist(i, 3) % 7
+}
+s
+'''
+
+# 嵌入时反复执行的小脚本, x由每次执行注入
+ENGINE_WORKLOAD = '''
+var y = x * 2 + 1
+func clamp(v) -> v % 100
+
+clamp(y * y) + len
+'''
+
+# 批量执行的脚本, 每条记录是一个整数
+BATCH_WORKLOAD = '''
+var n = int(record)
+var s = 0
+for i = 1 to 20 {
+    s += (n * i) % 7
+}
+var output = record + ' ' + str(s)
+'''
+
+# 交互式会话中反复修改后执行的缓冲区, 由多个函数定义组成, 编号由{i}替换
+SESSION_WORKLOAD = '''
+func f{i}(n) -> {
+    var s = 0
+    for i = 1 to n {
+        s += i * {i}
+    }
+    return s
+}
+'''
+
+def lexSource(size):
+    '''
+    重复所有测试脚本, 生成不小于size字节的源代码
+    '''
+    unit = '\n'.join(WORKLOADS.values()) + INLINE_WORKLOAD + "var s = 'a\\tb' // 注释\n"
+    return unit * (size // len(unit.encode()) + 1)
+
+def benchLexer(sizes=(1, 4, 16), repeat=3):
+    '''
+    词法分析的吞吐量, 大小以MB为单位
+    '''
+    print(f'{"size":>8}{"tokens":>12}{"time":>12}{"MB/s":>10}')
+    for size in sizes:
+        source = lexSource(size * 1024 * 1024)
+        mb = len(source.encode()) / 1024 / 1024
+        best = None
+        for _ in range(repeat):
+            start = time.perf_counter()
+            tokens, err = Lexer('<lex>', source).makeTokens()
+            elapsed = time.perf_counter() - start
+            if err is not None:
+                raise Exception(err.getError())
+            if best is None or elapsed < best:
+                best = elapsed
+        print(f'{mb:>6.1f}MB{len(tokens):>12}{best * 1000:>10.0f}ms{mb / best:>10.2f}')
+
+def parsePeak(source, stream):
+    '''
+    词法和语法分析的内存峰值
+    @param stream 是否边读取Token边分析
+    '''
+    tracemalloc.start()
+    try:
+        lexer = Lexer('<parse>', source)
+        if stream:
+            tokens = lexer.generateTokens()
+        else:
+            tokens, err = lexer.makeTokens()
+        ast = Parser(tokens).parse()
+        _, peak = tracemalloc.get_traced_memory()
+    finally:
+        tracemalloc.stop()
+    if ast.error is not None:
+        raise Exception(ast.error.getError())
+    return peak
+
+def benchParseMemory(sizes=(1, 4)):
+    '''
+    先生成全部Token与按需读取Token时分析的内存峰值, 大小以MB为单位
+    '''
+    print(f'{"size":>8}{"token list":>14}{"stream":>14}')
+    for size in sizes:
+        source = lexSource(size * 1024 * 1024)
+        mb = len(source.encode()) / 1024 / 1024
+        peaks = [parsePeak(source, stream) / 1024 / 1024 for stream in (False, True)]
+        print(f'{mb:>6.1f}MB' + ''.join(f'{p:>12.1f}MB' for p in peaks))
+
+def benchParser(sizes=(1, 4, 16), repeat=3):
+    '''
+    语法分析的速度, 大小以MB为单位
+    parse只分析已经生成的Token列表, total包括按需读取Token时的词法分析
+    '''
+    print(f'{"size":>8}{"tokens":>12}{"parse":>12}{"MB/s":>10}{"Mtokens/s":>12}{"total":>12}{"MB/s":>10}')
+    for size in sizes:
+        source = lexSource(size * 1024 * 1024)
+        mb = len(source.encode()) / 1024 / 1024
+        tokens, err = Lexer('<parse>', source).makeTokens()
+        if err is not None:
+            raise Exception(err.getError())
+        parse = total = None
+        for _ in range(repeat):
+            start = time.perf_counter()
+            ast = Parser(tokens).parse()
+            elapsed = time.perf_counter() - start
+            if ast.error is not None:
+                raise Exception(ast.error.getError())
+            if parse is None or elapsed < parse:
+                parse = elapsed
+            ast = None
+
+            start = time.perf_counter()
+            ast = Parser(Lexer('<parse>', source).generateTokens()).parse()
+            elapsed = time.perf_counter() - start
+            if total is None or elapsed < total:
+                total = elapsed
+            ast = None
+        print(f'{mb:>6.1f}MB{len(tokens):>12}{parse * 1000:>10.0f}ms{mb / parse:>10.2f}{len(tokens) / parse / 1e6:>12.2f}'
+              f'{total * 1000:>10.0f}ms{mb / total:>10.2f}')
+
+def countValues(source, backend):
+    '''
+    运行脚本, 返回创建的Value对象个数
+    '''
+    count = 0
+    init = Value.__init__
+
+    def countingInit(self):
+        nonlocal count
+        count += 1
+        init(self)
+
+    Value.__init__ = countingInit
+    try:
+        _, err = run('<alloc>', source, backend=backend, need_result=False)
+    finally:
+        Value.__init__ = init
+    if err is not None:
+        raise Exception(err.getError())
+    return count
+
+def benchAllocations(backends, n=1000):
+    '''
+    两种循环次数之差除以n, 去掉与循环次数无关的部分
+    '''
+    print(f'{"backend":<12}{"values/iteration":>18}')
+    for backend in backends:
+        small = countValues(ALLOC_WORKLOAD.replace('{n}', str(n)), backend)
+        large = countValues(ALLOC_WORKLOAD.replace('{n}', str(n * 2)), backend)
+        print(f'{backend:<12}{(large - small) / n:>18.2f}')
+
+def peakMemory(source, backend):
+    '''
+    运行脚本, 不收集运行结果, 返回内存峰值
+    '''
+    tracemalloc.start()
+    try:
+        _, err = run('<memory>', source, backend=backend, need_result=False)
+        _, peak = tracemalloc.get_traced_memory()
+    finally:
+        tracemalloc.stop()
+    if err is not None:
+        raise Exception(err.getError())
+    return peak
+
+def benchMemory(backends, sizes=(10000, 100000)):
+    '''
+    循环的值没有被使用, 内存峰值不应随循环次数增长
+    '''
+    print(f'{"backend":<12}' + ''.join(f'{f"n={n}":>14}' for n in sizes))
+    for backend in backends:
+        # 预热, 排除首次运行时的缓存
+        peakMemory(ALLOC_WORKLOAD.replace('{n}', '1'), backend)
+        peaks = [peakMemory(ALLOC_WORKLOAD.replace('{n}', str(n)), backend) for n in sizes]
+        print(f'{backend:<12}' + ''.join(f'{p / 1024:>12.1f}KB' for p in peaks))
+
+def benchListBuild(backends, sizes=(10000, 100000, 1000000)):
+    '''
+    就地追加时每个元素的时间应与数组长度无关
+    '''
+    print(f'{"backend":<12}' + ''.join(f'{f"n={n}":>16}' for n in sizes))
+    for backend in backends:
+        row = f'{backend:<12}'
+        for n in sizes:
+            start = time.perf_counter()
+            value, err = run('<list>', LIST_WORKLOAD.replace('{n}', str(n)), backend=backend)
+            elapsed = time.perf_counter() - start
+            if err is not None:
+                raise Exception(err.getError())
+            if len(value.elements[-1].elements) != n:
+                raise Exception(f'{backend}: wrong list length')
+            row += f'{elapsed * 1e9 / n:>13.0f}ns'
+        print(row)
+
+def timeit(name, source, backend, repeat, optimize=False):
+    '''
+    多次运行取最短时间
+    '''
+    best = None
+    result = None
+    for _ in range(repeat):
+        start = time.perf_counter()
+        value, err = run(f'<{name}>', source, backend=backend, optimize=optimize)
+        elapsed = time.perf_counter() - start
+        if err is not None:
+            raise Exception(err.getError())
+        result = repr(value)
+        if best is None or elapsed < best:
+            best = elapsed
+    return best, result
+
+def benchBackends(names, backends, repeat):
+    print(f'{"workload":<12}' + ''.join(f'{b:>14}' for b in backends) + f'{"speedup":>10}')
+    for name in names:
+        times = []
+        results = set()
+        for backend in backends:
+            elapsed, result = timeit(name, WORKLOADS[name], backend, repeat)
+            times.append(elapsed)
+            results.add(result)
+        if len(results) != 1:
+            raise Exception(f'{name}: backends give different results')
+        row = f'{name:<12}' + ''.join(f'{t * 1000:>12.1f}ms' for t in times)
+        row += f'{times[0] / min(times[1:]):>9.2f}x' if len(times) > 1 else ''
+        print(row)
+
+def benchInline(backends, repeat):
+    '''
+    同一脚本不优化与-O优化的时间, 内联后省去函数调用
+    '''
+    print(f'{"backend":<12}{"plain":>14}{"-O":>14}{"speedup":>10}')
+    for backend in backends:
+        plain, plain_result = timeit('inline', INLINE_WORKLOAD, backend, repeat)
+        optimized, optimized_result = timeit('inline', INLINE_WORKLOAD, backend, repeat, optimize=True)
+        if plain_result != optimized_result:
+            raise Exception(f'{backend}: -O gives a different result')
+        print(f'{backend:<12}{plain * 1000:>12.1f}ms{optimized * 1000:>12.1f}ms{plain / optimized:>9.2f}x')
+
+def benchSession(backends, sizes=(200, 2000), repeat=3):
+    '''
+    修改缓冲区中的一条语句后再次执行的时间
+    run每次分析整个缓冲区, 会话只分析修改的语句
+    '''
+    print(f'{"backend":<12}{"statements":>12}{"run":>12}{"first":>12}{"edited":>12}{"speedup":>10}')
+    for backend in backends:
+        for size in sizes:
+            definitions = ''.join(SESSION_WORKLOAD.replace('{i}', str(i)) for i in range(size))
+            full = None
+            for _ in range(repeat):
+                start = time.perf_counter()
+                _, err = run('<session>', definitions + 'f0(10)', backend=backend)
+                elapsed = time.perf_counter() - start
+                if err is not None:
+                    raise Exception(err.getError())
+                if full is None or elapsed < full:
+                    full = elapsed
+
+            session = Session('<session>', backend)
+            start = time.perf_counter()
+            session.run(definitions + 'f0(10)')
+            first = time.perf_counter() - start
+            edited = None
+            for i in range(repeat):
+                start = time.perf_counter()
+                _, err = session.run(definitions + f'f{i + 1}(10)')
+                elapsed = time.perf_counter() - start
+                if err is not None:
+                    raise Exception(err.getError())
+                if edited is None or elapsed < edited:
+                    edited = elapsed
+            print(f'{backend:<12}{size + 1:>12}{full * 1000:>10.1f}ms{first * 1000:>10.1f}ms{edited * 1000:>10.1f}ms{full / edited:>9.1f}x')
+
+def benchCache(backends, sizes=(0.1, 1, 4), repeat=3):
+    '''
+    分析编译脚本与读取编译缓存的时间, 大小以MB为单位
+    rebase为缓存中的位置与当前位置空间不同, 需要重新计算位置时的读取时间
+    '''
+    print(f'{"backend":<12}{"size":>8}{"compile":>12}{"load":>12}{"rebase":>12}{"speedup":>10}{"cache":>10}')
+    with tempfile.TemporaryDirectory() as directory:
+        for backend in backends:
+            tag = cacheTag(backend, False, False, INLINE_SIZE)
+            for size in sizes:
+                source = lexSource(int(size * 1024 * 1024))
+                mb = len(source.encode()) / 1024 / 1024
+                path = cachePath(os.path.join(directory, f'bench{size}.lk'), tag)
+                key = cacheKey(source, tag)
+                best = [None, None, None]
+                for _ in range(repeat):
+                    start = time.perf_counter()
+                    program, err = compileSource(sources.add('<cache>', source), backend=backend, need_result=False)
+                    elapsed = [time.perf_counter() - start]
+                    if err is not None:
+                        raise Exception(err.getError())
+                    store(path, key, program, 0)
+                    program = None
+                    # 与缓存中的位置相同时不需要重新计算位置
+                    for base in (0, 1):
+                        start = time.perf_counter()
+                        if load(path, key, base) is None:
+                            raise Exception('cache miss')
+                        elapsed.append(time.perf_counter() - start)
+                    best = [t if b is None else min(t, b) for t, b in zip(elapsed, best)]
+                compile_time, load_time, rebase_time = best
+                print(f'{backend:<12}{mb:>6.1f}MB{compile_time * 1000:>10.0f}ms{load_time * 1000:>10.0f}ms{rebase_time * 1000:>10.0f}ms'
+                      f'{compile_time / load_time:>9.1f}x{os.path.getsize(path) / 1024 / 1024:>8.1f}MB')
+
+def benchEngine(backends, count=2000):
+    '''
+    多次执行同一小脚本的吞吐量, 单位为次每秒
+    run每次分析整个脚本并在共享的全局符号表中执行, Engine只编译一次, 每次执行使用独立的全局变量
+    '''
+    print(f'{"backend":<12}{"run":>12}{"engine":>12}{"speedup":>10}')
+    for backend in backends:
+        start = time.perf_counter()
+        for i in range(count):
+            _, err = run('<engine>', f'var x = {i}\nvar len = 1' + ENGINE_WORKLOAD, backend=backend)
+            if err is not None:
+                raise Exception(err.getError())
+        run_rate = count / (time.perf_counter() - start)
+
+        script, err = Engine(backend).compile(ENGINE_WORKLOAD, '<engine>')
+        if err is not None:
+            raise Exception(err.getError())
+        start = time.perf_counter()
+        for i in range(count):
+            _, err = script.run({'x': i, 'len': 1})
+            if err is not None:
+                raise Exception(err.getError())
+        engine_rate = count / (time.perf_counter() - start)
+        print(f'{backend:<12}{run_rate:>10.0f}/s{engine_rate:>10.0f}/s{engine_rate / run_rate:>9.1f}x')
+
+def benchBatch(backends, count=20000, chunk_size=500, processes=20):
+    '''
+    批量执行的吞吐量, 单位为记录每秒
+    process为每条记录启动一次main.py, 其余列为不同进程数的进程池
+    '''
+    cpus = os.cpu_count()
+    jobs = sorted({1, 2, 4, cpus} - {i for i in (2, 4) if i > cpus})
+    print(f'{"backend":<12}{"process":>12}' + ''.join(f'{f"-j {i}":>12}' for i in jobs))
+    with tempfile.TemporaryDirectory() as directory:
+        script = os.path.join(directory, 'batch.lk')
+        with open(script, 'w', encoding='UTF-8') as f:
+            f.write(BATCH_WORKLOAD)
+        records = os.path.join(directory, 'records.txt')
+        with open(records, 'w', encoding='UTF-8') as f:
+            f.write(''.join(f'{i}\n' for i in range(count)))
+        output = os.path.join(directory, 'output.txt')
+        main = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'main.py')
+
+        for backend in backends:
+            start = time.perf_counter()
+            for i in range(processes):
+                subprocess.run([sys.executable, main, script, '-b', backend, '--batch', '-', '-j', '1'], input=f'{i}\n', capture_output=True, text=True, check=True)
+            rates = [processes / (time.perf_counter() - start)]
+            for j in jobs:
+                start = time.perf_counter()
+                # 吞吐量由本函数计算, 不输出runBatch的统计
+                with contextlib.redirect_stderr(io.StringIO()):
+                    if not runBatch(script, records, Engine(backend), j, chunk_size, True, output):
+                        raise Exception('batch failed')
+                rates.append(count / (time.perf_counter() - start))
+            print(f'{backend:<12}' + ''.join(f'{f"{i:.0f}/s":>12}' for i in rates))
+
+def runScript(engine, file, text):
+    '''
+    编译并执行一次脚本
+    @return 结果, 错误
+    '''
+    script, err = engine.compile(text, file)
+    if err is not None:
+        return None, err
+    return script.run()
+
+def benchImport(backends, sizes=(200, 2000), scripts=10):
+    '''
+    多个脚本使用同一组函数的时间
+    粘贴时每个脚本都包含并分析全部函数, 导入时模块只在第一次使用时编译和执行一次
+    '''
+    print(f'{"backend":<12}{"functions":>12}{"paste":>12}{"first":>12}{"import":>12}{"speedup":>10}')
+    with tempfile.TemporaryDirectory() as directory:
+        for backend in backends:
+            for size in sizes:
+                definitions = ''.join(SESSION_WORKLOAD.replace('{i}', str(i)) for i in range(size))
+                module = os.path.join(directory, f'{backend}{size}.lk')
+                with open(module, 'w', encoding='UTF-8') as f:
+                    f.write(definitions)
+                script = os.path.join(directory, 'script.lk')
+                # 同一引擎中模块只加载一次
+                engine = Engine(backend, cache=False)
+
+                start = time.perf_counter()
+                for i in range(scripts):
+                    _, err = runScript(engine, script, definitions + f'f{i}(10)')
+                    if err is not None:
+                        raise Exception(err.getError())
+                paste = (time.perf_counter() - start) / scripts
+
+                elapsed = []
+                for i in range(scripts):
+                    start = time.perf_counter()
+                    _, err = runScript(engine, script, f"import f{i} from '{backend}{size}'\nf{i}(10)")
+                    elapsed.append(time.perf_counter() - start)
+                    if err is not None:
+                        raise Exception(err.getError())
+                first = elapsed[0]
+                imported = sum(elapsed[1:]) / (scripts - 1)
+                print(f'{backend:<12}{size:>12}{paste * 1000:>10.1f}ms{first * 1000:>10.1f}ms{imported * 1000:>10.2f}ms{paste / imported:>9.0f}x')
+
+if __name__ == '__main__':
+    sys.setrecursionlimit(100000)
+
+    arg_parser = argparse.ArgumentParser(description='LakiScript benchmark')
+    arg_parser.add_argument('workload', nargs='*', help=f'workloads to run, default: all of {", ".join(WORKLOADS)}')
+    arg_parser.add_argument('-b', '--backend', action='append', choices=BACKENDS, help='backends to compare, default: all')
+    arg_parser.add_argument('-r', '--repeat', type=int, default=3, help='runs per workload')
+    arg_parser.add_argument('--alloc', action='store_true', help='count values allocated per loop iteration instead of timing')
+    arg_parser.add_argument('--memory', action='store_true', help='measure peak memory of a loop whose value is not used')
+    arg_parser.add_argument('--list', action='store_true', help='measure time per element when building a list with +=')
+    arg_parser.add_argument('--lex', action='store_true', help='measure lexer throughput in MB/s on multi-megabyte sources')
+    arg_parser.add_argument('--parse', action='store_true', help='measure parser throughput on multi-megabyte sources')
+    arg_parser.add_argument('--parse-memory', action='store_true', help='compare peak memory of parsing a token list and a token stream')
+    arg_parser.add_argument('--session', action='store_true', help='compare re-running an edited shell buffer with and without the statement cache')
+    arg_parser.add_argument('--cache', action='store_true', help='compare compiling a script with loading it from the compiled-script cache')
+    arg_parser.add_argument('--engine', action='store_true', help='compare evaluations per second of main.run and a script compiled once by Engine')
+    arg_parser.add_argument('--batch', action='store_true', help='measure records per second of main.py --batch with different numbers of processes')
+    arg_parser.add_argument('--import', dest='import_', action='store_true', help='compare pasting shared functions into every script with importing them from a module')
+    arg_parser.add_argument('--inline', action='store_true', help='compare calls to small functions with and without -O inlining')
+    args = arg_parser.parse_args()
+
+    if args.alloc:
+        benchAllocations(args.backend or list(BACKENDS))
+    elif args.memory:
+        benchMemory(args.backend or list(BACKENDS))
+    elif args.list:
+        benchListBuild(args.backend or list(BACKENDS))
+    elif args.lex:
+        benchLexer(repeat=args.repeat)
+    elif args.parse:
+        benchParser(repeat=args.repeat)
+    elif args.parse_memory:
+        benchParseMemory()
+    elif args.session:
+        benchSession(args.backend or list(BACKENDS), repeat=args.repeat)
+    elif args.cache:
+        benchCache(args.backend or list(BACKENDS), repeat=args.repeat)
+    elif args.engine:
+        benchEngine(args.backend or list(BACKENDS))
+    elif args.batch:
+        benchBatch(args.backend or list(BACKENDS))
+    elif args.import_:
+        benchImport(args.backend or list(BACKENDS))
+    elif args.inline:
+        benchInline(args.backend or list(BACKENDS), args.repeat)
+    else:
+        benchBackends(args.workload or list(WORKLOADS), args.backend or list(BACKENDS), args.repeat)
\ No newline at end of file
@@ -0,0 +1,114 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+from lk_token import *
+from lk_ast_node import *
+from lk_resolver import children
+
+'''
+值使用分析
+语句块和循环的值是由每条语句, 每次循环的值组成的数组
+只有这个值被使用时才需要收集, 例如作为if的值被赋值, 作为箭头函数的返回值
+分析结果记录在BlockNode.value_needed, ForNode.value_needed, WhileNode.value_needed
+赋值表达式的值是变量中的数组本身, 被使用时数组被多处引用, 记录在VarAssignNode.value_needed, AugAssignNode.value_needed
+函数中循环外值直接作为返回值的调用是尾调用, 记录在CallNode.tail
+'''
+
+# 值使用分析器
+class ValueAnalyzer(object):
+
+    def __init__(self):
+        # 嵌套的函数层数, 顶层程序的return结束程序, 其中的调用不是尾调用
+        self.function_depth = 0
+        # 当前函数中包围节点的循环层数, 循环中return的调用不是尾调用
+        # 被调用的函数中循环外的break和continue结束的是这个循环, 需要保留调用帧
+        self.loop_depth = 0
+
+    def analyze(self, node, needed=True):
+        '''
+        @param node AST节点
+        @param needed 节点的值是否被使用
+        '''
+        method_name = f'analyze_{type(node).__name__}'
+        method = getattr(self, method_name, self.analyzeChildren)
+        method(node, needed)
+        return node
+
+    def analyzeChildren(self, node, needed):
+        # 其余节点的值由子节点计算得到, 子节点的值都被使用
+        for i in children(node):
+            self.analyze(i)
+
+    def analyze_BlockNode(self, node, needed):
+        node.value_needed = needed
+        for i in node.statement_nodes:
+            self.analyze(i, needed)
+
+    def analyze_VarAssignNode(self, node, needed):
+        node.value_needed = needed
+        self.analyze(node.value_node)
+
+    def analyze_AugAssignNode(self, node, needed):
+        node.value_needed = needed
+        self.analyze(node.value_node)
+
+    def analyze_IfNode(self, node, needed):
+        for condition, expr in node.case:
+            self.analyze(condition)
+            self.analyze(expr, needed)
+        if node.else_case is not None:
+            self.analyze(node.else_case, needed)
+
+    def analyze_ForNode(self, node, needed):
+        node.value_needed = needed
+        self.analyze(node.start_value_node)
+        self.analyze(node.end_value_node)
+        if node.step_value_node is not None:
+            self.analyze(node.step_value_node)
+        self.loop_depth += 1
+        self.analyze(node.body_node, needed)
+        self.loop_depth -= 1
+
+    def analyze_WhileNode(self, node, needed):
+        node.value_needed = needed
+        self.analyze(node.condition_node)
+        self.loop_depth += 1
+        self.analyze(node.body_node, needed)
+        self.loop_depth -= 1
+
+    def analyze_InlineNode(self, node, needed):
+        # 参数赋值的值不被使用
+        for i in node.assign_nodes:
+            self.analyze(i, False)
+        self.analyze(node.body_node, needed)
+
+    def analyze_FuncNode(self, node, needed):
+        # 只有箭头函数返回函数体的值
+        self.function_depth += 1
+        loop_depth = self.loop_depth
+        self.loop_depth = 0
+        self.analyze(node.body_node, node.auto_return)
+        self.loop_depth = loop_depth
+        self.function_depth -= 1
+        if node.auto_return:
+            self.markTail(node.body_node)
+
+    def analyze_ReturnNode(self, node, needed):
+        if node.node is None:
+            return
+        self.analyze(node.node)
+        if self.function_depth > 0 and self.loop_depth == 0:
+            self.markTail(node.node)
+
+    def markTail(self, node):
+        '''
+        标记值直接作为函数返回值的调用
+        and, or的右操作数的值就是整个表达式的值, if的分支是语句块, 值为数组
+        '''
+        if isinstance(node, CallNode):
+            node.tail = True
+        elif isinstance(node, InlineNode):
+            self.markTail(node.body_node)
+        elif isinstance(node, BinaryOpNode):
+            if node.token.match(T_KEYWORD, 'and') or node.token.match(T_KEYWORD, 'or'):
+                self.markTail(node.rnode)
\ No newline at end of file
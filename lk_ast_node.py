@@ -35,6 +35,17 @@ class ListNode(object):
         self.pos_start = pos_start
         self.pos_end = pos_end
 
+# 语句块
+# 值为每条语句的值组成的数组
+class BlockNode(object):
+
+    def __init__(self, statement_nodes, pos_start, pos_end):
+        self.statement_nodes = statement_nodes
+        self.pos_start = pos_start
+        self.pos_end = pos_end
+        # 值是否被使用, 由ValueAnalyzer设置
+        self.value_needed = True
+
 # 访问变量
 class VarAccessNode(object):
 
@@ -49,17 +60,37 @@ class VarAccessNode(object):
 # 定义变量
 class VarAssignNode(object):
 
-    def __init__(self, name_token, value_node, eq, define=True):
+    def __init__(self, name_token, value_node, define=True):
         self.name_token = name_token
         self.value_node = value_node
         self.pos_start = name_token.pos_start
         self.pos_end = name_token.pos_end
-        self.eq = eq
         self.define = define
+        # 赋值表达式的值是否被使用, 由ValueAnalyzer设置
+        self.value_needed = True
 
     def __repr__(self):
         return f'({self.name_token}, {self.value_node})'
 
+# 复合赋值
+# += -= *= /= **= %=
+class AugAssignNode(object):
+
+    def __init__(self, name_token, op_token, value_node):
+        '''
+        @param op_token 对应的二元运算符, 如+=对应+
+        '''
+        self.name_token = name_token
+        self.op_token = op_token
+        self.value_node = value_node
+        self.pos_start = name_token.pos_start
+        self.pos_end = name_token.pos_end
+        # 赋值表达式的值是否被使用, 由ValueAnalyzer设置
+        self.value_needed = True
+
+    def __repr__(self):
+        return f'({self.name_token}, {self.op_token}=, {self.value_node})'
+
 # 二元操作符节点
 # + - * /
 class BinaryOpNode(object):
@@ -117,6 +148,8 @@ class ForNode(object):
         self.body_node = body_node
         self.pos_start = var_name_token.pos_start
         self.pos_end = body_node.pos_end
+        # 是否收集每次循环的值, 由ValueAnalyzer设置
+        self.value_needed = True
 
     def __repr__(self):
         result = f'(\nfor {self.var_name_token} = {self.start_value_node} to {self.end_value_node} step {self.step_value_node}\n'
@@ -131,6 +164,8 @@ class WhileNode(object):
         self.body_node = body_node
         self.pos_start = condition_node.pos_start
         self.pos_end = body_node.pos_end
+        # 是否收集每次循环的值, 由ValueAnalyzer设置
+        self.value_needed = True
 
     def __repr__(self):
         result = f'(\nwhile {self.condition_node}\n'
@@ -153,6 +188,9 @@ class FuncNode(object):
         else:
             self.pos_start = body_node.pos_start
         self.pos_end = body_node.pos_end
+        # 编译后的函数体, 由Compiler和ClosureCompiler设置, 交互式Shell中再次执行同一定义时不重新编译
+        self.code = None
+        self.body_closure = None
 
 # 调用函数
 class CallNode(object):
@@ -166,6 +204,26 @@ class CallNode(object):
             self.pos_end = arg_nodes[-1].pos_end
         else:
             self.pos_end = func_node.pos_end
+        # 是否为函数中的尾调用, 由ValueAnalyzer设置
+        self.tail = False
+        # 内联缓存, 上次调用的函数, 调用点的参数个数不变, 同一函数不需要再检查类型和参数个数
+        self.cache = None
+
+# 内联的函数调用, 由Optimizer生成
+# 依次计算参数并赋值给临时变量, 值为函数体的值, 与函数返回值相同, None转换为null
+class InlineNode(object):
+
+    def __init__(self, func_node, assign_nodes, body_node, pos_start, pos_end):
+        '''
+        @param func_node 被调用的函数, VarAccessNode, 函数体中发生错误时用于补上调用帧
+        @param assign_nodes 参数赋值, VarAssignNode
+        @param body_node 参数替换为临时变量后的函数体
+        '''
+        self.func_node = func_node
+        self.assign_nodes = assign_nodes
+        self.body_node = body_node
+        self.pos_start = pos_start
+        self.pos_end = pos_end
 
 # return
 class ReturnNode(object):
@@ -186,5 +244,18 @@ class ContinueNode(object):
 class BreakNode(object):
 
     def __init__(self, pos_start, pos_end):
+        self.pos_start = pos_start
+        self.pos_end = pos_end
+
+# 导入模块中的变量
+class ImportNode(object):
+
+    def __init__(self, name_tokens, path_token, pos_start, pos_end):
+        '''
+        @param name_tokens 导入的变量名
+        @param path_token 模块路径, 相对于导入模块的文件
+        '''
+        self.name_tokens = name_tokens
+        self.path_token = path_token
         self.pos_start = pos_start
         self.pos_end = pos_end
\ No newline at end of file
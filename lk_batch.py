@@ -0,0 +1,162 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+from lk_engine import Engine
+
+import multiprocessing
+import os
+import queue
+import sys
+import time
+
+'''
+批量执行
+脚本只编译一次, 输入的每一行是一条记录, 按块分发给进程池中的工作进程
+每条记录作为全局变量record注入, 执行后全局变量output的值是该记录的输出, 没有赋值output时不输出
+fork启动的工作进程继承主进程编译的脚本, 其余方式启动时读取主进程写入的编译缓存
+提交但还没有输出的块数有上限, 输入很大时不会全部读入内存
+'''
+
+# 注入记录的变量名
+RECORD_NAME = 'record'
+# 读取输出的变量名
+OUTPUT_NAME = 'output'
+
+# 每个工作进程最多排队的块数
+PENDING_CHUNKS = 4
+
+# 工作进程中编译后的脚本
+worker_script = None
+
+def initWorker(file_path, options):
+    '''
+    工作进程启动时编译脚本, 已继承主进程编译的脚本时不编译
+    @param options Engine的参数
+    '''
+    global worker_script
+    if worker_script is None:
+        worker_script, _ = Engine(*options).compileFile(file_path, False)
+
+def runChunk(args):
+    '''
+    在工作进程中执行一块记录
+    @param args 块的序号, 第一条记录的序号, 记录
+    @return 块的序号, 输出, 错误信息
+    '''
+    index, first, records = args
+    outputs = []
+    errors = []
+    for i, record in enumerate(records):
+        result, err = worker_script.run({RECORD_NAME: record})
+        if err is not None:
+            errors.append(f'Record {first + i + 1}: {err.getError()}')
+            continue
+        value = result.symbol_table.symbols.get(OUTPUT_NAME)
+        if value is not None:
+            outputs.append(value if type(value) is str else str(value))
+    return index, outputs, errors
+
+def readChunks(f, chunk_size):
+    '''
+    按行读取记录, 去掉行尾的换行符
+    @return 第一条记录的序号, 记录 的迭代器
+    '''
+    chunk = []
+    first = 0
+    for line in f:
+        chunk.append(line[:-1] if line.endswith('\n') else line)
+        if len(chunk) == chunk_size:
+            yield first, chunk
+            first += chunk_size
+            chunk = []
+    if len(chunk) > 0:
+        yield first, chunk
+
+# 批量执行的输出
+class BatchOutput(object):
+
+    def __init__(self, out, ordered):
+        '''
+        @param out 输出文件
+        @param ordered 是否按记录的顺序输出, 为False时按块完成的顺序输出
+        '''
+        self.out = out
+        self.ordered = ordered
+        # 已完成但之前的块还没有完成的块, 序号 -> (输出, 错误信息)
+        self.buffered = {}
+        self.written = 0
+        self.failed = 0
+
+    def add(self, index, outputs, errors):
+        self.buffered[index] = (outputs, errors)
+        if not self.ordered:
+            self.write(index)
+            return
+        while self.written in self.buffered:
+            self.write(self.written)
+
+    def write(self, index):
+        outputs, errors = self.buffered.pop(index)
+        for i in errors:
+            print(i, file=sys.stderr)
+        self.failed += len(errors)
+        if len(outputs) > 0:
+            self.out.write('\n'.join(outputs))
+            self.out.write('\n')
+        self.written += 1
+
+def runBatch(file_path, records_path, engine, jobs=None, chunk_size=1000, ordered=True, output_path=None):
+    '''
+    对输入的每条记录执行脚本, 完成后报告吞吐量
+    @param records_path 输入文件, 为'-'时读取标准输入
+    @param engine 编译和执行脚本的Engine
+    @param jobs 进程数, 为None时与CPU核数相同
+    @param chunk_size 每次发送给工作进程的记录数
+    @param ordered 是否按记录的顺序输出
+    @param output_path 输出文件, 为None时写入标准输出
+    @return 是否所有记录都执行成功
+    '''
+    global worker_script
+    worker_script, err = engine.compileFile(file_path, False)
+    if err is not None:
+        print(err.getError(), file=sys.stderr)
+        return False
+    options = (engine.backend, engine.optimize, engine.max_depth, engine.inline_size, engine.cache)
+    jobs = jobs or os.cpu_count()
+
+    records = sys.stdin if records_path == '-' else open(records_path, 'r', encoding='UTF-8')
+    out = sys.stdout if output_path is None else open(output_path, 'w', encoding='UTF-8')
+    output = BatchOutput(out, ordered)
+    # 工作进程的结果和异常都由回调放入队列, 在主线程中输出
+    results = queue.Queue()
+    submitted = 0
+    count = 0
+    start = time.perf_counter()
+    try:
+        with multiprocessing.Pool(jobs, initWorker, (file_path, options)) as pool:
+
+            def receive():
+                result = results.get()
+                if isinstance(result, BaseException):
+                    raise result
+                output.add(*result)
+
+            for first, chunk in readChunks(records, chunk_size):
+                pool.apply_async(runChunk, ((submitted, first, chunk),), callback=results.put, error_callback=results.put)
+                submitted += 1
+                count += len(chunk)
+                while submitted - output.written >= jobs * PENDING_CHUNKS:
+                    receive()
+            while output.written < submitted:
+                receive()
+    finally:
+        if records is not sys.stdin:
+            records.close()
+        if out is not sys.stdout:
+            out.close()
+        else:
+            out.flush()
+
+    elapsed = time.perf_counter() - start
+    print(f'Processed {count} records in {elapsed:.2f}s, {count / elapsed if elapsed > 0 else 0:.0f} records/s, {output.failed} failed, {jobs} processes', file=sys.stderr)
+    return output.failed == 0
\ No newline at end of file
@@ -1,18 +1,35 @@
 #!/usr/bin/env python3
 # -*- coding: utf-8 -*-
 
-from lk_type import Number, BuiltinFunction
+from lk_type import Number, BuiltinFunction, unbox
 from lk_symbol_table import SymbolTable
 
 global_symbol_table = SymbolTable()
 
-global_symbol_table.set('null', Number.null)
-global_symbol_table.set('true', Number.true)
-global_symbol_table.set('false', Number.false)
-global_symbol_table.set('PI', Number.PI)
-global_symbol_table.set('E', Number.E)
+global_symbol_table.set('null', unbox(Number.null))
+global_symbol_table.set('true', unbox(Number.true))
+global_symbol_table.set('false', unbox(Number.false))
+global_symbol_table.set('PI', unbox(Number.PI))
+global_symbol_table.set('E', unbox(Number.E))
 
 global_symbol_table.set('print', BuiltinFunction.print)
 global_symbol_table.set('input', BuiltinFunction.input)
 global_symbol_table.set('int', BuiltinFunction.int)
-global_symbol_table.set('str', BuiltinFunction.str)
\ No newline at end of file
+global_symbol_table.set('str', BuiltinFunction.str)
+global_symbol_table.set('memo', BuiltinFunction.memo)
+global_symbol_table.set('memo_stats', BuiltinFunction.memo_stats)
+
+# 内建变量, 模块的全局符号表以此初始化, 不包含主程序的全局变量
+BUILTINS = dict(global_symbol_table.symbols)
+
+# 只包含内建变量的符号表, 不被修改, Engine每次执行的全局符号表以此为上层
+builtin_symbol_table = SymbolTable()
+builtin_symbol_table.symbols.update(BUILTINS)
+
+def moduleSymbolTable():
+    '''
+    新建模块的全局符号表
+    '''
+    table = SymbolTable()
+    table.symbols.update(BUILTINS)
+    return table
\ No newline at end of file
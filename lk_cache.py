@@ -0,0 +1,176 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+from lk_token import Token
+
+import lk_ast_node
+import lk_compiler
+
+import gc
+import hashlib
+import io
+import os
+import pickle
+import stat
+import sys
+
+'''
+编译缓存
+脚本分析和编译的结果保存在脚本所在目录的__lkcache__目录中, 再次运行时不需要词法和语法分析
+缓存文件: MAGIC, 键, 内容的SHA-256, 内容
+键由缓存格式版本, Python版本, 编译选项和脚本内容计算, 脚本或选项改变后缓存不再命中
+写入时先写临时文件再替换, 读取时不会读到写了一半的文件, 校验失败和无法反序列化的缓存被忽略
+脚本登记在由路径和键决定的位置, 与缓存中的位置不同时才重新计算
+缓存目录必须可信: 键和校验和只用于判断缓存是否过期, 不能防止篡改
+读取时忽略不属于当前用户或同组, 其他用户可写的缓存文件, 反序列化时只创建AST节点, Token和字节码对象
+'''
+
+# 缓存格式版本, AST节点, Token, 字节码和分析结果的格式改变时加1
+CACHE_VERSION = 5
+
+MAGIC = b'LKC\x00'
+CACHE_DIR = '__lkcache__'
+DIGEST_SIZE = 32
+
+def cachePath(file_path, tag):
+    '''
+    @param tag 编译选项, 不同选项的缓存保存在不同的文件中
+    '''
+    directory, name = os.path.split(file_path)
+    name = os.path.splitext(name)[0]
+    return os.path.join(directory, CACHE_DIR, f'{name}.{tag}.lkc')
+
+def cacheBase(file_path, key):
+    '''
+    缓存的程序在位置空间中的开始位置, 由脚本的路径和键决定
+    在依次分配的位置之后, 不同脚本几乎不会重叠, 读取时不需要重新计算位置
+    '''
+    digest = hashlib.sha256(os.path.abspath(file_path).encode() + key).digest()
+    return (int.from_bytes(digest[:3], 'big') + 1) << 32
+
+def cacheKey(text, tag):
+    key = hashlib.sha256()
+    key.update(f'{CACHE_VERSION} {sys.implementation.cache_tag} {tag}\n'.encode())
+    key.update(text.encode())
+    return key.digest()
+
+# 缓存的程序中可以出现的类, 其余的类和函数在反序列化时拒绝, 缓存文件不能借此执行任意代码
+CACHE_CLASSES = {
+    ('lk_token', 'Token'): Token,
+    ('lk_compiler', 'Code'): lk_compiler.Code
+}
+CACHE_CLASSES.update({('lk_ast_node', name): value for name, value in vars(lk_ast_node).items() if isinstance(value, type) and value.__module__ == 'lk_ast_node'})
+
+# 只创建缓存的程序中的对象的反序列化器
+class ProgramUnpickler(pickle.Unpickler):
+
+    def find_class(self, module, name):
+        cls = CACHE_CLASSES.get((module, name))
+        if cls is None:
+            raise pickle.UnpicklingError(f'{module}.{name} is not allowed in a cache file')
+        return cls
+
+def trusted(f):
+    '''
+    缓存文件属于当前用户, 且同组和其他用户不可写, 没有用户ID的系统上不检查
+    @param f 打开的缓存文件, 检查的是实际读取的文件
+    '''
+    if not hasattr(os, 'getuid'):
+        return True
+    st = os.fstat(f.fileno())
+    return st.st_uid == os.getuid() and not st.st_mode & (stat.S_IWGRP | stat.S_IWOTH)
+
+def load(path, key, base):
+    '''
+    读取缓存的程序
+    @param base 脚本在位置空间中的开始位置, 缓存中的位置按此重新计算
+    @return 程序, 缓存不存在, 已过期或损坏时为None
+    '''
+    try:
+        with open(path, 'rb') as f:
+            if not trusted(f):
+                return None
+            data = f.read()
+    except OSError:
+        return None
+    header = len(MAGIC) + DIGEST_SIZE * 2
+    if len(data) < header or not data.startswith(MAGIC):
+        return None
+    if data[len(MAGIC):len(MAGIC) + DIGEST_SIZE] != key:
+        return None
+    payload = data[header:]
+    if hashlib.sha256(payload).digest() != data[len(MAGIC) + DIGEST_SIZE:header]:
+        return None
+    # 反序列化创建大量对象, 暂停循环垃圾回收
+    enabled = gc.isenabled()
+    gc.disable()
+    try:
+        old_base, program = ProgramUnpickler(io.BytesIO(payload)).load()
+    except Exception:
+        return None
+    finally:
+        if enabled:
+            gc.enable()
+    if old_base != base:
+        rebase(program, base - old_base)
+    return program
+
+def store(path, key, program, base):
+    '''
+    写入缓存, 目录不可写等错误被忽略
+    @param base 程序中的位置所在源代码的开始位置
+    '''
+    enabled = gc.isenabled()
+    gc.disable()
+    try:
+        payload = pickle.dumps((base, program), pickle.HIGHEST_PROTOCOL)
+    except (pickle.PicklingError, RecursionError):
+        return False
+    finally:
+        if enabled:
+            gc.enable()
+    data = MAGIC + key + hashlib.sha256(payload).digest() + payload
+    directory = os.path.dirname(path)
+    try:
+        os.makedirs(directory, exist_ok=True)
+        # 同时编译同一脚本的进程使用不同的临时文件
+        temp_path = f'{path}.{os.getpid()}.tmp'
+        # 同组和其他用户不可写, 否则读取时被忽略
+        fd = os.open(temp_path, os.O_WRONLY | os.O_CREAT | os.O_EXCL, 0o644)
+        try:
+            with os.fdopen(fd, 'wb') as f:
+                f.write(data)
+            os.replace(temp_path, path)
+        except BaseException:
+            os.unlink(temp_path)
+            raise
+    except OSError:
+        return False
+    return True
+
+def rebase(program, offset):
+    '''
+    把程序中所有的位置加上offset
+    位置是AST节点, Token中的pos_start, pos_end, 字节码通过Code.nodes和常量引用AST节点和函数的Code
+    '''
+    seen = set()
+    stack = [program]
+    while len(stack) > 0:
+        obj = stack.pop()
+        if id(obj) in seen:
+            continue
+        if isinstance(obj, (list, tuple)):
+            seen.add(id(obj))
+            stack.extend(obj)
+        elif isinstance(obj, Token):
+            seen.add(id(obj))
+            obj.pos_start += offset
+            obj.pos_end += offset
+        elif hasattr(obj, '__dict__'):
+            seen.add(id(obj))
+            for name, value in vars(obj).items():
+                if name == 'pos_start' or name == 'pos_end':
+                    if type(value) is int:
+                        setattr(obj, name, value + offset)
+                elif isinstance(value, (list, tuple, Token)) or hasattr(value, '__dict__'):
+                    stack.append(value)
\ No newline at end of file
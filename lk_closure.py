@@ -0,0 +1,458 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+from lk_token import *
+from lk_type import List, Function, BuiltinFunction, NUMBER, NULL, binaryOp, inplaceOp, negate, logicNot, share
+from lk_symbol_table import UNBOUND
+from lk_interpreter import Context, binaryError, inlineError, ReturnSignal, BreakSignal, ContinueSignal, BREAK, CONTINUE, TailCall
+from lk_error import RTError, RTException
+import lk_module
+
+import operator
+
+'''
+闭包编译
+将AST一次性转换为嵌套的Python函数, 每个函数直接持有子节点对应的函数
+'''
+
+# 闭包编译后的函数
+class ClosureFunction(Function):
+
+    def __init__(self, name, arg_name, body_node, auto_return, slot_count, body):
+        '''
+        @param body 编译后的函数体, 由所有同一FuncNode创建的函数共享
+        '''
+        super().__init__(name, arg_name, body_node, auto_return, slot_count)
+        self.body = body
+
+    def invoke(self, args, _, node=None):
+        pos_start, _ = self.callPos(node)
+        return self.run(args, pos_start)
+
+    def run(self, args, pos_start):
+        '''
+        调用参数个数已检查的函数
+        @param pos_start 调用位置
+        '''
+        memo = self.memo
+        key = memo.key(args) if memo is not None else None
+        if key is not None:
+            value = memo.get(key)
+            if value is not None:
+                return value
+
+        func = self
+        # 尾调用返回TailCall, 在此循环中执行, 不增加递归深度, 参数个数已在调用点检查
+        while True:
+            # 参数占用前面的槽位
+            new_ctx = Context(func.name, func.context, pos_start, args + [UNBOUND] * (func.slot_count - len(args)))
+
+            try:
+                value = func.body(new_ctx)
+            except ReturnSignal as e:
+                # 循环外的break和continue不在此捕获, 结束调用者所在的循环
+                value = e.value
+            else:
+                if not func.auto_return:
+                    value = None
+            if type(value) is not TailCall:
+                break
+            func, args = value.func, value.args
+            pos_start = value.node.pos_start
+
+        if value is None:
+            value = NULL
+        if key is not None:
+            memo.put(key, value)
+        return value
+
+    def copy(self):
+        return ClosureFunction(self.name, self.arg_name, self.body_node, self.auto_return, self.slot_count, self.body).setContext(self.context).setPos(self.pos_start, self.pos_end).setMemo(self.memo)
+
+# 闭包编译器
+class ClosureCompiler(object):
+
+    # 二元运算: Value方法, 两个数字之间的快速运算
+    BINARY_OPS = {
+        T_PLUS: ('addBy', operator.add),
+        T_MINUS: ('subBy', operator.sub),
+        T_MUL: ('mulBy', operator.mul),
+        T_DIV: ('divBy', operator.truediv),
+        T_POW: ('powBy', operator.pow),
+        T_MOD: ('modBy', operator.mod),
+        T_EE: ('compEE', operator.eq),
+        T_NE: ('compNE', operator.ne),
+        T_LT: ('compLT', operator.lt),
+        T_GT: ('compGT', operator.gt),
+        T_LTE: ('compLTE', operator.le),
+        T_GTE: ('compGTE', operator.ge)
+    }
+
+    def run(self, node, context):
+        '''
+        编译并执行顶层程序
+        @param node parse()得到的根节点
+        @param context 上下文
+        @return 运行结果, 错误
+        '''
+        return self.execute(self.compile(node), context)
+
+    def execute(self, program, context):
+        '''
+        执行编译后的顶层程序, 同一程序可以多次执行
+        @param program compile得到的函数
+        @param context 上下文
+        @return 运行结果, 错误
+        '''
+        try:
+            return program(context), None
+        except RTException as e:
+            return None, e.error
+        except (ReturnSignal, BreakSignal, ContinueSignal):
+            # 顶层的return, break, continue结束程序
+            return None, None
+
+    def compile(self, node):
+        '''
+        将AST节点编译为函数, 函数接收上下文, 返回节点的值
+        '''
+        method_name = f'compile_{type(node).__name__}'
+        method = getattr(self, method_name, self.noCompileMethod)
+        return method(node)
+
+    def noCompileMethod(self, node):
+        raise Exception(f'No compile_{type(node).__name__}')
+
+    def compile_NumberNode(self, node):
+        value = node.token.value
+        return lambda ctx: value
+
+    def compile_StringNode(self, node):
+        value = node.token.value
+        return lambda ctx: value
+
+    def compile_BlockNode(self, node):
+        statements = [self.compile(i) for i in node.statement_nodes]
+
+        if not node.value_needed:
+            def block(ctx):
+                for i in statements:
+                    i(ctx)
+                return None
+            return block
+
+        def block_value(ctx):
+            return List([i(ctx) for i in statements])
+        return block_value
+
+    def compile_ListNode(self, node):
+        elements = [self.compile(i) for i in node.element_nodes]
+
+        def list_(ctx):
+            return List([i(ctx) for i in elements])
+        return list_
+
+    def compileLoad(self, node, update=False):
+        '''
+        按作用域解析结果读取变量
+        @param node VarAccessNode或AugAssignNode
+        @param update 是否为复合赋值的读取, 为False时标记读到的数组被多处引用
+        '''
+        var_name = node.name_token.value
+        depth, slot, outer = node.scope
+
+        def undefined(ctx):
+            return RTException(RTError(node.pos_start, node.pos_end, f'{var_name} is undefined', ctx))
+
+        if slot is not None and depth == 0:
+            def load_fast(ctx):
+                value = ctx.slots[slot]
+                if value is UNBOUND:
+                    value = share(ctx.lookup(var_name, outer))
+                if value is None:
+                    raise undefined(ctx)
+                if type(value) is List and not update:
+                    value.shared = True
+                return value
+            return load_fast
+
+        scope = node.scope
+
+        def load(ctx):
+            value = ctx.lookup(var_name, scope)
+            if value is None:
+                raise undefined(ctx)
+            if type(value) is List and not update:
+                value.shared = True
+            return value
+        return load
+
+    def compileStore(self, name, slot, value_func):
+        '''
+        计算value_func并写入当前作用域
+        '''
+        if slot is None:
+            def store_name(ctx):
+                value = value_func(ctx)
+                ctx.symbol_table.symbols[name] = value
+                return value
+            return store_name
+
+        def store_fast(ctx):
+            value = value_func(ctx)
+            ctx.slots[slot] = value
+            return value
+        return store_fast
+
+    def compile_VarAccessNode(self, node):
+        return self.compileLoad(node)
+
+    def compile_VarAssignNode(self, node):
+        var_name = node.name_token.value
+        store = self.compileStore(var_name, node.slot, self.compile(node.value_node))
+        if node.value_needed:
+            store = self.shareResult(store)
+        if node.define:
+            return store
+
+        scope = node.scope
+
+        def assign(ctx):
+            if ctx.lookup(var_name, scope) is None:
+                raise RTException(RTError(node.pos_start, node.pos_end, f'{var_name} is undefined', ctx))
+            return store(ctx)
+        return assign
+
+    def compile_AugAssignNode(self, node):
+        method_name, fast = self.BINARY_OPS[node.op_token.type]
+        binary = self.makeBinary(node, self.compileLoad(node, True), self.compile(node.value_node), method_name, fast, inplaceOp)
+        store = self.compileStore(node.name_token.value, node.slot, binary)
+        if node.value_needed:
+            return self.shareResult(store)
+        return store
+
+    def shareResult(self, store):
+        '''
+        赋值表达式的值被使用时, 变量中的数组被多处引用
+        '''
+        return lambda ctx: share(store(ctx))
+
+    def compile_BinaryOpNode(self, node):
+        left = self.compile(node.lnode)
+        right = self.compile(node.rnode)
+
+        # 短路求值, 左操作数决定结果时不计算右操作数
+        if node.token.match(T_KEYWORD, 'and'):
+            return lambda ctx: left(ctx) and right(ctx)
+        elif node.token.match(T_KEYWORD, 'or'):
+            return lambda ctx: left(ctx) or right(ctx)
+        elif node.token.type in self.BINARY_OPS:
+            method_name, fast = self.BINARY_OPS[node.token.type]
+            return self.makeBinary(node, left, right, method_name, fast)
+
+        def unsupported(ctx):
+            raise RTException(RTError(node.pos_start, node.pos_end, f'{node.token.type} is not supported', ctx))
+        return unsupported
+
+    def makeBinary(self, node, left_func, right_func, method_name, fast, operate=binaryOp):
+        '''
+        @param fast 两个数字之间的运算
+        @param operate 其他值之间的运算, 复合赋值使用inplaceOp
+        '''
+        def slow(ctx, left, right):
+            result, err = operate(method_name, left, right)
+            if err is not None:
+                raise RTException(binaryError(node, method_name, left, right, ctx))
+            return result
+
+        def binary(ctx):
+            left = left_func(ctx)
+            right = right_func(ctx)
+            if type(left) in NUMBER and type(right) in NUMBER:
+                try:
+                    return fast(left, right)
+                except ZeroDivisionError:
+                    pass
+            return slow(ctx, left, right)
+        return binary
+
+    def compile_UnaryOpNode(self, node):
+        operand = self.compile(node.node)
+
+        if node.token.type == T_MINUS:
+            return lambda ctx: negate(operand(ctx))
+        elif node.token.match(T_KEYWORD, 'not'):
+            return lambda ctx: logicNot(operand(ctx))
+        return operand
+
+    def compile_IfNode(self, node):
+        case = [(self.compile(condition), self.compile(expr)) for condition, expr in node.case]
+        else_case = self.compile(node.else_case) if node.else_case is not None else None
+
+        def if_(ctx):
+            for condition, expr in case:
+                if condition(ctx):
+                    return expr(ctx)
+            if else_case is not None:
+                return else_case(ctx)
+            return None
+        return if_
+
+    def compile_ForNode(self, node):
+        var_name = node.var_name_token.value
+        start_func = self.compile(node.start_value_node)
+        end_func = self.compile(node.end_value_node)
+        step_func = self.compile(node.step_value_node) if node.step_value_node is not None else None
+        body = self.compile(node.body_node)
+
+        slot = node.slot
+        value_needed = node.value_needed
+
+        def for_(ctx):
+            elements = []
+            start_value = start_func(ctx)
+            end_value = end_func(ctx)
+            step_value = step_func(ctx) if step_func is not None else 1
+            # 循环变量写入槽位或全局符号表
+            if slot is None:
+                target, key = ctx.symbol_table.symbols, var_name
+            else:
+                target, key = ctx.slots, slot
+
+            i = start_value
+            ascending = step_value >= 0
+            while (i <= end_value) if ascending else (i >= end_value):
+                target[key] = i
+                i += step_value
+                try:
+                    value = body(ctx)
+                except ContinueSignal:
+                    continue
+                except BreakSignal:
+                    break
+                if value_needed:
+                    elements.append(value)
+            return List(elements) if value_needed else None
+        return for_
+
+    def compile_WhileNode(self, node):
+        condition = self.compile(node.condition_node)
+        body = self.compile(node.body_node)
+        value_needed = node.value_needed
+
+        def while_(ctx):
+            elements = []
+            while condition(ctx):
+                try:
+                    value = body(ctx)
+                except ContinueSignal:
+                    continue
+                except BreakSignal:
+                    break
+                if value_needed:
+                    elements.append(value)
+            return List(elements) if value_needed else None
+        return while_
+
+    def compile_FuncNode(self, node):
+        func_name = node.name_token.value if node.name_token is not None else None
+        arg_name = [arg.value for arg in node.arg_name_tokens]
+        # 函数体只编译一次
+        if node.body_closure is None:
+            node.body_closure = self.compile(node.body_node)
+        body = node.body_closure
+
+        def func(ctx):
+            return ClosureFunction(func_name, arg_name, node.body_node, node.auto_return, node.slot_count, body).setContext(ctx).setPos(node.pos_start, node.pos_end)
+
+        if func_name is not None:
+            return self.compileStore(func_name, node.slot, func)
+        return func
+
+    def compile_CallNode(self, node):
+        callee = self.compile(node.func_node)
+        args_func = [self.compile(arg) for arg in node.arg_nodes]
+        pos_start = node.pos_start
+
+        def check(func, ctx):
+            '''
+            检查被调用的函数和参数个数, 计算参数
+            '''
+            self.checkCallee(func, node, ctx)
+            args = [i(ctx) for i in args_func]
+            func.checkArgs(args, node.pos_start, node.pos_end)
+            node.cache = func
+            return args
+
+        if node.tail:
+            def tail_call(ctx):
+                func = callee(ctx)
+                # 与上次调用的函数相同时, 类型和参数个数已检查过
+                args = [i(ctx) for i in args_func] if func is node.cache else check(func, ctx)
+                # 记忆化的函数需要在返回时缓存结果, 不作为尾调用
+                if type(func) is ClosureFunction and func.memo is None:
+                    return TailCall(func, args, node)
+                elif type(func) is ClosureFunction:
+                    return func.run(args, pos_start)
+                return func.invoke(args, self, node)
+            return tail_call
+
+        def call(ctx):
+            func = callee(ctx)
+            args = [i(ctx) for i in args_func] if func is node.cache else check(func, ctx)
+            if type(func) is ClosureFunction:
+                return func.run(args, pos_start)
+            return func.invoke(args, self, node)
+        return call
+
+    def checkCallee(self, func, node, context):
+        '''
+        闭包编译器只能调用闭包编译后的函数和内建函数
+        '''
+        if isinstance(func, ClosureFunction) or isinstance(func, BuiltinFunction):
+            return
+        elif isinstance(func, Function):
+            raise Exception(f'{func} cannot be called by the closure compiler')
+        raise RTException(RTError(node.pos_start, node.pos_end, 'Illegal Operation', context))
+
+    def compile_InlineNode(self, node):
+        assigns = [self.compile(i) for i in node.assign_nodes]
+        body = self.compile(node.body_node)
+
+        def inline(ctx):
+            for i in assigns:
+                i(ctx)
+            try:
+                value = body(ctx)
+            except RTException as e:
+                inlineError(e.error, node, ctx)
+                raise
+            if value is None:
+                return NULL
+            return value
+        return inline
+
+    def compile_ReturnNode(self, node):
+        value_func = self.compile(node.node) if node.node is not None else None
+
+        def return_(ctx):
+            raise ReturnSignal(value_func(ctx) if value_func is not None else NULL)
+        return return_
+
+    def compile_ContinueNode(self, node):
+        def continue_(ctx):
+            raise CONTINUE
+        return continue_
+
+    def compile_BreakNode(self, node):
+        def break_(ctx):
+            raise BREAK
+        return break_
+
+    def compile_ImportNode(self, node):
+        bind = lk_module.bind
+
+        def import_(ctx):
+            bind(node, ctx)
+            return NULL
+        return import_
\ No newline at end of file
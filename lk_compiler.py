@@ -0,0 +1,444 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+from lk_token import *
+from lk_opcode import *
+from lk_type import NULL
+
+'''
+字节码编译器
+'''
+
+# 字节码对象
+class Code(object):
+
+    def __init__(self, name, arg_name=None, auto_return=False, is_program=False, slot_count=0, level=0):
+        '''
+        @param name 名称
+        @param arg_name 参数名
+        @param auto_return 是否返回函数体的值
+        @param is_program 是否为顶层程序
+        @param slot_count 调用帧的槽位数
+        @param level 函数嵌套层数, 即调用帧到顶层上下文的层数
+        '''
+        self.name = name
+        self.arg_name = arg_name or []
+        self.auto_return = auto_return
+        self.is_program = is_program
+        self.slot_count = slot_count
+        self.level = level
+        # 指令, 每条指令占操作码和参数两个槽位
+        self.code = []
+        # 常量池
+        self.consts = []
+        # 变量名
+        self.names = []
+        # 每条指令对应的AST节点, 用于生成错误信息
+        self.nodes = []
+        # 循环中的调用指令之后的位置 -> 循环结束的位置和栈深度, 下一次迭代的位置和栈深度
+        self.loop_calls = {}
+        # 内联的函数体的指令范围 (开始, 结束, InlineNode), 嵌套时里层在前, 用于在错误中补上调用帧
+        self.inline_ranges = []
+
+    def disassemble(self):
+        res = ''
+        for pc in range(0, len(self.code), 2):
+            op, arg = self.code[pc], self.code[pc + 1]
+            res += f'{pc:>6} {OPNAMES[op]:<20} {arg}\n'
+        return res
+
+    def __repr__(self):
+        return f'<code {self.name}>'
+
+# 循环信息, 用于编译break和continue
+class LoopInfo(object):
+
+    def __init__(self, depth, continue_target, break_depth):
+        '''
+        @param depth 循环体开始时的栈深度
+        @param continue_target continue跳转位置
+        @param break_depth break跳转时的栈深度
+        '''
+        self.depth = depth
+        self.continue_target = continue_target
+        self.break_depth = break_depth
+        self.break_patches = []
+        # 循环体中的调用指令之后的位置, 被调用的函数中循环外的break和continue跳转到本循环
+        self.call_returns = []
+
+# 编译器
+class Compiler(object):
+
+    BINARY_OPS = {
+        T_PLUS: ADD,
+        T_MINUS: SUB,
+        T_MUL: MUL,
+        T_DIV: DIV,
+        T_POW: POW,
+        T_MOD: MOD,
+        T_EE: EE,
+        T_NE: NE,
+        T_LT: LT,
+        T_GT: GT,
+        T_LTE: LTE,
+        T_GTE: GTE
+    }
+
+    def __init__(self, code):
+        self.code = code
+        self.depth = 0
+        self.loops = []
+        self.name_index = {}
+
+    @classmethod
+    def compileProgram(cls, node):
+        '''
+        编译整个程序
+        @param node parse()得到的根节点
+        '''
+        compiler = cls(Code('<program>', is_program=True))
+        compiler.compile(node)
+        compiler.emit(RETURN_VALUE)
+        compiler.optimize()
+        return compiler.code
+
+    @classmethod
+    def compileFunction(cls, node, level):
+        '''
+        编译函数体
+        @param node FuncNode
+        @param level 函数嵌套层数
+        '''
+        name = node.name_token.value if node.name_token is not None else '<anonymous>'
+        arg_name = [arg.value for arg in node.arg_name_tokens]
+        compiler = cls(Code(name, arg_name, node.auto_return, slot_count=node.slot_count, level=level))
+        compiler.compile(node.body_node)
+        if not node.auto_return:
+            compiler.emit(POP)
+            compiler.emit(LOAD_NONE)
+        compiler.emit(RETURN_VALUE)
+        compiler.optimize()
+        return compiler.code
+
+    def emit(self, op, arg=0, node=None):
+        '''
+        生成一条指令, 返回参数槽位的下标
+        '''
+        self.code.code.append(op)
+        self.code.code.append(arg)
+        self.code.nodes.append(node)
+        self.code.nodes.append(None)
+        self.depth += self.stackEffect(op, arg)
+        return len(self.code.code) - 1
+
+    def stackEffect(self, op, arg):
+        if op in (LOAD_CONST, LOAD_NONE, LOAD_NAME, LOAD_FAST, LOAD_DEREF, MAKE_FUNCTION, FOR_ITER, LOAD_FAST_UPDATE, LOAD_NAME_UPDATE, IMPORT_NAMES):
+            return 1
+        elif op in (POP, LIST_APPEND, POP_JUMP_IF_FALSE, RETURN_VALUE, INPLACE_OP, JUMP_IF_FALSE_OR_POP, JUMP_IF_TRUE_OR_POP) or op in BINARY_METHODS:
+            return -1
+        elif op == BUILD_LIST:
+            return 1 - arg
+        elif op == FOR_PREP:
+            return -2
+        elif op == CALL or op == TAIL_CALL:
+            return -arg
+        return 0
+
+    def label(self):
+        return len(self.code.code)
+
+    def patch(self, index, target=None):
+        '''
+        回填跳转位置
+        '''
+        self.code.code[index] = self.label() if target is None else target
+
+    def addConst(self, value):
+        self.code.consts.append(value)
+        return len(self.code.consts) - 1
+
+    def addName(self, name):
+        if name not in self.name_index:
+            self.code.names.append(name)
+            self.name_index[name] = len(self.code.names) - 1
+        return self.name_index[name]
+
+    def compile(self, node):
+        method_name = f'compile_{type(node).__name__}'
+        method = getattr(self, method_name, self.noCompileMethod)
+        method(node)
+
+    def noCompileMethod(self, node):
+        raise Exception(f'No compile_{type(node).__name__}')
+
+    def compile_NumberNode(self, node):
+        self.emit(LOAD_CONST, self.addConst(node.token.value), node)
+
+    def compile_StringNode(self, node):
+        self.emit(LOAD_CONST, self.addConst(node.token.value), node)
+
+    def compile_BlockNode(self, node):
+        if not node.value_needed:
+            for i in node.statement_nodes:
+                self.compile(i)
+                self.emit(POP)
+            self.emit(LOAD_NONE)
+            return
+        for i in node.statement_nodes:
+            self.compile(i)
+        self.emit(BUILD_LIST, len(node.statement_nodes), node)
+
+    def compile_ListNode(self, node):
+        for i in node.element_nodes:
+            self.compile(i)
+        self.emit(BUILD_LIST, len(node.element_nodes), node)
+
+    def emitLoad(self, name, scope, node, update=False):
+        '''
+        按作用域解析结果读取变量
+        @param update 是否为复合赋值的读取, 读取的数组之后可能被就地修改
+        '''
+        depth, slot, _ = scope
+        if slot is None:
+            self.emit(LOAD_NAME_UPDATE if update else LOAD_NAME, self.addName(name), node)
+        elif depth == 0:
+            self.emit(LOAD_FAST_UPDATE if update else LOAD_FAST, slot, node)
+        else:
+            self.emit(LOAD_DEREF, self.addName(name), node)
+
+    def emitStore(self, name, slot, node):
+        if slot is None:
+            self.emit(STORE_NAME, self.addName(name), node)
+        else:
+            self.emit(STORE_FAST, slot, node)
+
+    def compile_VarAccessNode(self, node):
+        self.emitLoad(node.name_token.value, node.scope, node)
+
+    def compile_VarAssignNode(self, node):
+        name = node.name_token.value
+        if not node.define:
+            self.emit(CHECK_NAME, self.addName(name), node)
+        self.compile(node.value_node)
+        self.emitStore(name, node.slot, node)
+        if node.value_needed:
+            self.emit(SHARE)
+
+    def compile_AugAssignNode(self, node):
+        name = node.name_token.value
+        self.emitLoad(name, node.scope, node, True)
+        self.compile(node.value_node)
+        self.emit(INPLACE_OP, self.BINARY_OPS[node.op_token.type], node)
+        self.emitStore(name, node.slot, node)
+        if node.value_needed:
+            self.emit(SHARE)
+
+    def compile_BinaryOpNode(self, node):
+        if node.token.match(T_KEYWORD, 'and'):
+            self.compileLogic(node, JUMP_IF_FALSE_OR_POP)
+            return
+        elif node.token.match(T_KEYWORD, 'or'):
+            self.compileLogic(node, JUMP_IF_TRUE_OR_POP)
+            return
+
+        self.compile(node.lnode)
+        self.compile(node.rnode)
+        op = self.BINARY_OPS.get(node.token.type)
+        if op is None:
+            raise Exception(f'{node.token.type} is not supported')
+        self.emit(op, 0, node)
+
+    def compileLogic(self, node, op):
+        '''
+        and, or短路求值, 左操作数决定结果时跳过右操作数, 结果为最后计算的操作数
+        '''
+        self.compile(node.lnode)
+        end_patch = self.emit(op, 0, node)
+        self.compile(node.rnode)
+        self.patch(end_patch)
+
+    def compile_UnaryOpNode(self, node):
+        self.compile(node.node)
+        if node.token.type == T_MINUS:
+            self.emit(NEG, 0, node)
+        elif node.token.match(T_KEYWORD, 'not'):
+            self.emit(NOT, 0, node)
+
+    def compile_IfNode(self, node):
+        end_patches = []
+        depth = self.depth
+
+        for condition, expr in node.case:
+            self.compile(condition)
+            next_patch = self.emit(POP_JUMP_IF_FALSE, 0, condition)
+            self.compile(expr)
+            end_patches.append(self.emit(JUMP))
+            self.patch(next_patch)
+            self.depth = depth
+
+        if node.else_case is not None:
+            self.compile(node.else_case)
+        else:
+            self.emit(LOAD_NONE)
+
+        for i in end_patches:
+            self.patch(i)
+
+    def compile_ForNode(self, node):
+        if node.value_needed:
+            self.emit(BUILD_LIST, 0)
+        self.compile(node.start_value_node)
+        self.compile(node.end_value_node)
+        if node.step_value_node is not None:
+            self.compile(node.step_value_node)
+        else:
+            self.emit(LOAD_CONST, self.addConst(1))
+        self.emit(FOR_PREP, 0, node)
+
+        loop_start = self.label()
+        exit_patch = self.emit(FOR_ITER, 0, node)
+        self.emitStore(node.var_name_token.value, node.slot, node)
+        self.emit(POP)
+        loop = LoopInfo(self.depth, loop_start, self.depth - 1)
+        self.loops.append(loop)
+
+        self.compile(node.body_node)
+        if node.value_needed:
+            self.emit(LIST_APPEND, 2)
+        else:
+            self.emit(POP)
+        self.emit(JUMP, loop_start)
+
+        self.loops.pop()
+        # FOR_ITER结束时弹出循环状态
+        self.depth = loop.break_depth
+        self.patch(exit_patch)
+        self.patchLoopExit(loop)
+        if not node.value_needed:
+            self.emit(LOAD_NONE)
+
+    def compile_WhileNode(self, node):
+        if node.value_needed:
+            self.emit(BUILD_LIST, 0)
+
+        loop_start = self.label()
+        self.compile(node.condition_node)
+        exit_patch = self.emit(POP_JUMP_IF_FALSE, 0, node.condition_node)
+        loop = LoopInfo(self.depth, loop_start, self.depth)
+        self.loops.append(loop)
+
+        self.compile(node.body_node)
+        if node.value_needed:
+            self.emit(LIST_APPEND, 1)
+        else:
+            self.emit(POP)
+        self.emit(JUMP, loop_start)
+
+        self.loops.pop()
+        self.patch(exit_patch)
+        self.patchLoopExit(loop)
+        if not node.value_needed:
+            self.emit(LOAD_NONE)
+
+    def compile_FuncNode(self, node):
+        if node.code is None:
+            node.code = Compiler.compileFunction(node, self.code.level + 1)
+        self.emit(MAKE_FUNCTION, self.addConst(node.code), node)
+        if node.name_token is not None:
+            self.emitStore(node.name_token.value, node.slot, node)
+
+    def compile_CallNode(self, node):
+        self.compile(node.func_node)
+        for arg in node.arg_nodes:
+            self.compile(arg)
+        self.emit(TAIL_CALL if node.tail else CALL, len(node.arg_nodes), node)
+        if not node.tail and len(self.loops) > 0:
+            self.loops[-1].call_returns.append(self.label())
+
+    def compile_InlineNode(self, node):
+        for i in node.assign_nodes:
+            self.compile(i)
+            self.emit(POP)
+        start = self.label()
+        self.compile(node.body_node)
+        self.code.inline_ranges.append((start, self.label(), node))
+        self.emit(NONE_TO_NULL)
+
+    def compile_ReturnNode(self, node):
+        depth = self.depth
+        if node.node is not None:
+            self.compile(node.node)
+        else:
+            self.emit(LOAD_CONST, self.addConst(NULL))
+        if self.code.is_program:
+            # 顶层的return结束程序, 结果为None
+            self.emit(POP)
+            self.emit(LOAD_NONE)
+        self.emit(RETURN_VALUE)
+        # 之后的代码不可达, 按语句产生一个值计算栈深度
+        self.depth = depth + 1
+
+    def compile_ContinueNode(self, node):
+        self.compileLoopJump(False)
+
+    def compile_BreakNode(self, node):
+        self.compileLoopJump(True)
+
+    def compile_ImportNode(self, node):
+        self.emit(IMPORT_NAMES, 0, node)
+
+    def patchLoopExit(self, loop):
+        '''
+        回填break跳转到循环结束的位置, 登记循环中的调用点
+        '''
+        for i in loop.break_patches:
+            self.patch(i)
+        for i in loop.call_returns:
+            self.code.loop_calls[i] = (self.label(), loop.break_depth, loop.continue_target, loop.depth)
+
+    def compileLoopJump(self, is_break):
+        depth = self.depth
+        if len(self.loops) == 0:
+            if self.code.is_program:
+                # 顶层循环外的break和continue结束程序, 结果为None
+                self.emit(LOAD_NONE)
+                self.emit(RETURN_VALUE)
+            else:
+                # 函数中循环外的break和continue结束调用者所在的循环
+                self.emit(UNWIND_LOOP, int(is_break))
+        else:
+            loop = self.loops[-1]
+            target_depth = loop.break_depth if is_break else loop.depth
+            while self.depth > target_depth:
+                self.emit(POP)
+            if is_break:
+                loop.break_patches.append(self.emit(JUMP))
+            else:
+                self.emit(JUMP, loop.continue_target)
+        self.depth = depth + 1
+
+    def optimize(self):
+        '''
+        窥孔优化, 合并相邻指令为超级指令
+        '''
+        code = self.code.code
+        targets = set()
+        for pc in range(0, len(code), 2):
+            if code[pc] in JUMPS:
+                targets.add(code[pc + 1])
+
+        superinstructions = {
+            (LOAD_NAME, LOAD_NAME): LOAD_NAME_NAME,
+            (LOAD_NAME, LOAD_CONST): LOAD_NAME_CONST,
+            (LOAD_FAST, LOAD_FAST): LOAD_FAST_FAST,
+            (LOAD_FAST, LOAD_CONST): LOAD_FAST_CONST
+        }
+
+        pc = 0
+        while pc + 2 < len(code):
+            op = superinstructions.get((code[pc], code[pc + 2]))
+            if op is not None and pc + 2 not in targets:
+                code[pc] = op
+                pc += 4
+                continue
+            pc += 2
\ No newline at end of file
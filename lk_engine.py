@@ -0,0 +1,326 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+from lk_lexer import Lexer
+from lk_parser import Parser
+from lk_optimizer import Optimizer, INLINE_SIZE, TEMP_MARK
+from lk_resolver import Resolver
+from lk_analyzer import ValueAnalyzer
+from lk_interpreter import Interpreter, Context
+from lk_compiler import Compiler
+from lk_vm import VM, MAX_DEPTH
+from lk_closure import ClosureCompiler
+from lk_builtin import global_symbol_table, builtin_symbol_table
+from lk_symbol_table import SymbolTable
+from lk_type import Value, List, BuiltinFunction, NUMBER, NULL, share
+from lk_ast_node import CallNode
+from lk_position import sources
+from lk_module import ModuleLoader
+
+import lk_cache
+
+'''
+执行引擎
+分析, 编译和执行脚本的流程, 供命令行和嵌入使用
+Engine编译一次得到CompiledScript, 之后可以多次执行
+每次执行有自己的全局符号表, 上层为只读的内建变量, 写入的变量只在本次执行中可见
+每个Engine有自己的模块加载器, 同一Engine的执行共用已加载的模块, 不同Engine之间互不影响
+注入的变量和读取的结果在Python值和LakiScript的值之间转换
+'''
+
+# 执行后端
+BACKENDS = ('interpreter', 'vm', 'closure')
+
+def compileSource(source, debug=False, backend='interpreter', need_result=True, optimize=False, inline_size=INLINE_SIZE):
+    '''
+    分析和编译源代码
+    @param source 位置空间中登记的源代码
+    @param need_result 是否需要运行结果, 为False时不收集顶层语句的值, 结果为None
+    @param optimize 是否进行常量折叠, 死代码消除和函数内联
+    @param inline_size 内联函数体的最大节点数
+    @return vm后端为Code, 其余后端为分析后的AST根节点; 错误
+    '''
+    lexer = Lexer(source.file, source.text, source)
+    if debug:
+        tokens, err = lexer.makeTokens()
+        if err is not None:
+            return None, err
+        print(tokens)
+    else:
+        # 语法分析时按需读取Token, 不保存所有Token
+        tokens = lexer.generateTokens()
+
+    parser = Parser(tokens)
+    ast = parser.parse()
+    if ast.error is not None:
+        return None, ast.error
+    if optimize:
+        ast.node = Optimizer(inline_size).optimizeProgram(ast.node)
+    Resolver().resolve(ast.node)
+    ValueAnalyzer().analyze(ast.node, need_result)
+    # if debug:
+    #     print(ast.node)
+
+    if backend == 'vm':
+        code = Compiler.compileProgram(ast.node)
+        if debug:
+            print(code.disassemble())
+        return code, None
+    return ast.node, None
+
+def execute(program, backend='interpreter', max_depth=MAX_DEPTH, context=None):
+    '''
+    @param program compileSource得到的程序
+    @param max_depth vm后端的最大调用深度
+    @param context 顶层上下文, 为None时在主程序的全局符号表中执行, 不能导入模块
+    '''
+    if context is None:
+        context = Context('<program>')
+        context.symbol_table = global_symbol_table
+
+    if backend == 'vm':
+        return VM(max_depth).run(program, context)
+    elif backend == 'closure':
+        return ClosureCompiler().run(program, context)
+
+    return Interpreter().run(program, context)
+
+def cacheTag(backend, need_result, optimize, inline_size):
+    '''
+    编译缓存的选项, interpreter和closure后端执行相同的AST
+    '''
+    tag = 'vm' if backend == 'vm' else 'ast'
+    if optimize:
+        tag += f'-O{inline_size}'
+    if need_result:
+        tag += '-result'
+    return tag
+
+def reserveSource(file_path, text, key):
+    '''
+    在缓存的程序使用的位置登记脚本, 已被占用时依次分配
+    '''
+    source = sources.reserve(file_path, text, lk_cache.cacheBase(file_path, key))
+    if source is None:
+        source = sources.add(file_path, text)
+    return source
+
+def loadProgram(file_path, text, backend='interpreter', need_result=True, optimize=False, inline_size=INLINE_SIZE):
+    '''
+    读取编译缓存, 没有命中时分析和编译脚本并写入缓存
+    @return 程序, 错误
+    '''
+    tag = cacheTag(backend, need_result, optimize, inline_size)
+    path = lk_cache.cachePath(file_path, tag)
+    key = lk_cache.cacheKey(text, tag)
+    source = reserveSource(file_path, text, key)
+    program = lk_cache.load(path, key, source.base)
+    if program is not None:
+        return program, None
+
+    program, err = compileSource(source, False, backend, need_result, optimize, inline_size)
+    if err is None:
+        lk_cache.store(path, key, program, source.base)
+    return program, err
+
+def findCalls(program):
+    '''
+    程序中的所有调用点, vm后端的字节码通过Code.nodes和常量引用AST节点
+    '''
+    calls = []
+    seen = set()
+    stack = [program]
+    while len(stack) > 0:
+        obj = stack.pop()
+        if id(obj) in seen:
+            continue
+        seen.add(id(obj))
+        if type(obj) is CallNode:
+            calls.append(obj)
+        if isinstance(obj, (list, tuple)):
+            stack.extend(obj)
+        elif hasattr(obj, '__dict__'):
+            for name, value in vars(obj).items():
+                # 内联缓存引用执行中创建的函数, 不是程序的一部分
+                if name != 'cache' and (isinstance(value, (list, tuple)) or hasattr(value, '__dict__')):
+                    stack.append(value)
+    return calls
+
+def toValue(obj):
+    '''
+    Python值转换为LakiScript的值, None转换为null, 列表和元组转换为数组
+    '''
+    if obj is None:
+        return NULL
+    elif type(obj) in NUMBER or type(obj) is str:
+        return obj
+    elif isinstance(obj, (list, tuple)):
+        return List([toValue(i) for i in obj])
+    elif isinstance(obj, Value):
+        # 可能同时被其他执行引用, 复合赋值时先复制
+        return share(obj)
+    raise TypeError(f'Cannot convert {type(obj).__name__} to a LakiScript value')
+
+def toPython(value):
+    '''
+    LakiScript的值转换为Python值, 数组转换为列表, 函数不转换
+    '''
+    if type(value) is List:
+        return [toPython(i) for i in value.elements]
+    return value
+
+# 一次执行的结果
+class ScriptResult(object):
+
+    def __init__(self, value, symbol_table):
+        '''
+        @param value 顶层语句的值组成的数组, 不需要运行结果或顶层return时为None
+        @param symbol_table 本次执行的全局符号表
+        '''
+        self.value = value
+        self.symbol_table = symbol_table
+
+    def results(self):
+        '''
+        顶层语句的值
+        '''
+        if self.value is None:
+            return []
+        return toPython(self.value)
+
+    def get(self, name):
+        '''
+        本次执行中定义或注入的全局变量, 不存在时为None
+        '''
+        if TEMP_MARK in name:
+            return None
+        value = self.symbol_table.symbols.get(name)
+        if value is None:
+            return None
+        return toPython(value)
+
+    def globals(self):
+        '''
+        本次执行中定义或注入的全部全局变量, 不包括内联时参数的临时变量
+        '''
+        return {name: toPython(value) for name, value in self.symbol_table.symbols.items() if TEMP_MARK not in name}
+
+# 编译后的脚本
+class CompiledScript(object):
+
+    def __init__(self, engine, program, source=None):
+        '''
+        @param program compileSource得到的程序, closure后端在此编译为闭包, 之后的执行不再编译
+        @param source Engine.compile登记的源代码, 执行错误被回收之前也保留, 为None时源代码一直保留
+        '''
+        self.engine = engine
+        self.program = program
+        self.source = source
+        # 调用点的内联缓存引用上次调用的函数及其上下文, 每次执行结束时清除本次执行创建的函数
+        self.calls = findCalls(program)
+        self.closure = None
+        if engine.backend == 'closure':
+            self.closure = ClosureCompiler().compile(program)
+
+    def run(self, inputs=None):
+        '''
+        在新的全局符号表中执行, 多次执行之间不共享全局变量
+        @param inputs 注入的全局变量, 变量名 -> Python值
+        @return ScriptResult, 错误
+        '''
+        symbol_table = SymbolTable(builtin_symbol_table)
+        if inputs is not None:
+            for name, value in inputs.items():
+                symbol_table.symbols[name] = toValue(value)
+        context = self.engine.newContext(symbol_table)
+
+        try:
+            if self.closure is not None:
+                value, err = ClosureCompiler().execute(self.closure, context)
+            else:
+                value, err = execute(self.program, self.engine.backend, self.engine.max_depth, context)
+        finally:
+            for node in self.calls:
+                # 内建函数由所有执行共享, 保留缓存
+                if type(node.cache) is not BuiltinFunction:
+                    node.cache = None
+        if err is not None:
+            if self.source is not None:
+                sources.hold(self.source, err)
+            return None, err
+        return ScriptResult(value, symbol_table), None
+
+# 执行引擎
+class Engine(object):
+
+    def __init__(self, backend='interpreter', optimize=False, max_depth=MAX_DEPTH, inline_size=INLINE_SIZE, cache=True):
+        '''
+        @param backend 执行后端
+        @param optimize 是否进行常量折叠, 死代码消除和函数内联
+        @param max_depth vm后端的最大调用深度
+        @param inline_size 内联函数体的最大节点数
+        @param cache 脚本文件和导入的模块是否使用编译缓存
+        '''
+        self.backend = backend
+        self.optimize = optimize
+        self.max_depth = max_depth
+        self.inline_size = inline_size
+        self.cache = cache
+        # 导入的模块使用本引擎的执行后端和选项
+        self.modules = ModuleLoader(self.compileModule, self.executeModule)
+
+    def compile(self, text, file='<script>', need_result=True):
+        '''
+        分析和编译脚本, 不执行
+        @param file 报告错误时的文件名, 导入的模块相对于其所在的目录
+        @param need_result 是否收集顶层语句的值
+        @return CompiledScript, 错误
+        '''
+        # 源代码在脚本或编译错误被回收之前保留
+        source = sources.share(file, text)
+        try:
+            program, err = compileSource(source, False, self.backend, need_result, self.optimize, self.inline_size)
+            if err is not None:
+                sources.hold(source, err)
+                return None, err
+            script = CompiledScript(self, program, source)
+            sources.hold(source, script)
+            return script, None
+        finally:
+            sources.release(source)
+
+    def compileFile(self, file_path, need_result=True):
+        '''
+        读取并编译脚本文件, 使用编译缓存
+        @return CompiledScript, 错误
+        '''
+        with open(file_path, 'r', encoding='UTF-8') as f:
+            text = f.read()
+        if not self.cache:
+            return self.compile(text, file_path, need_result)
+        program, err = loadProgram(file_path, text, self.backend, need_result, self.optimize, self.inline_size)
+        if err is not None:
+            return None, err
+        return CompiledScript(self, program), None
+
+    def newContext(self, symbol_table):
+        '''
+        一次执行的顶层上下文, 其中的导入语句使用本引擎的模块加载器
+        @param symbol_table 本次执行的全局符号表
+        '''
+        context = Context('<program>')
+        context.symbol_table = symbol_table
+        context.modules = self.modules
+        return context
+
+    def compileModule(self, file_path, text):
+        if self.cache:
+            return loadProgram(file_path, text, self.backend, False, self.optimize, self.inline_size)
+        return compileSource(sources.share(file_path, text), False, self.backend, False, self.optimize, self.inline_size)
+
+    def executeModule(self, program, symbol_table, node, context):
+        # 模块的顶层上下文在错误栈中位于导入语句之后
+        module_context = Context('<module>', context, node.pos_start)
+        module_context.symbol_table = symbol_table
+        module_context.modules = self.modules
+        return execute(program, self.backend, self.max_depth, module_context)
\ No newline at end of file
@@ -1,6 +1,8 @@
 #!/usr/bin/env python3
 # -*- coding: utf-8 -*-
 
+from lk_position import sources
+
 '''
 错误
 '''
@@ -21,7 +23,7 @@ class Error(object):
 
     def getError(self):
         res = f'{self.name}: {self.detail}\n'
-        res += f'File {self.pos_start.file}, line {self.pos_end.ln + 1}'
+        res += f'File {sources.file(self.pos_start)}, line {sources.line(self.pos_end) + 1}'
         return res
 
 # 非法字符
@@ -46,7 +48,7 @@ class RTError(Error):
     def getError(self):
         res = self.traceback()
         res += f'{self.name}: {self.detail}\n'
-        res += f'File {self.pos_start.file}, line {self.pos_end.ln + 1}'
+        res += f'File {sources.file(self.pos_start)}, line {sources.line(self.pos_end) + 1}'
         return res
 
     def traceback(self):
@@ -57,11 +59,32 @@ class RTError(Error):
         pos = self.pos_start
         ctx = self.context
         while ctx is not None:
-            res = f'File {pos.file}, line {pos.ln + 1}, in {ctx.name}\n' + res
+            res = f'File {sources.file(pos)}, line {sources.line(pos) + 1}, in {ctx.name}\n' + res
             pos = ctx.parent_pos
             ctx = ctx.parent
         return 'Traceback (most recent call last):\n' + res
 
+# 运行错误异常, 编译执行时用于向外传递RTError
+class RTException(Exception):
+
+    def __init__(self, error):
+        super().__init__(error.detail)
+        self.error = error
+
+# 词法错误异常, 流式分析时用于向外传递IllegalCharError, ExpectedCharError
+class LexException(Exception):
+
+    def __init__(self, error):
+        super().__init__(error.detail)
+        self.error = error
+
+# 语法错误异常, 语法分析时用于向外传递InvalidSyntaxError
+class SyntaxException(Exception):
+
+    def __init__(self, error):
+        super().__init__(error.detail)
+        self.error = error
+
 # 预期字符错误
 class ExpectedCharError(Error):
 
@@ -3,73 +3,155 @@
 
 from lk_token import *
 from lk_type import *
-from lk_ast_node import VarAccessNode, VarAssignNode, BinaryOpNode
-from lk_error import RTError
+from lk_ast_node import BinaryOpNode
+from lk_error import RTError, RTException
+from lk_symbol_table import UNBOUND
+
+# lk_module导入lk_type, 按模块名引用, 在执行导入语句时才读取属性
+import lk_module
+
+# 二元运算符对应的Value方法
+BINARY_METHODS = {
+    T_PLUS: 'addBy',
+    T_MINUS: 'subBy',
+    T_MUL: 'mulBy',
+    T_DIV: 'divBy',
+    T_POW: 'powBy',
+    T_MOD: 'modBy',
+    T_EE: 'compEE',
+    T_NE: 'compNE',
+    T_LT: 'compLT',
+    T_GT: 'compGT',
+    T_LTE: 'compLTE',
+    T_GTE: 'compGTE'
+}
+
+# return
+class ReturnSignal(Exception):
+
+    def __init__(self, value):
+        self.value = value
 
-# 运行结果
-class RunResult(object):
+# break
+class BreakSignal(Exception):
+    pass
 
-    def __init__(self):
-        self.reset()
+# continue
+class ContinueSignal(Exception):
+    pass
 
-    def reset(self):
-        self.value = None
-        self.error = None
-        self.func_return_value = None
-        self.loop_should_continue = False
-        self.loop_should_break = False
+# break和continue不带数据, 预先创建
+BREAK = BreakSignal()
+CONTINUE = ContinueSignal()
 
-    def success(self, value):
-        self.reset()
-        self.value = value
-        return self
-
-    def successReturn(self, value):
-        self.reset()
-        self.func_return_value = value
-        return self
-
-    def successContinue(self):
-        self.reset()
-        self.loop_should_continue = True
-        return self
-
-    def successBreak(self):
-        self.reset()
-        self.loop_should_break = True
-        return self
-
-    def failure(self, error):
-        self.reset()
-        self.error = error
-        return self
-
-    def register(self, res):
-        if res.error is not None:
-            self.error = res.error
-        self.func_return_value = res.func_return_value
-        self.loop_should_continue = res.loop_should_continue
-        self.loop_should_break = res.loop_should_break
-        return res.value
-
-    def shouldReturn(self, only_err=False):
-        if only_err:
-            return self.error is not None or self.func_return_value is not None
-        else:
-            return self.error is not None or self.func_return_value is not None or self.loop_should_continue or self.loop_should_break
+# 尾调用, 作为函数的返回值交给调用者的循环执行, 不占用新的Python栈帧
+class TailCall(object):
+
+    def __init__(self, func, args, node):
+        '''
+        @param func 被调用的函数
+        @param args 参数
+        @param node CallNode
+        '''
+        self.func = func
+        self.args = args
+        self.node = node
+
+def binaryError(node, method_name, left, right, context):
+    '''
+    值不记录位置, 二元运算出错时包装操作数, 按AST节点的位置生成错误
+    @param node BinaryOpNode或AugAssignNode
+    '''
+    if isinstance(node, BinaryOpNode):
+        lnode_start, lnode_end = node.lnode.pos_start, node.lnode.pos_end
+        rnode_start, rnode_end = node.rnode.pos_start, node.rnode.pos_end
+    else:
+        lnode_start, lnode_end = node.name_token.pos_start, node.name_token.pos_end
+        rnode_start, rnode_end = node.value_node.pos_start, node.value_node.pos_end
+    if left is None:
+        # 没有值的操作数不能参与运算
+        return RTError(lnode_start, rnode_end, 'Illegal Operation', context)
+    left = box(left).setPos(lnode_start, lnode_end).setContext(context)
+    if right is not None:
+        right = box(right).setPos(rnode_start, rnode_end).setContext(context)
+    _, err = getattr(left, method_name)(right)
+    return err
+
+def inlineError(error, node, context):
+    '''
+    内联的函数体中直接发生的错误, 补上不内联时调用函数的调用帧
+    与函数调用相同, 调用帧的上层是函数定义所在的上下文, 位置是调用点
+    @param node InlineNode
+    @param context 执行内联的函数体的上下文
+    '''
+    if error.context is not context:
+        return
+    name = node.func_node.name_token.value
+    func = context.lookup(name, node.func_node.scope)
+    if isinstance(func, Function):
+        error.context = Context(func.name, func.context, node.pos_start)
+    else:
+        error.context = Context(name, context, node.pos_start)
 
 # 上下文
 class Context(object):
 
-    def __init__(self, name, parent=None, parent_pos=None):
+    # 导入语句使用的模块加载器, 只记录在执行的顶层上下文和模块的上下文中
+    modules = None
+
+    def __init__(self, name, parent=None, parent_pos=None, slots=None):
         self.name = name
         self.parent = parent
         self.parent_pos = parent_pos
         self.symbol_table = None
+        # 函数调用帧中局部变量的槽位
+        self.slots = slots
+
+    def lookup(self, name, scope):
+        '''
+        按Resolver生成的查找链读取变量
+        @param name 变量名
+        @param scope (层数, 槽位, 外层查找链), 槽位为None时在符号表中查找
+        '''
+        while scope is not None:
+            depth, slot, scope = scope
+            ctx = self
+            for _ in range(depth):
+                ctx = ctx.parent
+            if slot is None:
+                return ctx.symbol_table.get(name)
+            value = ctx.slots[slot]
+            if value is not UNBOUND:
+                return value
+        return None
+
+    def assign(self, name, slot, value):
+        '''
+        写入当前作用域
+        '''
+        if slot is None:
+            self.symbol_table.symbols[name] = value
+        else:
+            self.slots[slot] = value
 
 # 解释器
 class Interpreter(object):
 
+    def run(self, node, context):
+        '''
+        执行顶层程序
+        @param node parse()得到的根节点
+        @param context 上下文
+        @return 运行结果, 错误
+        '''
+        try:
+            return self.visit(node, context), None
+        except RTException as e:
+            return None, e.error
+        except (ReturnSignal, BreakSignal, ContinueSignal):
+            # 顶层的return, break, continue结束程序
+            return None, None
+
     def visit(self, node, context):
         '''
         遍历AST节点
@@ -84,249 +166,216 @@ class Interpreter(object):
         raise Exception(f'No visit_{type(node).__name__}')
 
     def visit_NumberNode(self, node, context):
-        return RunResult().success(Number(node.token.value).setContext(context).setPos(node.pos_start, node.pos_end))
+        return node.token.value
 
     def visit_StringNode(self, node, context):
-        return RunResult().success(String(node.token.value).setContext(context).setPos(node.pos_start, node.pos_end))
+        return node.token.value
 
-    def visit_ListNode(self, node, context):
-        res = RunResult()
-        elements = []
-
-        for i in node.element_nodes:
-            elements.append(res.register(self.visit(i, context)))
-            if res.shouldReturn():
-                return res
+    def visit_BlockNode(self, node, context):
+        if not node.value_needed:
+            for i in node.statement_nodes:
+                self.visit(i, context)
+            return None
+        elements = [self.visit(i, context) for i in node.statement_nodes]
+        return List(elements).setContext(context).setPos(node.pos_start, node.pos_end)
 
-        return res.success(List(elements).setContext(context).setPos(node.pos_start, node.pos_end))
+    def visit_ListNode(self, node, context):
+        elements = [self.visit(i, context) for i in node.element_nodes]
+        return List(elements).setContext(context).setPos(node.pos_start, node.pos_end)
 
-    def visit_VarAccessNode(self, node, context):
-        res = RunResult()
+    def load(self, node, context):
+        '''
+        按作用域解析结果读取变量
+        @param node VarAccessNode或AugAssignNode
+        '''
         var_name = node.name_token.value
-        value = context.symbol_table.get(var_name)
+        depth, slot, outer = node.scope
+        if slot is not None and depth == 0:
+            # 当前调用帧的局部变量
+            value = context.slots[slot]
+            if value is UNBOUND:
+                # 外层变量的数组同时被局部变量引用
+                value = share(context.lookup(var_name, outer))
+        else:
+            value = context.lookup(var_name, node.scope)
         if value is None:
-            return res.failure(RTError(node.pos_start, node.pos_end, f'{var_name} is undefined', context))
-        value = value.copy().setPos(node.pos_start, node.pos_end)
-        return res.success(value)
+            raise RTException(RTError(node.pos_start, node.pos_end, f'{var_name} is undefined', context))
+        return value
+
+    def visit_VarAccessNode(self, node, context):
+        value = self.load(node, context)
+        if type(value) is List:
+            value.shared = True
+        return value
 
     def visit_VarAssignNode(self, node, context):
-        res = RunResult()
         var_name = node.name_token.value
         if not node.define:
-            org_value = context.symbol_table.get(var_name)
+            org_value = context.lookup(var_name, node.scope)
             if org_value is None:
-                return res.failure(RTError(node.pos_start, node.pos_end, f'{var_name} is undefined', context))
-        if node.eq == T_PLUSEQ:
-            return self.visit(VarAssignNode(node.name_token, BinaryOpNode(VarAccessNode(node.name_token), Token(T_PLUS), node.value_node), T_EQ), context)
-        elif node.eq == T_MINUSEQ:
-            return self.visit(VarAssignNode(node.name_token, BinaryOpNode(VarAccessNode(node.name_token), Token(T_MINUS), node.value_node), T_EQ), context)
-        elif node.eq == T_MULEQ:
-            return self.visit(VarAssignNode(node.name_token, BinaryOpNode(VarAccessNode(node.name_token), Token(T_MUL), node.value_node), T_EQ), context)
-        elif node.eq == T_DIVEQ:
-            return self.visit(VarAssignNode(node.name_token, BinaryOpNode(VarAccessNode(node.name_token), Token(T_DIV), node.value_node), T_EQ), context)
-        elif node.eq == T_POWEQ:
-            return self.visit(VarAssignNode(node.name_token, BinaryOpNode(VarAccessNode(node.name_token), Token(T_POW), node.value_node), T_EQ), context)
-        elif node.eq == T_MODEQ:
-            return self.visit(VarAssignNode(node.name_token, BinaryOpNode(VarAccessNode(node.name_token), Token(T_MOD), node.value_node), T_EQ), context)
-        value = res.register(self.visit(node.value_node, context))
-        if res.shouldReturn():
-            return res
-        context.symbol_table.set(var_name, value)
-        return res.success(value)
+                raise RTException(RTError(node.pos_start, node.pos_end, f'{var_name} is undefined', context))
+        value = self.visit(node.value_node, context)
+        context.assign(var_name, node.slot, value)
+        if node.value_needed:
+            share(value)
+        return value
+
+    def visit_AugAssignNode(self, node, context):
+        left = self.load(node, context)
+        right = self.visit(node.value_node, context)
+        method_name = BINARY_METHODS[node.op_token.type]
+        value, err = inplaceOp(method_name, left, right)
+        if err is not None:
+            raise RTException(binaryError(node, method_name, left, right, context))
+        context.assign(node.name_token.value, node.slot, value)
+        if node.value_needed:
+            share(value)
+        return value
 
     def visit_BinaryOpNode(self, node, context):
-        res = RunResult()
-
-        left = res.register(self.visit(node.lnode, context))
-        if res.shouldReturn():
-            return res
-        right = res.register(self.visit(node.rnode, context))
-        if res.shouldReturn():
-            return res
-
-        if node.token.type == T_PLUS:
-            result, err = left.addBy(right)
-        elif node.token.type == T_MINUS:
-            result, err = left.subBy(right)
-        elif node.token.type == T_MUL:
-            result, err = left.mulBy(right)
-        elif node.token.type == T_DIV:
-            result, err = left.divBy(right)
-        elif node.token.type == T_POW:
-            result, err = left.powBy(right)
-        elif node.token.type == T_MOD:
-            result, err = left.modBy(right)
-        elif node.token.type == T_EE:
-            result, err = left.compEE(right)
-        elif node.token.type == T_NE:
-            result, err = left.compNE(right)
-        elif node.token.type == T_LT:
-            result, err = left.compLT(right)
-        elif node.token.type == T_GT:
-            result, err = left.compGT(right)
-        elif node.token.type == T_LTE:
-            result, err = left.compLTE(right)
-        elif node.token.type == T_GTE:
-            result, err = left.compGTE(right)
-        elif node.token.match(T_KEYWORD, 'and'):
-            result, err = left.logicAnd(right)
+        left = self.visit(node.lnode, context)
+
+        # 短路求值, 左操作数决定结果时不计算右操作数
+        if node.token.match(T_KEYWORD, 'and'):
+            return self.visit(node.rnode, context) if left else left
         elif node.token.match(T_KEYWORD, 'or'):
-            result, err = left.logicOr(right)
+            return left if left else self.visit(node.rnode, context)
+
+        right = self.visit(node.rnode, context)
+
+        if node.token.type in BINARY_METHODS:
+            method_name = BINARY_METHODS[node.token.type]
         else:
-            return res.failure(RTError(node.pos_start, node.pos_end, f'{node.token.type} is not supported', context))
+            raise RTException(RTError(node.pos_start, node.pos_end, f'{node.token.type} is not supported', context))
 
+        result, err = binaryOp(method_name, left, right)
         if err is not None:
-            return res.failure(err)
-        return res.success(result.setPos(node.pos_start, node.pos_end))
+            raise RTException(binaryError(node, method_name, left, right, context))
+        return result
 
     def visit_UnaryOpNode(self, node, context):
-        res = RunResult()
-        num = res.register(self.visit(node.node, context))
-        if res.shouldReturn():
-            return res
+        num = self.visit(node.node, context)
 
-        err = None
         if node.token.type == T_MINUS:
-            num, err = num.mulBy(Number(-1))
+            num = negate(num)
         elif node.token.match(T_KEYWORD, 'not'):
-            num, err = num.logicNot()
+            num = logicNot(num)
 
-        if err is not None:
-            return res.failure(err)
-        return res.success(num.setPos(node.pos_start, node.pos_end))
+        return num
 
     def visit_IfNode(self, node, context):
-        res = RunResult()
-
         for condition, expr in node.case:
-            condition_value = res.register(self.visit(condition, context))
-            if res.shouldReturn():
-                return res
-
-            if condition_value.value:
-                expr_value = res.register(self.visit(expr, context))
-                if res.shouldReturn():
-                    return res
-                return res.success(expr_value)
+            if self.visit(condition, context):
+                return self.visit(expr, context)
 
         if node.else_case is not None:
-            else_value = res.register(self.visit(node.else_case, context))
-            if res.shouldReturn():
-                return res
-            return res.success(else_value)
+            return self.visit(node.else_case, context)
 
-        return res.success(None)
+        return None
 
     def visit_ForNode(self, node, context):
-        res = RunResult()
         elements = []
 
-        start_value = res.register(self.visit(node.start_value_node, context))
-        if res.shouldReturn():
-                return res
-
-        end_value = res.register(self.visit(node.end_value_node, context))
-        if res.shouldReturn():
-                return res
-
-        step_value = Number(1)
+        start_value = self.visit(node.start_value_node, context)
+        end_value = self.visit(node.end_value_node, context)
+        step_value = 1
         if node.step_value_node is not None:
-            step_value = res.register(self.visit(node.step_value_node, context))
-            if res.shouldReturn():
-                return res
+            step_value = self.visit(node.step_value_node, context)
 
-        i = start_value.value
+        i = start_value
 
-        if step_value.value >= 0:
-            condition = lambda: i <= end_value.value
+        if step_value >= 0:
+            condition = lambda: i <= end_value
         else:
-            condition = lambda: i >= end_value.value
+            condition = lambda: i >= end_value
 
         while condition():
-            context.symbol_table.set(node.var_name_token.value, Number(i))
-            i += step_value.value
-            value = res.register(self.visit(node.body_node, context))
-            if res.shouldReturn(True):
-                return res
-            if res.loop_should_continue:
+            context.assign(node.var_name_token.value, node.slot, i)
+            i += step_value
+            try:
+                value = self.visit(node.body_node, context)
+            except ContinueSignal:
                 continue
-            if res.loop_should_break:
+            except BreakSignal:
                 break
-            elements.append(value)
+            if node.value_needed:
+                elements.append(value)
 
-        return res.success(List(elements).setContext(context).setPos(node.pos_start, node.pos_end))
+        if not node.value_needed:
+            return None
+        return List(elements).setContext(context).setPos(node.pos_start, node.pos_end)
 
     def visit_WhileNode(self, node, context):
-        res = RunResult()
         elements = []
 
-        while True:
-            condition = res.register(self.visit(node.condition_node, context))
-            if res.shouldReturn():
-                return res
-            if not condition.value:
-                break
-
-            value = res.register(self.visit(node.body_node, context))
-            if res.shouldReturn(True):
-                return res
-            if res.loop_should_continue:
+        while self.visit(node.condition_node, context):
+            try:
+                value = self.visit(node.body_node, context)
+            except ContinueSignal:
                 continue
-            if res.loop_should_break:
+            except BreakSignal:
                 break
-            elements.append(value)
+            if node.value_needed:
+                elements.append(value)
 
-        return res.success(List(elements).setContext(context).setPos(node.pos_start, node.pos_end))
+        if not node.value_needed:
+            return None
+        return List(elements).setContext(context).setPos(node.pos_start, node.pos_end)
 
     def visit_FuncNode(self, node, context):
-        res = RunResult()
-
         func_name = node.name_token.value if node.name_token is not None else None
         arg_name = [arg.value for arg in node.arg_name_tokens]
         body_node = node.body_node
 
-        func_value = Function(func_name, arg_name, body_node, node.auto_return).setContext(context).setPos(node.pos_start, node.pos_end)
+        func_value = Function(func_name, arg_name, body_node, node.auto_return, node.slot_count).setContext(context).setPos(node.pos_start, node.pos_end)
 
         if node.name_token is not None:
-            context.symbol_table.set(func_name, func_value)
+            context.assign(func_name, node.slot, func_value)
 
-        return res.success(func_value)
+        return func_value
 
     def visit_CallNode(self, node, context):
-        res = RunResult()
-        args = []
-
-        value = res.register(self.visit(node.func_node, context))
-        if res.shouldReturn():
-            return res
-        value = value.copy().setPos(node.pos_start, node.pos_end)
-
-        for arg in node.arg_nodes:
-            args.append(res.register(self.visit(arg, context)))
-            if res.shouldReturn():
-                return res
-
-        return_value = res.register(value.execute(args, self))
-        if res.shouldReturn():
-            return res
-        return res.success(return_value)
+        value = self.visit(node.func_node, context)
+        # 与上次调用的函数相同时, 类型和参数个数已检查过
+        cached = value is node.cache
+        if not cached and not isinstance(value, Function):
+            raise RTException(RTError(node.pos_start, node.pos_end, 'Illegal Operation', context))
+
+        args = [self.visit(arg, context) for arg in node.arg_nodes]
+
+        if not cached:
+            value.checkArgs(args, node.pos_start, node.pos_end)
+            node.cache = value
+
+        # 记忆化的函数需要在返回时缓存结果, 不作为尾调用
+        if node.tail and type(value) is Function and value.memo is None:
+            return TailCall(value, args, node)
+        return value.invoke(args, self, node)
+
+    def visit_InlineNode(self, node, context):
+        for i in node.assign_nodes:
+            self.visit(i, context)
+        try:
+            value = self.visit(node.body_node, context)
+        except RTException as e:
+            inlineError(e.error, node, context)
+            raise
+        if value is None:
+            return NULL
+        return value
 
     def visit_ReturnNode(self, node, context):
-        res = RunResult()
-
-        value = Number.null
+        value = NULL
         if node.node is not None:
-            value = res.register(self.visit(node.node, context))
-            if res.shouldReturn():
-                return res
-        return res.successReturn(value)
+            value = self.visit(node.node, context)
+        raise ReturnSignal(value)
 
     def visit_ContinueNode(self, node, context):
-        res = RunResult()
-
-        return res.successContinue()
+        raise CONTINUE
 
     def visit_BreakNode(self, node, context):
-        res = RunResult()
+        raise BREAK
 
-        return res.successBreak()
\ No newline at end of file
+    def visit_ImportNode(self, node, context):
+        lk_module.bind(node, context)
+        return NULL
\ No newline at end of file
@@ -2,275 +2,168 @@
 # -*- coding: utf-8 -*-
 
 from lk_token import *
-from lk_position import Position
-from lk_error import IllegalCharError, ExpectedCharError
+from lk_position import sources
+from lk_error import IllegalCharError, ExpectedCharError, LexException
+
+import gc
+import re
+
+'''
+词法分析
+由一个正则表达式从当前索引匹配下一个Token, 每个Token只匹配一次
+generateTokens按需生成Token, 语法分析器边读取边分析, 不需要保存所有Token
+位置是源代码在位置空间中的整数位置, 行号和列号在报告错误时计算
+'''
+
+# 运算符和分隔符, 较长的运算符排在前面
+OPERATORS = {
+    '**=': T_POWEQ,
+    '**': T_POW,
+    '->': T_ARROW,
+    '==': T_EE,
+    '!=': T_NE,
+    '<=': T_LTE,
+    '>=': T_GTE,
+    '+=': T_PLUSEQ,
+    '-=': T_MINUSEQ,
+    '*=': T_MULEQ,
+    '/=': T_DIVEQ,
+    '%=': T_MODEQ,
+    '+': T_PLUS,
+    '-': T_MINUS,
+    '*': T_MUL,
+    '/': T_DIV,
+    '%': T_MOD,
+    '=': T_EQ,
+    '<': T_LT,
+    '>': T_GT,
+    '(': T_LPAREN,
+    ')': T_RPAREN,
+    '{': T_LBRACE,
+    '}': T_RBRACE,
+    '[': T_LBRACKET,
+    ']': T_RBRACKET,
+    ',': T_COMMA,
+    ';': T_NEWLINE,
+    '\n': T_NEWLINE
+}
+
+# 跳过空白后按顺序尝试的规则, 组名为规则名, 只有空白时匹配END
+# 注释以//开始, 包括行尾的换行符, 文件末尾的注释没有换行符
+# 数字中只有第一个.属于该数字
+# 字符串的内容由STRING_BODY匹配
+SPACE = re.compile(r'[ \t]*')
+TOKEN_REGEX = re.compile(r'[ \t]*(?:' + '|'.join((
+    r'(?P<COMMENT>//[^\n]*\n?)',
+    '(?P<OPERATOR>' + '|'.join(re.escape(i) for i in OPERATORS) + ')',
+    r'(?P<NAME>[A-Za-z][A-Za-z0-9_]*)',
+    r'(?P<NUMBER>[0-9]+(?:\.[0-9]*)?)',
+    r"(?P<STRING>')",
+    r'(?P<END>\Z)'
+)) + ')')
+
+# 字符串的内容, 到未转义的'为止, 文件末尾单独的\被忽略
+STRING_BODY = re.compile(r"(?:[^'\\]|\\.)*", re.S)
+ESCAPE = re.compile(r'\\(.)', re.S)
+ESCAPE_CHARS = {
+    'n': '\n',
+    't': '\t'
+}
 
 # 词法分析器
 class Lexer(object):
 
-    def __init__(self, file, text):
+    def __init__(self, file, text, source=None):
+        '''
+        @param source 已经登记的源代码, 为None时在位置空间中登记
+        '''
         self.file = file
         self.text = text
-        self.pos = Position(-1, 0, -1, file, text)
-        self.current_char = None
-        self.advance()
+        self.source = source if source is not None else sources.add(file, text)
 
-    def advance(self):
-        self.pos.advance(self.current_char)
-        if self.pos.index < len(self.text):
-            self.current_char = self.text[self.pos.index]
-        else:
-            self.current_char = None
+    def position(self, index):
+        return self.source.base + index
 
     def makeTokens(self):
-        tokens = []
-
-        while self.current_char is not None:
-            if self.current_char in (' ', '\t'):
-                self.advance()
-            elif self.current_char in DIGITS:
-                tokens.append(self.makeNumber())
-            elif self.current_char in LETTERS:
-                tokens.append(self.makeIdentifier())
-            elif self.current_char == '\'':
-                tokens.append(self.makeString())
-            elif self.current_char == '=':
-                tokens.append(self.makeEqual())
-            elif self.current_char == '<':
-                tokens.append(self.makeLessThan())
-            elif self.current_char == '>':
-                tokens.append(self.makeGreaterThan())
-            elif self.current_char == '!':
-                token, err = self.makeNotEqual()
-                if err is not None:
-                    return [], err
-                tokens.append(token)
-            elif self.current_char == '+':
-                tokens.append(self.makePlus())
-            elif self.current_char == '-':
-                tokens.append(self.makeMinus())
-            elif self.current_char == '*':
-                tokens.append(self.makeAsterisk())
-            elif self.current_char == '/':
-                self.advance()
-                if self.current_char == '/':
-                    self.skipComment()
-                elif self.current_char == '=':
-                    tokens.append(Token(T_DIVEQ, pos_start=self.pos))
-                    self.advance()
-                else:
-                    tokens.append(Token(T_DIV, pos_start=self.pos))
-            elif self.current_char == '%':
-                tokens.append(self.makeMod())
-            elif self.current_char == '(':
-                tokens.append(Token(T_LPAREN, pos_start=self.pos))
-                self.advance()
-            elif self.current_char == ')':
-                tokens.append(Token(T_RPAREN, pos_start=self.pos))
-                self.advance()
-            elif self.current_char == '{':
-                tokens.append(Token(T_LBRACE, pos_start=self.pos))
-                self.advance()
-            elif self.current_char == '}':
-                tokens.append(Token(T_RBRACE, pos_start=self.pos))
-                tokens.append(Token(T_NEWLINE, pos_start=self.pos))
-                self.advance()
-            elif self.current_char == '[':
-                tokens.append(Token(T_LBRACKET, pos_start=self.pos))
-                self.advance()
-            elif self.current_char == ']':
-                tokens.append(Token(T_RBRACKET, pos_start=self.pos))
-                self.advance()
-            elif self.current_char == ',':
-                tokens.append(Token(T_COMMA, pos_start=self.pos))
-                self.advance()
-            elif self.current_char in ';\n':
-                tokens.append(Token(T_NEWLINE, pos_start=self.pos))
-                self.advance()
-            else:
-                pos_start = self.pos.copy()
-                char = self.current_char
-                self.advance()
-                return [], IllegalCharError(pos_start, self.pos, f"'{char}'")
-        tokens.append(Token(T_EOF, pos_start=self.pos))
-        return tokens, None
-
-    def skipComment(self):
-        self.advance()
-        while self.current_char != '\n':
-            self.advance()
-        self.advance()
-
-    def makeNumber(self):
-        num_str = ''
-        dot = False
-        pos_start = self.pos.copy()
-
-        while self.current_char is not None and self.current_char in DIGITS + '.':
-            if self.current_char == '.':
-                if dot:
-                    break
-                dot = True
-                num_str += '.'
-            else:
-                num_str += self.current_char
-            self.advance()
-        if not dot:
-            return Token(T_INT, int(num_str), pos_start, self.pos)
-        else:
-            return Token(T_FLOAT, float(num_str), pos_start, self.pos)
-
-    def makeString(self):
-        string = ''
-        pos_start = self.pos.copy()
-        escape_char = False
-        escape_chars = {
-            'n': '\n',
-            't': '\t'
-        }
-
-        self.advance()
-        while self.current_char is not None and (self.current_char != '\'' or escape_char):
-            if escape_char:
-                string += escape_chars.get(self.current_char, self.current_char)
-                escape_char = False
-            else:
-                if self.current_char == '\\':
-                    escape_char = True
-                else:
-                    string += self.current_char
-            self.advance()
-
-        self.advance()
-        return Token(T_STRING, string, pos_start, self.pos)
-
-    def makeIdentifier(self):
-        '''
-        匹配关键字或变量名
         '''
-        var_str = ''
-        pos_start = self.pos.copy()
-
-        while self.current_char is not None and self.current_char in LETTERS_DIGITS + '_':
-            var_str += self.current_char
-            self.advance()
-
-        if var_str in KEYWORDS:
-            token_type = T_KEYWORD
+        返回所有Token的列表
+        Token之间没有循环引用, 分析时暂停循环垃圾回收, 大文件的大量Token会反复触发回收
+        '''
+        enabled = gc.isenabled()
+        gc.disable()
+        try:
+            return list(self.generateTokens()), None
+        except LexException as e:
+            return [], e.error
+        finally:
+            if enabled:
+                gc.enable()
+
+    def generateTokens(self):
+        '''
+        逐个生成Token, 最后一个为EOF
+        遇到非法字符时抛出LexException
+        '''
+        base = self.source.base
+        text = self.text
+        length = len(text)
+        match = TOKEN_REGEX.match
+        index = 0
+
+        while index < length:
+            m = match(text, index)
+            if m is None:
+                raise LexException(self.makeError(SPACE.match(text, index).end()))
+            kind = m.lastgroup
+            start = m.start(kind)
+            end = m.end()
+
+            if kind == 'OPERATOR':
+                token_type = OPERATORS[m.group(kind)]
+                yield Token(token_type, None, base + start, base + end)
+                # }之后可以直接开始新的语句
+                if token_type == T_RBRACE:
+                    yield Token(T_NEWLINE, None, base + start, base + end)
+            elif kind == 'NAME':
+                value = m.group(kind)
+                token_type = T_KEYWORD if value in KEYWORDS else T_IDENTIFIER
+                yield Token(token_type, value, base + start, base + end)
+            elif kind == 'NUMBER':
+                value = m.group(kind)
+                if '.' in value:
+                    yield Token(T_FLOAT, float(value), base + start, base + end)
+                else:
+                    yield Token(T_INT, int(value), base + start, base + end)
+            elif kind == 'STRING':
+                token, end = self.makeString(start)
+                yield token
+            # 注释和文件末尾的空白不产生Token
+            index = end
+
+        yield Token(T_EOF, None, self.position(index), self.position(index + 1))
+
+    def makeString(self, pos_start):
+        '''
+        匹配字符串, 返回Token和之后的索引
+        没有结束的'时字符串到文件末尾为止
+        @param pos_start 开始的'的索引
+        '''
+        start = pos_start + 1
+        end = STRING_BODY.match(self.text, start).end()
+        string = self.text[start:end]
+        if '\\' in string:
+            string = ESCAPE.sub(lambda m: ESCAPE_CHARS.get(m.group(1), m.group(1)), string)
+        if end < len(self.text) and self.text[end] == '\'':
+            end += 1
         else:
-            token_type = T_IDENTIFIER
-        return Token(token_type, var_str, pos_start, self.pos)
+            end = len(self.text) + 1
+        return Token(T_STRING, string, self.position(pos_start), self.position(end)), end
 
-    def makePlus(self):
+    def makeError(self, index):
         '''
-        匹配+或+=
+        没有规则匹配时的错误
+        !之后必须是=
         '''
-        token_type = T_PLUS
-        pos_start = self.pos.copy()
-
-        self.advance()
-        if self.current_char == '=':
-            self.advance()
-            token_type = T_PLUSEQ
-        return Token(token_type, pos_start=pos_start, pos_end=self.pos)
-
-    def makeMinus(self):
-        '''
-        匹配-或-=或->
-        '''
-        token_type = T_MINUS
-        pos_start = self.pos.copy()
-
-        self.advance()
-        if self.current_char == '=':
-            self.advance()
-            token_type = T_MINUSEQ
-        elif self.current_char == '>':
-            self.advance()
-            token_type = T_ARROW
-        return Token(token_type, pos_start=pos_start, pos_end=self.pos)
-
-    def makeAsterisk(self):
-        '''
-        匹配*或**或*=或**=
-        '''
-        token_type = T_MUL
-        pos_start = self.pos.copy()
-
-        self.advance()
-        if self.current_char == '*':
-            self.advance()
-            token_type = T_POW
-            if self.current_char == '=':
-                self.advance()
-                token_type = T_POWEQ
-        elif self.current_char == '=':
-            self.advance()
-            token_type = T_MULEQ
-        return Token(token_type, pos_start=pos_start, pos_end=self.pos)
-
-    def makeMod(self):
-        '''
-        匹配%或%=
-        '''
-        token_type = T_MOD
-        pos_start = self.pos.copy()
-
-        self.advance()
-        if self.current_char == '=':
-            self.advance()
-            token_type = T_MODEQ
-        return Token(token_type, pos_start=pos_start, pos_end=self.pos)
-
-    def makeEqual(self):
-        '''
-        匹配=或==
-        '''
-        token_type = T_EQ
-        pos_start = self.pos.copy()
-
-        self.advance()
-        if self.current_char == '=':
-            self.advance()
-            token_type = T_EE
-        return Token(token_type, pos_start=pos_start, pos_end=self.pos)
-
-    def makeLessThan(self):
-        '''
-        匹配<或<=
-        '''
-        token_type = T_LT
-        pos_start = self.pos.copy()
-
-        self.advance()
-        if self.current_char == '=':
-            self.advance()
-            token_type = T_LTE
-        return Token(token_type, pos_start=pos_start, pos_end=self.pos)
-
-    def makeGreaterThan(self):
-        '''
-        匹配>或>=
-        '''
-        token_type = T_GT
-        pos_start = self.pos.copy()
-
-        self.advance()
-        if self.current_char == '=':
-            self.advance()
-            token_type = T_GTE
-        return Token(token_type, pos_start=pos_start, pos_end=self.pos)
-
-    def makeNotEqual(self):
-        '''
-        匹配!=
-        不匹配单独的!
-        '''
-        pos_start = self.pos.copy()
-
-        self.advance()
-        if self.current_char == '=':
-            self.advance()
-            return Token(T_NE, pos_start=pos_start, pos_end=self.pos), None
-        self.advance()
-        return None, ExpectedCharError(pos_start, self.pos, "The character after '!' should be '='")
\ No newline at end of file
+        if self.text[index] == '!':
+            return ExpectedCharError(self.position(index), self.position(index + 2), "The character after '!' should be '='")
+        return IllegalCharError(self.position(index), self.position(index + 1), f"'{self.text[index]}'")
\ No newline at end of file
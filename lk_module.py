@@ -0,0 +1,180 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+from lk_error import RTError, RTException
+from lk_position import sources
+from lk_type import share
+# lk_builtin导入lk_type时会导入本模块, 按模块名引用, 在加载模块时才读取属性
+import lk_builtin
+
+import os
+import threading
+
+'''
+模块
+import a, b from 'path' 把模块的全局变量a, b绑定到当前的全局符号表, 此时不加载模块
+第一次读取导入的变量时才读取, 编译和执行模块, 每个模块在一个加载器中只编译和执行一次
+模块有自己的全局符号表, 只包含内建变量和模块自己的全局变量
+路径相对于导入模块的文件所在的目录, 没有扩展名时加上.lk
+模块执行期间读取它直接或间接导入的自己的变量是循环导入, 报告错误
+每个Engine有自己的加载器, 编译和执行模块的方法与Engine的执行后端和选项相同
+加载器记录在执行的顶层上下文和模块的上下文中, 执行后端执行导入语句时从全局上下文中取得
+'''
+
+# 模块的扩展名
+EXTENSION = '.lk'
+
+# 模块的状态
+UNLOADED = 0
+LOADING = 1
+LOADED = 2
+FAILED = 3
+
+# 模块
+class Module(object):
+
+    def __init__(self, path):
+        '''
+        @param path 绝对路径
+        '''
+        self.path = path
+        self.state = UNLOADED
+        # 执行后的全局符号表
+        self.symbol_table = None
+        # 编译或执行模块的错误, 再次读取时报告同一错误
+        self.error = None
+
+    def __repr__(self):
+        return f'<module {self.path}>'
+
+# 导入但还没有读取的变量
+class LazyImport(object):
+
+    def __init__(self, loader, module, name_token, node, context):
+        '''
+        @param name_token 导入语句中的变量名
+        @param node 导入语句, 模块无法读取时报告的位置
+        @param context 执行导入语句的上下文
+        '''
+        self.loader = loader
+        self.module = module
+        self.name_token = name_token
+        self.node = node
+        self.context = context
+
+    def load(self):
+        '''
+        加载模块, 读取变量的值
+        '''
+        table = self.loader.load(self.module, self.node, self.context)
+        name = self.name_token.value
+        value = table.get(name)
+        if value is None:
+            raise RTException(RTError(self.name_token.pos_start, self.name_token.pos_end, f"{name} is not defined in module '{self.node.path_token.value}'", self.context))
+        # 导入者与模块的符号表引用同一数组
+        return share(value)
+
+# 模块加载器
+class ModuleLoader(object):
+
+    def __init__(self, compile, execute):
+        '''
+        @param compile 读取缓存或编译模块, (路径, 内容) -> (程序, 错误)
+        @param execute 执行模块, (程序, 全局符号表, 导入语句, 上下文) -> (结果, 错误), 模块的上下文使用本加载器
+        '''
+        self.compile = compile
+        self.execute = execute
+        # 绝对路径 -> Module
+        self.modules = {}
+        # 正在执行的模块, 按开始执行的顺序
+        self.loading = []
+        # 同一时间只有一个线程加载模块, 其他线程等待加载完成, 不会被当作循环导入
+        # 模块执行时导入其他模块在同一线程中再次获取
+        self.lock = threading.RLock()
+
+    def find(self, node):
+        '''
+        导入语句引用的模块, 路径相对于导入语句所在的文件
+        '''
+        directory = os.path.dirname(sources.file(node.pos_start))
+        path = os.path.abspath(os.path.join(directory, node.path_token.value))
+        if os.path.splitext(path)[1] == '':
+            path += EXTENSION
+        module = self.modules.get(path)
+        if module is None:
+            module = self.modules.setdefault(path, Module(path))
+        return module
+
+    def bind(self, node, context):
+        '''
+        执行导入语句, 在当前的全局符号表中登记导入的变量, 不加载模块
+        '''
+        module = self.find(node)
+        while context.symbol_table is None:
+            context = context.parent
+        table = context.symbol_table
+        for name_token in node.name_tokens:
+            name = name_token.value
+            # 再次导入同名变量时替换之前的值
+            table.symbols.pop(name, None)
+            table.imports[name] = LazyImport(self, module, name_token, node, context)
+
+    def load(self, module, node, context):
+        '''
+        加载模块, 已加载时直接返回
+        @param node 导入语句
+        @param context 执行导入语句的上下文, 模块执行出错时在错误栈中
+        @return 模块的全局符号表
+        '''
+        if module.state == LOADED:
+            return module.symbol_table
+        with self.lock:
+            return self.loadLocked(module, node, context)
+
+    def loadLocked(self, module, node, context):
+        # 等待期间可能已被其他线程加载
+        if module.state == LOADED:
+            return module.symbol_table
+        elif module.state == FAILED:
+            raise RTException(module.error)
+        elif module.state == LOADING:
+            cycle = self.loading[self.loading.index(module):] + [module]
+            detail = 'Circular import: ' + ' -> '.join(os.path.relpath(i.path) for i in cycle)
+            raise RTException(RTError(node.pos_start, node.pos_end, detail, context))
+
+        try:
+            with open(module.path, 'r', encoding='UTF-8') as f:
+                text = f.read()
+        except (OSError, UnicodeDecodeError) as e:
+            # 文件可能之后被创建, 不记录错误
+            raise RTException(RTError(node.path_token.pos_start, node.path_token.pos_end, f"Cannot load module '{node.path_token.value}': {e}", context))
+
+        program, err = self.compile(module.path, text)
+        if err is None:
+            module.state = LOADING
+            self.loading.append(module)
+            try:
+                symbol_table = lk_builtin.moduleSymbolTable()
+                _, err = self.execute(program, symbol_table, node, context)
+            except BaseException:
+                module.state = UNLOADED
+                raise
+            finally:
+                self.loading.pop()
+        if err is not None:
+            module.state = FAILED
+            module.error = err
+            raise RTException(err)
+        module.state = LOADED
+        module.symbol_table = symbol_table
+        return symbol_table
+
+def bind(node, context):
+    '''
+    执行导入语句, 使用全局上下文中记录的加载器
+    '''
+    while context.symbol_table is None:
+        context = context.parent
+    if context.modules is None:
+        raise RTException(RTError(node.pos_start, node.pos_end, 'Cannot import modules outside of an Engine', context))
+    context.modules.bind(node, context)
\ No newline at end of file
@@ -0,0 +1,150 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+'''
+字节码指令
+每条指令占两个槽位: 操作码, 参数
+'''
+
+# 加载/存储
+LOAD_CONST = 0 # 常量池中的值入栈
+LOAD_NONE = 1 # None入栈
+LOAD_NAME = 2 # 全局变量入栈
+STORE_NAME = 3 # 栈顶存入全局变量, 不出栈
+CHECK_NAME = 4 # 按作用域解析结果检查变量已定义
+POP = 5 # 弹出栈顶
+
+# 数组
+BUILD_LIST = 6 # 弹出arg个值构建数组
+LIST_APPEND = 7 # 弹出栈顶, 追加到stack[-arg]的数组
+
+# 二元运算
+ADD = 8
+SUB = 9
+MUL = 10
+DIV = 11
+POW = 12
+MOD = 13
+EE = 14
+NE = 15
+LT = 16
+GT = 17
+LTE = 18
+GTE = 19
+
+# 短路求值
+JUMP_IF_FALSE_OR_POP = 20 # 栈顶为假时跳转到arg, 否则弹出栈顶
+JUMP_IF_TRUE_OR_POP = 21 # 栈顶为真时跳转到arg, 否则弹出栈顶
+
+# 一元运算
+NEG = 22
+NOT = 23
+
+# 跳转
+JUMP = 24 # 跳转到arg
+POP_JUMP_IF_FALSE = 25 # 弹出栈顶, 为假时跳转到arg
+FOR_PREP = 26 # 弹出start, end, step, 压入循环状态
+FOR_ITER = 27 # 循环未结束时压入计数值, 否则弹出循环状态并跳转到arg
+
+# 函数
+MAKE_FUNCTION = 28 # 用常量池中的Code创建函数
+CALL = 29 # 调用函数, arg为参数个数
+RETURN_VALUE = 30 # 返回栈顶
+
+# 超级指令, 由相邻的两条指令合并而成, 第二个参数在下一条指令的参数槽位中
+LOAD_NAME_NAME = 31 # LOAD_NAME + LOAD_NAME
+LOAD_NAME_CONST = 32 # LOAD_NAME + LOAD_CONST
+
+# 局部变量
+LOAD_FAST = 33 # 当前调用帧槽位中的变量入栈
+STORE_FAST = 34 # 栈顶存入当前调用帧的槽位, 不出栈
+LOAD_DEREF = 35 # 按作用域解析结果查找外层函数的变量
+
+LOAD_FAST_FAST = 36 # LOAD_FAST + LOAD_FAST
+LOAD_FAST_CONST = 37 # LOAD_FAST + LOAD_CONST
+
+# 复合赋值
+INPLACE_OP = 38 # 复合赋值的运算, arg为对应的二元运算指令
+LOAD_FAST_UPDATE = 39 # 复合赋值读取局部变量, 不标记数组被多处引用
+LOAD_NAME_UPDATE = 40 # 复合赋值读取全局变量, 不标记数组被多处引用
+SHARE = 41 # 标记栈顶的数组被多处引用
+
+# 尾调用
+TAIL_CALL = 42 # 调用函数并返回其返回值, 被调用的函数是编译后的函数时复用当前的执行循环
+
+# 内联
+NONE_TO_NULL = 43 # 栈顶为None时替换为null, 与函数返回值相同
+
+# 模块
+IMPORT_NAMES = 44 # 在全局符号表中登记导入语句导入的变量, null入栈
+
+# 循环
+UNWIND_LOOP = 45 # 函数中循环外的break(arg为1)和continue(arg为0), 弹出调用帧直到调用点在循环中, 跳转到该循环的结束或下一次迭代
+
+OPNAMES = (
+    'LOAD_CONST',
+    'LOAD_NONE',
+    'LOAD_NAME',
+    'STORE_NAME',
+    'CHECK_NAME',
+    'POP',
+    'BUILD_LIST',
+    'LIST_APPEND',
+    'ADD',
+    'SUB',
+    'MUL',
+    'DIV',
+    'POW',
+    'MOD',
+    'EE',
+    'NE',
+    'LT',
+    'GT',
+    'LTE',
+    'GTE',
+    'JUMP_IF_FALSE_OR_POP',
+    'JUMP_IF_TRUE_OR_POP',
+    'NEG',
+    'NOT',
+    'JUMP',
+    'POP_JUMP_IF_FALSE',
+    'FOR_PREP',
+    'FOR_ITER',
+    'MAKE_FUNCTION',
+    'CALL',
+    'RETURN_VALUE',
+    'LOAD_NAME_NAME',
+    'LOAD_NAME_CONST',
+    'LOAD_FAST',
+    'STORE_FAST',
+    'LOAD_DEREF',
+    'LOAD_FAST_FAST',
+    'LOAD_FAST_CONST',
+    'INPLACE_OP',
+    'LOAD_FAST_UPDATE',
+    'LOAD_NAME_UPDATE',
+    'SHARE',
+    'TAIL_CALL',
+    'NONE_TO_NULL',
+    'IMPORT_NAMES',
+    'UNWIND_LOOP'
+)
+
+# 跳转指令
+JUMPS = (JUMP, POP_JUMP_IF_FALSE, FOR_ITER, JUMP_IF_FALSE_OR_POP, JUMP_IF_TRUE_OR_POP)
+
+# 二元运算对应的Value方法
+BINARY_METHODS = {
+    ADD: 'addBy',
+    SUB: 'subBy',
+    MUL: 'mulBy',
+    DIV: 'divBy',
+    POW: 'powBy',
+    MOD: 'modBy',
+    EE: 'compEE',
+    NE: 'compNE',
+    LT: 'compLT',
+    GT: 'compGT',
+    LTE: 'compLTE',
+    GTE: 'compGTE'
+}
\ No newline at end of file
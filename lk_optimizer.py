@@ -0,0 +1,375 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+from lk_token import *
+from lk_ast_node import *
+from lk_type import binaryOp, negate, logicNot
+from lk_interpreter import BINARY_METHODS
+from lk_resolver import Resolver, children
+
+import copy
+
+'''
+AST优化
+在语法分析之后, 作用域解析之前运行
+常量折叠: 计算只含字面量的一元, 二元运算, 左操作数为字面量的and, or
+死代码消除: 删除条件为常量的if分支, 条件为假的while循环, 语句块中return, break, continue之后的语句
+函数内联: 把顶层定义的小箭头函数的调用替换为函数体, 参数赋值给临时变量
+'''
+
+# 折叠结果的大小上限, 避免在编译时生成过大的常量
+MAX_STRING_LENGTH = 4096
+MAX_INT_BITS = 128
+
+# 内联函数体的最大节点数
+INLINE_SIZE = 16
+
+# 内联时参数的临时变量名中的标记, 变量名中不能出现, 顶层的临时变量不作为全局变量提供给调用者
+TEMP_MARK = '$'
+
+# 可以内联的函数体中的节点, 不含赋值, 函数定义和跳转, 函数体的值只由参数和外层变量决定
+INLINE_NODES = (NumberNode, StringNode, ListNode, BlockNode, VarAccessNode, BinaryOpNode, UnaryOpNode, IfNode, CallNode)
+
+# AST优化器
+class Optimizer(object):
+
+    def __init__(self, inline_size=INLINE_SIZE):
+        '''
+        @param inline_size 内联函数体的最大节点数, 为0时不内联
+        '''
+        self.inline_size = inline_size
+        # 顶层程序的根节点
+        self.program = None
+        # 可以内联的函数, 函数名 -> (FuncNode, 函数体中的外层变量名)
+        self.inline_funcs = {}
+        # 外层函数的局部变量, 每层为变量名集合
+        self.scopes = []
+        # 变量名 -> 整个程序中的赋值次数
+        self.assign_count = {}
+        # 不是作为被调用的函数使用的变量名
+        self.escaped = set()
+        # 临时变量的编号
+        self.temp_count = 0
+        # 正在内联的函数名, 相互递归的函数不再内联彼此
+        self.inlining = []
+
+    def optimizeProgram(self, node):
+        '''
+        @param node parse()得到的根节点
+        @return 优化后的根节点
+        '''
+        self.program = node
+        self.collect(node)
+        return self.optimize(node)
+
+    def optimize(self, node):
+        '''
+        @param node AST节点
+        @return 优化后的节点
+        '''
+        method_name = f'optimize_{type(node).__name__}'
+        method = getattr(self, method_name, None)
+        if method is None:
+            return node
+        return method(node)
+
+    def isConst(self, node):
+        return isinstance(node, NumberNode) or isinstance(node, StringNode)
+
+    def constNode(self, value, pos_start, pos_end):
+        '''
+        用计算结果生成字面量节点, 位置与原表达式相同
+        '''
+        if type(value) is str:
+            return StringNode(Token(T_STRING, value, pos_start, pos_end))
+        elif type(value) is float:
+            return NumberNode(Token(T_FLOAT, value, pos_start, pos_end))
+        return NumberNode(Token(T_INT, value, pos_start, pos_end))
+
+    def tooLarge(self, method_name, left, right):
+        '''
+        结果可能过大时不折叠
+        '''
+        if method_name == 'powBy' and type(left) is int and type(right) is int:
+            return right > 0 and left.bit_length() * right > MAX_INT_BITS
+        if method_name == 'mulBy' and (type(left) is str or type(right) is str):
+            string, count = (left, right) if type(left) is str else (right, left)
+            return type(count) is not str and len(string) * count > MAX_STRING_LENGTH
+        return False
+
+    def optimize_BlockNode(self, node):
+        statements = []
+        for i in node.statement_nodes:
+            # 顶层定义的函数在之后的语句中可以内联, 在优化函数体之前记录
+            if node is self.program and isinstance(i, FuncNode):
+                self.registerInline(i)
+            statements.append(self.optimize(i))
+            # 之后的语句不会执行
+            if isinstance(i, (ReturnNode, ContinueNode, BreakNode)):
+                break
+        node.statement_nodes = statements
+        return node
+
+    def optimize_ListNode(self, node):
+        node.element_nodes = [self.optimize(i) for i in node.element_nodes]
+        return node
+
+    def optimize_VarAssignNode(self, node):
+        node.value_node = self.optimize(node.value_node)
+        return node
+
+    def optimize_AugAssignNode(self, node):
+        node.value_node = self.optimize(node.value_node)
+        return node
+
+    def optimize_BinaryOpNode(self, node):
+        node.lnode = self.optimize(node.lnode)
+        node.rnode = self.optimize(node.rnode)
+        if node.token.match(T_KEYWORD, 'and') or node.token.match(T_KEYWORD, 'or'):
+            return self.optimizeLogic(node)
+        if not (self.isConst(node.lnode) and self.isConst(node.rnode)):
+            return node
+
+        method_name = BINARY_METHODS.get(node.token.type)
+        if method_name is None:
+            return node
+
+        left, right = node.lnode.token.value, node.rnode.token.value
+        if self.tooLarge(method_name, left, right):
+            return node
+        try:
+            result, err = binaryOp(method_name, left, right)
+        except Exception:
+            # 不支持的运算留到运行时报告
+            return node
+        # 运行时错误需要按原表达式的位置报告, 不折叠
+        if err is not None:
+            return node
+        return self.constNode(result, node.pos_start, node.pos_end)
+
+    def optimizeLogic(self, node):
+        '''
+        左操作数为常量时, and, or的结果是其中一个操作数
+        '''
+        if not self.isConst(node.lnode):
+            return node
+        if bool(node.lnode.token.value) == node.token.match(T_KEYWORD, 'and'):
+            return node.rnode
+        return node.lnode
+
+    def optimize_UnaryOpNode(self, node):
+        node.node = self.optimize(node.node)
+        if not self.isConst(node.node):
+            return node
+
+        value = node.node.token.value
+        try:
+            if node.token.type == T_MINUS:
+                value = negate(value)
+            elif node.token.match(T_KEYWORD, 'not'):
+                value = logicNot(value)
+        except Exception:
+            return node
+        return self.constNode(value, node.pos_start, node.pos_end)
+
+    def optimize_IfNode(self, node):
+        case = []
+        first_case = None
+        else_case = node.else_case
+        for condition, expr in node.case:
+            condition = self.optimize(condition)
+            expr = self.optimize(expr)
+            if first_case is None:
+                first_case = (condition, expr)
+            if not self.isConst(condition):
+                case.append((condition, expr))
+            elif condition.token.value:
+                # 条件恒为真, 之后的分支都不会执行
+                else_case = expr
+                break
+        else:
+            if else_case is not None:
+                else_case = self.optimize(else_case)
+
+        if len(case) > 0:
+            node.case = case
+            node.else_case = else_case
+            return node
+        elif else_case is not None:
+            return else_case
+        # 没有可能执行的分支, 保留第一个分支使if的值仍为None
+        node.case = [first_case]
+        node.else_case = None
+        return node
+
+    def optimize_ForNode(self, node):
+        node.start_value_node = self.optimize(node.start_value_node)
+        node.end_value_node = self.optimize(node.end_value_node)
+        if node.step_value_node is not None:
+            node.step_value_node = self.optimize(node.step_value_node)
+        node.body_node = self.optimize(node.body_node)
+        return node
+
+    def optimize_WhileNode(self, node):
+        node.condition_node = self.optimize(node.condition_node)
+        node.body_node = self.optimize(node.body_node)
+        if self.isConst(node.condition_node) and not node.condition_node.token.value:
+            # 循环体不会执行, 值为空数组
+            return ListNode([], node.pos_start, node.pos_end)
+        return node
+
+    def optimize_FuncNode(self, node):
+        # 参数和函数体中赋值的变量会遮蔽同名的外层变量
+        names = [arg.value for arg in node.arg_name_tokens]
+        Resolver().declare(node.body_node, names)
+        self.scopes.append(set(names))
+        node.body_node = self.optimize(node.body_node)
+        self.scopes.pop()
+        return node
+
+    def optimize_CallNode(self, node):
+        node.func_node = self.optimize(node.func_node)
+        node.arg_nodes = [self.optimize(i) for i in node.arg_nodes]
+        inline = self.inline(node)
+        if inline is not None:
+            return inline
+        return node
+
+    def collect(self, node):
+        '''
+        统计整个程序中变量的赋值次数, 以及不是作为被调用的函数使用的变量名
+        '''
+        if isinstance(node, VarAssignNode) or isinstance(node, AugAssignNode):
+            self.countAssign(node.name_token.value)
+        elif isinstance(node, ForNode):
+            self.countAssign(node.var_name_token.value)
+        elif isinstance(node, ImportNode):
+            for i in node.name_tokens:
+                self.countAssign(i.value)
+        elif isinstance(node, FuncNode):
+            if node.name_token is not None:
+                self.countAssign(node.name_token.value)
+            self.collect(node.body_node)
+        elif isinstance(node, VarAccessNode):
+            self.escaped.add(node.name_token.value)
+        elif isinstance(node, CallNode) and isinstance(node.func_node, VarAccessNode):
+            for i in node.arg_nodes:
+                self.collect(i)
+            return
+        for i in children(node):
+            self.collect(i)
+
+    def countAssign(self, name):
+        self.assign_count[name] = self.assign_count.get(name, 0) + 1
+
+    def registerInline(self, node):
+        '''
+        记录可以内联的函数: 只定义一次且只被直接调用的箭头函数, 函数体是不递归的小表达式
+        '''
+        if node.name_token is None or not node.auto_return:
+            return
+        name = node.name_token.value
+        if self.assign_count.get(name) != 1 or name in self.escaped:
+            return
+        arg_name = [arg.value for arg in node.arg_name_tokens]
+        if len(set(arg_name)) != len(arg_name):
+            return
+
+        nodes = []
+        self.flatten(node.body_node, nodes)
+        if len(nodes) > self.inline_size:
+            return
+        free_names = set()
+        for i in nodes:
+            if not isinstance(i, INLINE_NODES):
+                return
+            if isinstance(i, VarAccessNode) and i.name_token.value not in arg_name:
+                free_names.add(i.name_token.value)
+        if name in free_names:
+            return
+        # 函数体之后会被原地优化, 保存未优化的副本, 每个调用点重新优化, 其中的内联使用新的临时变量
+        self.inline_funcs[name] = (node.arg_name_tokens, self.clone(node.body_node, {}), free_names)
+
+    def flatten(self, node, nodes):
+        nodes.append(node)
+        for i in children(node):
+            self.flatten(i, nodes)
+
+    def inline(self, node):
+        '''
+        内联函数调用, 不能内联时返回None
+        @param node CallNode
+        '''
+        if not isinstance(node.func_node, VarAccessNode) or node.func_node.name_token.value not in self.inline_funcs:
+            return None
+        name = node.func_node.name_token.value
+        if name in self.inlining:
+            return None
+        arg_name_tokens, body_node, free_names = self.inline_funcs[name]
+        # 参数个数不匹配时在运行时报错
+        if len(node.arg_nodes) != len(arg_name_tokens):
+            return None
+        # 调用点所在函数的局部变量不能遮蔽函数名和函数体中的外层变量
+        for scope in self.scopes:
+            if name in scope or not free_names.isdisjoint(scope):
+                return None
+
+        # 字面量参数直接替换, 其余参数按顺序赋值给临时变量, 临时变量名含有变量名中不能出现的TEMP_MARK
+        assign_nodes = []
+        args = {}
+        for arg, arg_node in zip(arg_name_tokens, node.arg_nodes):
+            if self.isConst(arg_node):
+                args[arg.value] = arg_node
+                continue
+            self.temp_count += 1
+            temp = f'{arg.value}{TEMP_MARK}{self.temp_count}'
+            assign_nodes.append(VarAssignNode(Token(T_IDENTIFIER, temp, arg_node.pos_start, arg_node.pos_end), arg_node))
+            args[arg.value] = temp
+
+        self.inlining.append(name)
+        body_node = self.optimize(self.clone(body_node, args))
+        self.inlining.pop()
+        # 字面量的值不会是None
+        if len(assign_nodes) == 0 and self.isConst(body_node):
+            return body_node
+        return InlineNode(node.func_node, assign_nodes, body_node, node.pos_start, node.pos_end)
+
+    def clone(self, node, args):
+        '''
+        复制函数体, 参数替换为字面量或临时变量
+        @param args 参数名 -> 字面量节点或临时变量名
+        '''
+        if isinstance(node, VarAccessNode) and node.name_token.value in args:
+            value = args[node.name_token.value]
+            if type(value) is str:
+                return VarAccessNode(Token(T_IDENTIFIER, value, node.pos_start, node.pos_end))
+            return copy.copy(value)
+
+        res = copy.copy(node)
+        if isinstance(node, BlockNode):
+            res.statement_nodes = [self.clone(i, args) for i in node.statement_nodes]
+        elif isinstance(node, ListNode):
+            res.element_nodes = [self.clone(i, args) for i in node.element_nodes]
+        elif isinstance(node, BinaryOpNode):
+            res.lnode = self.clone(node.lnode, args)
+            res.rnode = self.clone(node.rnode, args)
+        elif isinstance(node, UnaryOpNode):
+            res.node = self.clone(node.node, args)
+        elif isinstance(node, IfNode):
+            res.case = [(self.clone(condition, args), self.clone(expr, args)) for condition, expr in node.case]
+            if node.else_case is not None:
+                res.else_case = self.clone(node.else_case, args)
+        elif isinstance(node, CallNode):
+            res.func_node = self.clone(node.func_node, args)
+            res.arg_nodes = [self.clone(i, args) for i in node.arg_nodes]
+        return res
+
+    def optimize_InlineNode(self, node):
+        node.assign_nodes = [self.optimize(i) for i in node.assign_nodes]
+        node.body_node = self.optimize(node.body_node)
+        return node
+
+    def optimize_ReturnNode(self, node):
+        if node.node is not None:
+            node.node = self.optimize(node.node)
+        return node
\ No newline at end of file
@@ -2,17 +2,62 @@
 # -*- coding: utf-8 -*-
 
 from lk_token import *
-from lk_error import InvalidSyntaxError
+from lk_error import InvalidSyntaxError, LexException, SyntaxException
 from lk_ast_node import *
 
+'''
+语法分析
+语句由当前Token决定分析方式, 不回退, Token按需读取, 只保存当前Token
+表达式由优先级爬升分析, 一次调用处理同一层的所有二元运算
+语法错误由SyntaxException向外传递, parse返回ParserResult
+'''
+
+# 二元运算的优先级, 数值越大结合越紧
+PREC_LOGIC = 1 # and or
+PREC_COMP = 2 # == != < > <= >=, not的操作数
+PREC_ARITH = 3 # + -
+PREC_TERM = 4 # * / %
+PREC_FACTOR = 5 # 一元+ -的操作数, **的右操作数
+PREC_POWER = 6 # **
+
+BINARY_PRECEDENCE = {
+    T_EE: PREC_COMP,
+    T_NE: PREC_COMP,
+    T_LT: PREC_COMP,
+    T_GT: PREC_COMP,
+    T_LTE: PREC_COMP,
+    T_GTE: PREC_COMP,
+    T_PLUS: PREC_ARITH,
+    T_MINUS: PREC_ARITH,
+    T_MUL: PREC_TERM,
+    T_DIV: PREC_TERM,
+    T_MOD: PREC_TERM,
+    T_POW: PREC_POWER
+}
+
+KEYWORD_PRECEDENCE = {
+    'and': PREC_LOGIC,
+    'or': PREC_LOGIC
+}
+
+# 可以开始表达式的Token
+EXPR_TYPES = {T_INT, T_FLOAT, T_STRING, T_IDENTIFIER, T_LPAREN, T_LBRACKET, T_PLUS, T_MINUS}
+EXPR_KEYWORDS = {'var', 'not', 'if', 'for', 'while', 'func'}
+# 可以开始语句的关键字
+STATEMENT_KEYWORDS = EXPR_KEYWORDS | {'return', 'continue', 'break', 'import'}
+
+# 语句块之后不是预期的Token时的错误信息
+CLOSING_ERRORS = {
+    T_EOF: "Expected '+', '-', '*' or '/'",
+    T_RBRACE: "Expected '}'"
+}
+
 # 语法解析结果
 class ParserResult(object):
 
     def __init__(self):
         self.error = None
         self.node = None
-        self.advance_cnt = 0
-        self.to_reverse_cnt = 0
 
     def success(self, node):
         self.node = node
@@ -22,272 +67,263 @@ class ParserResult(object):
         self.error = error
         return self
 
-    def registerAdvancement(self):
-        self.advance_cnt += 1
-
-    def register(self, res):
-        self.advance_cnt += res.advance_cnt
-        if res.error is not None:
-            self.error = res.error
-        return res.node
+# 语句块在token之前结束, 只在statements中使用
+class BlockEnd(Exception):
 
-    def tryRegister(self, res):
-        if res.error:
-            self.to_reverse_cnt = res.advance_cnt
-            return None
-        return self.register(res)
+    def __init__(self, token):
+        super().__init__()
+        self.token = token
 
 # 语法解析器
 class Parser(object):
 
     def __init__(self, tokens):
-        self.tokens = tokens
-        self.token_index = -1
-        self.advance()
+        '''
+        @param tokens Token的列表或迭代器, 迭代器在分析过程中按需读取, 最后一个Token为EOF
+        '''
+        self.tokens = iter(tokens)
+        self.current_token = None
 
     def advance(self):
-        self.token_index += 1
-        if self.token_index < len(self.tokens):
-            self.current_token = self.tokens[self.token_index]
+        # 读取完之后一直停留在EOF
+        self.current_token = next(self.tokens, self.current_token)
         return self.current_token
 
-    def reverse(self, amount=1):
+    def error(self, detail, token=None):
         '''
-        回退，反向advance
+        抛出语法错误, 默认位置为当前Token
         '''
-        self.token_index -= amount
-        self.updateCurrentToken()
-        return self.current_token
+        if token is None:
+            token = self.current_token
+        raise SyntaxException(InvalidSyntaxError(token.pos_start, token.pos_end, detail))
+
+    def expect(self, token_type, detail):
+        '''
+        跳过类型为token_type的当前Token, 否则抛出语法错误
+        '''
+        if self.current_token.type != token_type:
+            self.error(detail)
+        self.advance()
 
-    def updateCurrentToken(self):
-        if self.token_index >= 0 and self.token_index < len(self.tokens):
-            self.current_token = self.tokens[self.token_index]
+    def startsExpr(self, token):
+        if token.type == T_KEYWORD:
+            return token.value in EXPR_KEYWORDS
+        return token.type in EXPR_TYPES
 
-    def parse(self):
-        res = self.statements()
-        if res.error is None and self.current_token.type != T_EOF:
-            return res.failure(InvalidSyntaxError(self.current_token.pos_start, self.current_token.pos_end, "Expected '+', '-', '*' or '/'"))
-        return res
+    def startsStatement(self, token):
+        if token.type == T_KEYWORD:
+            return token.value in STATEMENT_KEYWORDS
+        return token.type in EXPR_TYPES
 
-    def statements(self):
+    def parse(self):
         '''
-        statements -> NEWLINE* expr (NEWLINE+ statement)* NEWLINE*
+        词法错误优先于语法错误, 出现语法错误时读取剩余的Token检查词法错误
         '''
         res = ParserResult()
+        try:
+            try:
+                self.advance()
+                return res.success(self.statements(T_EOF))
+            except SyntaxException as e:
+                for _ in self.tokens:
+                    pass
+                return res.failure(e.error)
+        except LexException as e:
+            return res.failure(e.error)
+
+    def statements(self, closing):
+        '''
+        statements -> NEWLINE* statement (NEWLINE+ statement)* NEWLINE*
+        NEWLINE之后不能开始语句时语句块结束, 之后必须是closing
+        无法分析的语句不属于语句块, 在语句开始处报告语句块没有结束
+        @param closing 语句块之后的Token类型, RBRACE或EOF, 不跳过
+        '''
         statements = []
-        pos_start = self.current_token.pos_start.copy()
+        pos_start = self.current_token.pos_start
 
         while self.current_token.type == T_NEWLINE:
-            res.registerAdvancement()
             self.advance()
 
-        statement = res.register(self.statement())
-        if res.error is not None:
-            return res
-        statements.append(statement)
-
-        more_statements = True
-        while True:
-            newline_cnt = 0
+        try:
+            statements.append(self.statement())
             while self.current_token.type == T_NEWLINE:
-                res.registerAdvancement()
-                self.advance()
-                newline_cnt += 1
-            if newline_cnt == 0:
-                more_statements = False
-            if not more_statements:
-                break
-            statement = res.tryRegister(self.statement())
-            if statement is None:
-                self.reverse(res.to_reverse_cnt)
-                more_statements = False
-                continue
-            statements.append(statement)
-
-        return res.success(ListNode(statements, pos_start, self.current_token.pos_end.copy()))
+                while self.current_token.type == T_NEWLINE:
+                    self.advance()
+                token = self.current_token
+                if not self.startsStatement(token):
+                    break
+                try:
+                    statements.append(self.statement())
+                except SyntaxException:
+                    raise BlockEnd(token)
+        except BlockEnd as e:
+            self.error(CLOSING_ERRORS[closing], e.token)
+
+        if self.current_token.type != closing:
+            self.error(CLOSING_ERRORS[closing])
+        return BlockNode(statements, pos_start, self.current_token.pos_end)
 
     def statement(self):
         '''
         statement -> KEYWORD:return expr?
                   -> KEYWORD:continue
                   -> KEYWORD:break
+                  -> import-statement
                   -> expr
+        无法分析的返回值不属于return语句, 语句块在返回值之前结束
         '''
-        res = ParserResult()
-        pos_start = self.current_token.pos_start.copy()
-
-        if self.current_token.match(T_KEYWORD, 'return'):
-            res.registerAdvancement()
-            self.advance()
+        token = self.current_token
 
-            expr = res.tryRegister(self.expr())
-            if expr is None:
-                self.reverse(res.to_reverse_cnt)
-            return res.success(ReturnNode(expr, pos_start, self.current_token.pos_start.copy()))
+        if token.type == T_KEYWORD:
+            if token.value == 'return':
+                self.advance()
+                expr = None
+                if self.startsExpr(self.current_token):
+                    value_token = self.current_token
+                    try:
+                        expr = self.expr()
+                    except SyntaxException:
+                        raise BlockEnd(value_token)
+                return ReturnNode(expr, token.pos_start, self.current_token.pos_start)
+
+            elif token.value == 'continue':
+                self.advance()
+                return ContinueNode(token.pos_start, self.current_token.pos_start)
 
-        elif self.current_token.match(T_KEYWORD, 'continue'):
-            res.registerAdvancement()
-            self.advance()
-            return res.success(ContinueNode(pos_start, self.current_token.pos_start.copy()))
+            elif token.value == 'break':
+                self.advance()
+                return BreakNode(token.pos_start, self.current_token.pos_start)
 
-        elif self.current_token.match(T_KEYWORD, 'break'):
-            res.registerAdvancement()
-            self.advance()
-            return res.success(BreakNode(pos_start, self.current_token.pos_start.copy()))
+            elif token.value == 'import':
+                return self.importStatement()
 
-        expr = res.register(self.expr())
-        if res.error is not None:
-            return res
-        return res.success(expr)
+        return self.expr()
 
-    def expr(self):
+    def importStatement(self):
         '''
-        expr -> KEYWORD: var IDENTIFIER EQ expr
-             -> IDENTIFIER EQ expr
-             -> comp (( KEYWORD: and | KEYWORD: or ) comp)*
+        import-statement -> KEYWORD:import IDENTIFIER (COMMA IDENTIFIER)* KEYWORD:from STRING
         '''
-        res = ParserResult()
+        pos_start = self.current_token.pos_start
+        self.advance()
 
-        if self.current_token.match(T_KEYWORD, 'var'):
-            res.registerAdvancement()
+        if self.current_token.type != T_IDENTIFIER:
+            self.error('Expected identifier')
+        name_tokens = [self.current_token]
+        self.advance()
+        while self.current_token.type == T_COMMA:
             self.advance()
-
             if self.current_token.type != T_IDENTIFIER:
-                return res.failure(InvalidSyntaxError(self.current_token.pos_start, self.current_token.pos_end, 'Expected identifier'))
-            var_name = self.current_token
-            res.registerAdvancement()
+                self.error('Expected identifier')
+            name_tokens.append(self.current_token)
             self.advance()
 
-            if self.current_token.type != T_EQ:
-                return res.failure(InvalidSyntaxError(self.current_token.pos_start, self.current_token.pos_end, "Expected '='"))
-            res.registerAdvancement()
-            self.advance()
+        if not self.current_token.match(T_KEYWORD, 'from'):
+            self.error("Expected ',' or 'from'")
+        self.advance()
+        if self.current_token.type != T_STRING:
+            self.error('Expected string')
+        path_token = self.current_token
+        self.advance()
+        return ImportNode(name_tokens, path_token, pos_start, path_token.pos_end)
 
-            expr = res.register(self.expr())
-            if res.error is not None:
-                return res
-            return res.success(VarAssignNode(var_name, expr, T_EQ))
+    def expr(self):
+        '''
+        expr -> KEYWORD:var IDENTIFIER EQ expr
+             -> IDENTIFIER (EQ | PLUSEQ | MINUSEQ | MULEQ | DIVEQ | POWEQ | MODEQ) expr
+             -> comp ((KEYWORD:and | KEYWORD:or) comp)*
+        '''
+        token = self.current_token
 
-        if self.current_token.type == T_IDENTIFIER:
+        if token.type == T_KEYWORD and token.value == 'var':
+            self.advance()
+            if self.current_token.type != T_IDENTIFIER:
+                self.error('Expected identifier')
             var_name = self.current_token
-            res.registerAdvancement()
             self.advance()
+            self.expect(T_EQ, "Expected '='")
+            return VarAssignNode(var_name, self.expr())
 
-            if self.current_token.type not in EQS:
-                self.reverse()
-                node = res.register(self.binOp(self.comp, ((T_KEYWORD, 'and'), (T_KEYWORD, 'or'))))
-                if res.error is not None:
-                    return res
-                return res.success(node)
-            eq = self.current_token.type
-            res.registerAdvancement()
+        if token.type == T_IDENTIFIER:
             self.advance()
+            eq = self.current_token
+            # 不是赋值时标识符是第一个操作数
+            if eq.type not in EQS:
+                return self.binary(PREC_LOGIC, self.call(VarAccessNode(token)))
+            self.advance()
+            expr = self.expr()
+            if eq.type == T_EQ:
+                return VarAssignNode(token, expr, False)
+            # 复合赋值在语法分析时转换为对应的二元运算
+            return AugAssignNode(token, Token(AUG_OPS[eq.type], None, eq.pos_start, eq.pos_end), expr)
 
-            expr = res.register(self.expr())
-            if res.error is not None:
-                return res
-            return res.success(VarAssignNode(var_name, expr, eq, False))
-
-        else:
-            node = res.register(self.binOp(self.comp, ((T_KEYWORD, 'and'), (T_KEYWORD, 'or'))))
-            if res.error is not None:
-                return res
-            return res.success(node)
+        return self.binary(PREC_LOGIC)
 
-    def comp(self):
+    def binary(self, precedence, left=None):
         '''
-        comp -> KEYWORD: not comp
-             -> arith (( EE | NE | LT | GT | LTE | GTE ) arith)*
+        comp -> arith ((EE | NE | LT | GT | LTE | GTE) arith)*
+        arith -> term ((PLUS | MINUS) term)*
+        term -> factor ((MUL | DIV | MOD) factor)*
+        power -> call (POW factor)*
+        分析优先级不低于precedence的二元运算, 同一优先级左结合, POW的右操作数是factor, 因此右结合
+        @param left 已经分析的第一个操作数
         '''
-        res = ParserResult()
+        if left is None:
+            left = self.unary(precedence)
 
-        if self.current_token.match(T_KEYWORD, 'not'):
+        while True:
             token = self.current_token
-            res.registerAdvancement()
+            if token.type == T_KEYWORD:
+                op_precedence = KEYWORD_PRECEDENCE.get(token.value)
+            else:
+                op_precedence = BINARY_PRECEDENCE.get(token.type)
+            if op_precedence is None or op_precedence < precedence:
+                return left
             self.advance()
-            node = res.register(self.comp())
-            if res.error is not None:
-                return res
-            return res.success(UnaryOpNode(token, node))
-
-        else:
-            node = res.register(self.binOp(self.arith, (T_EE, T_NE, T_LT, T_GT, T_LTE, T_GTE)))
-            if res.error is not None:
-                return res
-            return res.success(node)
-
-    def arith(self):
-        '''
-        arith -> term (( PLUS | MINUS ) term)*
-        '''
-        return self.binOp(self.term, (T_PLUS, T_MINUS))
-
-    def term(self):
-        '''
-        term -> factor (( MUL | DIV | MOD ) factor)*
-        '''
-        return self.binOp(self.factor, (T_MUL, T_DIV, T_MOD))
+            if op_precedence == PREC_POWER:
+                right = self.binary(PREC_FACTOR)
+            else:
+                right = self.binary(op_precedence + 1)
+            left = BinaryOpNode(left, token, right)
 
-    def factor(self):
+    def unary(self, precedence):
         '''
-        factor -> ( PLUS | MINUS ) factor
+        comp -> KEYWORD:not comp
+        factor -> (PLUS | MINUS) factor
                -> power
+        not只能出现在comp的位置
         '''
-        res = ParserResult()
         token = self.current_token
 
-        if token.type in (T_PLUS, T_MINUS):
-            res.registerAdvancement()
+        if token.type == T_PLUS or token.type == T_MINUS:
             self.advance()
-            factor = res.register(self.factor())
-            if res.error is not None:
-                return res
-            return res.success(UnaryOpNode(token, factor))
-        return self.power()
+            return UnaryOpNode(token, self.binary(PREC_FACTOR))
 
-    def power(self):
-        '''
-        power -> call (POW factor)*
-        '''
-        return self.binOp(self.call, (T_POW, ), self.factor)
+        if precedence <= PREC_COMP and token.type == T_KEYWORD and token.value == 'not':
+            self.advance()
+            return UnaryOpNode(token, self.binary(PREC_COMP))
+
+        return self.call(self.atom())
 
-    def call(self):
+    def call(self, atom):
         '''
-        call -> atom ( LPAREN ( IDENTIFIER (COMMA IDENTIFIER)* )? RPAREN )?
+        call -> atom (LPAREN (expr (COMMA expr)*)? RPAREN)?
+        @param atom 已经分析的atom
         '''
-        res = ParserResult()
-
-        atom = res.register(self.atom())
-        if res.error is not None:
-            return res
+        if self.current_token.type != T_LPAREN:
+            return atom
+        self.advance()
+        arg_nodes = []
 
-        if self.current_token.type == T_LPAREN:
-            res.registerAdvancement()
+        if self.current_token.type == T_RPAREN:
             self.advance()
-            arg_node = []
-
-            if self.current_token.type == T_RPAREN:
-                res.registerAdvancement()
-                self.advance()
-            else:
-                arg_node.append(res.register(self.expr()))
-                if res.error is not None:
-                    return res
-
-                while self.current_token.type == T_COMMA:
-                    res.registerAdvancement()
-                    self.advance()
-                    arg_node.append(res.register(self.expr()))
-                    if res.error is not None:
-                        return res
-
-                if self.current_token.type != T_RPAREN:
-                    return res.failure(InvalidSyntaxError(self.current_token.pos_start, self.current_token.pos_end, "Expected ',' or ')'"))
-                res.registerAdvancement()
+        else:
+            arg_nodes.append(self.expr())
+            while self.current_token.type == T_COMMA:
                 self.advance()
+                arg_nodes.append(self.expr())
+            self.expect(T_RPAREN, "Expected ',' or ')'")
 
-            return res.success(CallNode(atom, arg_node))
-        return res.success(atom)
+        return CallNode(atom, arg_nodes)
 
     def atom(self):
         '''
@@ -299,348 +335,164 @@ class Parser(object):
              -> while-expr
              -> func-expr
         '''
-        res = ParserResult()
         token = self.current_token
+        token_type = token.type
 
-        if token.type in (T_INT, T_FLOAT):
-            res.registerAdvancement()
+        if token_type == T_INT or token_type == T_FLOAT:
             self.advance()
-            return res.success(NumberNode(token))
+            return NumberNode(token)
 
-        elif token.type == T_STRING:
-            res.registerAdvancement()
+        elif token_type == T_IDENTIFIER:
             self.advance()
-            return res.success(StringNode(token))
+            return VarAccessNode(token)
 
-        elif token.type == T_IDENTIFIER:
-            res.registerAdvancement()
+        elif token_type == T_STRING:
             self.advance()
-            return res.success(VarAccessNode(token))
+            return StringNode(token)
 
-        elif token.type == T_LBRACKET:
-            list_expr = res.register(self.listExpr())
-            if res.error is not None:
-                return res
-            return res.success(list_expr)
+        elif token_type == T_LBRACKET:
+            return self.listExpr()
 
-        elif token.type == T_LPAREN:
-            res.registerAdvancement()
+        elif token_type == T_LPAREN:
             self.advance()
-            expr = res.register(self.expr())
-            if res.error is not None:
-                return res
-
-            if self.current_token.type == T_RPAREN:
-                res.registerAdvancement()
-                self.advance()
-                return res.success(expr)
-            else:
-                return res.failure(InvalidSyntaxError(self.current_token.pos_start, self.current_token.pos_end, "Expected ')'"))
-
-        elif token.match(T_KEYWORD, 'if'):
-            if_expr = res.register(self.ifExpr())
-            if res.error is not None:
-                return res
-            return res.success(if_expr)
-
-        elif token.match(T_KEYWORD, 'for'):
-            for_expr = res.register(self.forExpr())
-            if res.error is not None:
-                return res
-            return res.success(for_expr)
-
-        elif token.match(T_KEYWORD, 'while'):
-            while_expr = res.register(self.whileExpr())
-            if res.error is not None:
-                return res
-            return res.success(while_expr)
-
-        elif token.match(T_KEYWORD, 'func'):
-            func_expr = res.register(self.funcExpr())
-            if res.error is not None:
-                return res
-            return res.success(func_expr)
-
-        return res.failure(InvalidSyntaxError(token.pos_start, token.pos_end, "Expected int, float, identifier or '('"))
+            expr = self.expr()
+            self.expect(T_RPAREN, "Expected ')'")
+            return expr
+
+        elif token_type == T_KEYWORD:
+            if token.value == 'if':
+                return self.ifExpr()
+            elif token.value == 'for':
+                return self.forExpr()
+            elif token.value == 'while':
+                return self.whileExpr()
+            elif token.value == 'func':
+                return self.funcExpr()
+
+        self.error("Expected int, float, identifier or '('")
 
     def listExpr(self):
         '''
-        list-expr -> LBRACKET ( expr (COMMA expr)* )? RBRACKET
+        list-expr -> LBRACKET (expr (COMMA expr)*)? RBRACKET
         '''
-        res = ParserResult()
         elements = []
-        pos_start = self.current_token.pos_start.copy()
-
-        if self.current_token.type != T_LBRACKET:
-            return res.failure(InvalidSyntaxError(self.current_token.pos_start, self.current_token.pos_end, "Expected '['"))
-        res.registerAdvancement()
+        pos_start = self.current_token.pos_start
         self.advance()
 
         if self.current_token.type == T_RBRACKET:
-            res.registerAdvancement()
             self.advance()
         else:
-            elements.append(res.register(self.expr()))
-            if res.error is not None:
-                return res
-
+            elements.append(self.expr())
             while self.current_token.type == T_COMMA:
-                res.registerAdvancement()
                 self.advance()
-                elements.append(res.register(self.expr()))
-                if res.error is not None:
-                    return res
-
+                elements.append(self.expr())
             if self.current_token.type != T_RBRACKET:
-                return res.failure(InvalidSyntaxError(self.current_token.pos_start, self.current_token.pos_end, "Expected ',' or ']'"))
-            res.registerAdvancement()
+                self.error("Expected ',' or ']'")
             self.advance()
 
-        return res.success(ListNode(elements, pos_start, self.current_token.pos_end.copy()))
+        return ListNode(elements, pos_start, self.current_token.pos_end)
+
+    def block(self):
+        '''
+        LBRACE statements RBRACE
+        '''
+        self.expect(T_LBRACE, "Expected '{'")
+        body = self.statements(T_RBRACE)
+        self.advance()
+        return body
 
     def ifExpr(self):
         '''
         if-expr -> KEYWORD:if expr LBRACE statements RBRACE
-                   ( KEYWORD:elif expr LBRACE statements RBRACE )*
-                   ( KEYWORD:else LBRACE statements RBRACE )?
+                   (KEYWORD:elif expr LBRACE statements RBRACE)*
+                   (KEYWORD:else LBRACE statements RBRACE)?
         '''
-        res = ParserResult()
         case = [] # if + 多个elif
         else_case = None
 
-        if not self.current_token.match(T_KEYWORD, 'if'):
-            return res.failure(InvalidSyntaxError(self.current_token.pos_start, self.current_token.pos_end, "Expected 'if'"))
-        res.registerAdvancement()
-        self.advance()
-        condition = res.register(self.expr())
-        if res.error is not None:
-            return res
-
-        if self.current_token.type != T_LBRACE:
-            return res.failure(InvalidSyntaxError(self.current_token.pos_start, self.current_token.pos_end, "Expected '{'"))
-        res.registerAdvancement()
-        self.advance()
-        expr = res.register(self.statements())
-        if res.error is not None:
-            return res
-
-        if self.current_token.type != T_RBRACE:
-            return res.failure(InvalidSyntaxError(self.current_token.pos_start, self.current_token.pos_end, "Expected '}'"))
-        res.registerAdvancement()
         self.advance()
+        condition = self.expr()
+        case.append((condition, self.block()))
 
-        case.append((condition, expr))
         while self.current_token.match(T_KEYWORD, 'elif'):
-            res.registerAdvancement()
             self.advance()
-            condition = res.register(self.expr())
-            if res.error is not None:
-                return res
-
-            if self.current_token.type != T_LBRACE:
-                return res.failure(InvalidSyntaxError(self.current_token.pos_start, self.current_token.pos_end, "Expected '{'"))
-            res.registerAdvancement()
-            self.advance()
-            expr = res.register(self.statements())
-            if res.error is not None:
-                return res
-
-            if self.current_token.type != T_RBRACE:
-                return res.failure(InvalidSyntaxError(self.current_token.pos_start, self.current_token.pos_end, "Expected '}'"))
-            res.registerAdvancement()
-            self.advance()
-
-            case.append((condition, expr))
+            condition = self.expr()
+            case.append((condition, self.block()))
 
         if self.current_token.match(T_KEYWORD, 'else'):
-            res.registerAdvancement()
-            self.advance()
-            if self.current_token.type != T_LBRACE:
-                return res.failure(InvalidSyntaxError(self.current_token.pos_start, self.current_token.pos_end, "Expected '{'"))
-            res.registerAdvancement()
-            self.advance()
-            else_case = res.register(self.statements())
-            if res.error is not None:
-                return res
-
-            if self.current_token.type != T_RBRACE:
-                return res.failure(InvalidSyntaxError(self.current_token.pos_start, self.current_token.pos_end, "Expected '}'"))
-            res.registerAdvancement()
             self.advance()
+            else_case = self.block()
 
-        return res.success(IfNode(case, else_case))
+        return IfNode(case, else_case)
 
     def forExpr(self):
         '''
         for-expr -> KEYWORD:for IDENTIFIER EQ expr KEYWORD:to expr (KEYWORD:step expr)? LBRACE statements RBRACE
         '''
-        res = ParserResult()
-
-        if not self.current_token.match(T_KEYWORD, 'for'):
-            return res.failure(InvalidSyntaxError(self.current_token.pos_start, self.current_token.pos_end, "Expected 'for'"))
-        res.registerAdvancement()
         self.advance()
 
         if self.current_token.type != T_IDENTIFIER:
-            return res.failure(InvalidSyntaxError(self.current_token.pos_start, self.current_token.pos_end, "Expected identifier"))
+            self.error('Expected identifier')
         var_name = self.current_token
-        res.registerAdvancement()
         self.advance()
 
-        if self.current_token.type != T_EQ:
-            return res.failure(InvalidSyntaxError(self.current_token.pos_start, self.current_token.pos_end, "Expected '='"))
-        res.registerAdvancement()
-        self.advance()
-        start_value = res.register(self.expr())
-        if res.error is not None:
-            return res
+        self.expect(T_EQ, "Expected '='")
+        start_value = self.expr()
 
         if not self.current_token.match(T_KEYWORD, 'to'):
-            return res.failure(InvalidSyntaxError(self.current_token.pos_start, self.current_token.pos_end, "Expected 'to'"))
-        res.registerAdvancement()
+            self.error("Expected 'to'")
         self.advance()
-        end_value = res.register(self.expr())
-        if res.error is not None:
-            return res
+        end_value = self.expr()
 
         step_value = None
         if self.current_token.match(T_KEYWORD, 'step'):
-            res.registerAdvancement()
             self.advance()
-            step_value = res.register(self.expr())
-            if res.error is not None:
-                return res
+            step_value = self.expr()
 
-        if self.current_token.type != T_LBRACE:
-            return res.failure(InvalidSyntaxError(self.current_token.pos_start, self.current_token.pos_end, "Expected '{'"))
-        res.registerAdvancement()
-        self.advance()
-        body = res.register(self.statements())
-        if res.error is not None:
-            return res
-
-        if self.current_token.type != T_RBRACE:
-            return res.failure(InvalidSyntaxError(self.current_token.pos_start, self.current_token.pos_end, "Expected '}'"))
-        res.registerAdvancement()
-        self.advance()
-
-        return res.success(ForNode(var_name, start_value, end_value, step_value, body))
+        return ForNode(var_name, start_value, end_value, step_value, self.block())
 
     def whileExpr(self):
         '''
         while-expr -> KEYWORD:while expr LBRACE statements RBRACE
         '''
-        res = ParserResult()
-
-        if not self.current_token.match(T_KEYWORD, 'while'):
-            return res.failure(InvalidSyntaxError(self.current_token.pos_start, self.current_token.pos_end, "Expected 'while'"))
-        res.registerAdvancement()
-        self.advance()
-
-        condition = res.register(self.expr())
-        if res.error is not None:
-            return res
-
-        if self.current_token.type != T_LBRACE:
-            return res.failure(InvalidSyntaxError(self.current_token.pos_start, self.current_token.pos_end, "Expected '{'"))
-        res.registerAdvancement()
         self.advance()
-        body = res.register(self.statements())
-        if res.error is not None:
-            return res
-
-        if self.current_token.type != T_RBRACE:
-            return res.failure(InvalidSyntaxError(self.current_token.pos_start, self.current_token.pos_end, "Expected '}'"))
-        res.registerAdvancement()
-        self.advance()
-
-        return res.success(WhileNode(condition, body))
+        condition = self.expr()
+        return WhileNode(condition, self.block())
 
     def funcExpr(self):
         '''
-        func-expr -> KEYWORD:func IDENTIFIER? LPAREN ( IDENTIFIER (COMMA IDENTIFIER)* )? RPAREN ARROW expr
-                  -> KEYWORD:func IDENTIFIER? LPAREN ( IDENTIFIER (COMMA IDENTIFIER)* )? RPAREN ARROW LBRACE statements RBRACE
+        func-expr -> KEYWORD:func IDENTIFIER? LPAREN (IDENTIFIER (COMMA IDENTIFIER)*)? RPAREN ARROW expr
+                  -> KEYWORD:func IDENTIFIER? LPAREN (IDENTIFIER (COMMA IDENTIFIER)*)? RPAREN ARROW LBRACE statements RBRACE
         '''
-        res = ParserResult()
-
-        if not self.current_token.match(T_KEYWORD, 'func'):
-            return res.failure(InvalidSyntaxError(self.current_token.pos_start, self.current_token.pos_end, "Expected 'func'"))
-        res.registerAdvancement()
         self.advance()
 
         var_name = None
         if self.current_token.type == T_IDENTIFIER:
             var_name = self.current_token
-            res.registerAdvancement()
             self.advance()
 
-        if self.current_token.type != T_LPAREN:
-            return res.failure(InvalidSyntaxError(self.current_token.pos_start, self.current_token.pos_end, "Expected '('"))
-        res.registerAdvancement()
-        self.advance()
+        self.expect(T_LPAREN, "Expected '('")
 
         arg_name = []
         if self.current_token.type == T_IDENTIFIER:
             arg_name.append(self.current_token)
-            res.registerAdvancement()
             self.advance()
             while self.current_token.type == T_COMMA:
-                res.registerAdvancement()
                 self.advance()
                 if self.current_token.type != T_IDENTIFIER:
-                    return res.failure(InvalidSyntaxError(self.current_token.pos_start, self.current_token.pos_end, "Expected identifier"))
+                    self.error('Expected identifier')
                 arg_name.append(self.current_token)
-                res.registerAdvancement()
                 self.advance()
 
-        if self.current_token.type != T_RPAREN:
-            return res.failure(InvalidSyntaxError(self.current_token.pos_start, self.current_token.pos_end, "Expected '('"))
-        res.registerAdvancement()
-        self.advance()
-
-        if self.current_token.type != T_ARROW:
-            return res.failure(InvalidSyntaxError(self.current_token.pos_start, self.current_token.pos_end, "Expected '->'"))
-        res.registerAdvancement()
-        self.advance()
+        self.expect(T_RPAREN, "Expected '('")
+        self.expect(T_ARROW, "Expected '->'")
 
         if self.current_token.type == T_LBRACE:
-            res.registerAdvancement()
-            self.advance()
-            return_node = res.register(self.statements())
-            if res.error is not None:
-                return res
+            return FuncNode(var_name, arg_name, self.block(), False)
 
-            if self.current_token.type != T_RBRACE:
-                return res.failure(InvalidSyntaxError(self.current_token.pos_start, self.current_token.pos_end, "Expected '}'"))
-            res.registerAdvancement()
-            self.advance()
-
-            return res.success(FuncNode(var_name, arg_name, return_node, False))
-
-        else:
-            return_node = res.register(self.expr())
-            if res.error is not None:
-                return res.failure(InvalidSyntaxError(self.current_token.pos_start, self.current_token.pos_end, "Expected int, float, identifier, '(' or '{'"))
-            res.registerAdvancement()
-            self.advance()
-
-            return res.success(FuncNode(var_name, arg_name, return_node, True))
-
-    def binOp(self, func_a, ops, func_b=None):
-        # 递归调用，构建AST
-        if func_b is None:
-            func_b = func_a
-        res = ParserResult()
-
-        left = res.register(func_a())
-        if res.error is not None:
-            return res
-        while self.current_token.type in ops or (self.current_token.type, self.current_token.value) in ops:
-            token = self.current_token
-            res.registerAdvancement()
-            self.advance()
-            right = res.register(func_b())
-            if res.error is not None:
-                return res
-            left = BinaryOpNode(left, token, right)
-        return res.success(left)
\ No newline at end of file
+        try:
+            return_node = self.expr()
+        except SyntaxException as e:
+            raise SyntaxException(InvalidSyntaxError(e.error.pos_start, e.error.pos_end, "Expected int, float, identifier, '(' or '{'"))
+        self.advance()
+        return FuncNode(var_name, arg_name, return_node, True)
\ No newline at end of file
@@ -1,28 +1,149 @@
 #!/usr/bin/env python3
 # -*- coding: utf-8 -*-
 
-class Position(object):
+import bisect
+import weakref
 
-    def __init__(self, index, ln, col, file, text):
+'''
+源代码位置
+所有源代码共用一个整数位置空间, 每个源代码占用从base开始的一段
+Token和AST节点中的位置只是整数, 报告错误时才由位置找到源代码, 计算行号和列号
+'''
+
+# 源代码
+class Source(object):
+
+    def __init__(self, file, text, base):
         '''
-        @param index 索引
-        @param ln 行号
-        @param col 列号
         @param file 文件
         @param text 内容
+        @param base 第一个字符的位置
         '''
-        self.index = index
-        self.ln = ln
-        self.col = col
         self.file = file
         self.text = text
+        self.base = base
+        self.line_starts = None
+        # 第一行的行号, 交互式Shell中单独分析的语句是缓冲区的一部分
+        self.first_line = 0
+        # 引用源代码中的位置的对象数, 由SourceSet.hold增加
+        self.refs = 0
+
+    def line(self, pos):
+        '''
+        行号, 从0开始
+        '''
+        return self.lineIndex(pos) + self.first_line
+
+    def column(self, pos):
+        '''
+        列号, 从0开始
+        '''
+        index = self.lineIndex(pos)
+        return pos - self.base - self.line_starts[index]
+
+    def lineIndex(self, pos):
+        '''
+        位置在text中的行号
+        '''
+        if self.line_starts is None:
+            # 每行第一个字符的索引, 第一次报告错误时才计算
+            self.line_starts = [0]
+            index = self.text.find('\n')
+            while index != -1:
+                self.line_starts.append(index + 1)
+                index = self.text.find('\n', index + 1)
+        return bisect.bisect_right(self.line_starts, pos - self.base) - 1
+
+# 位置空间
+class SourceSet(object):
+
+    def __init__(self):
+        self.bases = []
+        self.sources = []
+        self.next_base = 0
+        # (文件, 内容) -> 由share登记的源代码
+        self.shared = {}
+
+    def add(self, file, text):
+        '''
+        为源代码分配一段位置
+        文件末尾之后还有EOF和未结束的字符串的位置
+        '''
+        source = Source(file, text, self.next_base)
+        self.insert(source)
+        self.next_base += len(text) + 3
+        return source
+
+    def share(self, file, text):
+        '''
+        登记源代码, 已登记相同的文件和内容时复用, 同一脚本多次编译时位置空间不增长
+        相同的内容分析得到相同的位置, 复用的源代码中的位置不会混淆
+        @return 源代码, 引用数加1, 不再使用时调用release, 不调用时一直保留
+        '''
+        source = self.shared.get((file, text))
+        if source is None:
+            source = self.add(file, text)
+            self.shared[(file, text)] = source
+        source.refs += 1
+        return source
+
+    def hold(self, source, owner):
+        '''
+        源代码在owner被回收之前保留, 所有owner都被回收后移除
+        之后移除的位置不再分配, 但也不能再报告其中的错误
+        @param owner 引用源代码中的位置的对象, 如编译后的脚本和错误
+        '''
+        source.refs += 1
+        weakref.finalize(owner, self.release, source)
+
+    def release(self, source):
+        source.refs -= 1
+        if source.refs > 0:
+            return
+        if self.shared.get((source.file, source.text)) is source:
+            del self.shared[(source.file, source.text)]
+        index = bisect.bisect_left(self.bases, source.base)
+        if index < len(self.sources) and self.sources[index] is source:
+            del self.bases[index]
+            del self.sources[index]
+
+    def reserve(self, file, text, base):
+        '''
+        在指定的位置登记源代码, 编译缓存中的程序读取后不需要重新计算位置
+        指定的位置远大于依次分配的位置
+        @return 源代码, 已在此位置登记相同的源代码时复用, 与其他源代码重叠时为None
+        '''
+        index = bisect.bisect_right(self.bases, base)
+        if index > 0:
+            prev = self.sources[index - 1]
+            if prev.base == base and prev.file == file and prev.text == text:
+                return prev
+            if prev.base + len(prev.text) + 3 > base:
+                return None
+        if index < len(self.bases) and self.bases[index] < base + len(text) + 3:
+            return None
+        source = Source(file, text, base)
+        self.insert(source)
+        return source
+
+    def insert(self, source):
+        index = bisect.bisect_right(self.bases, source.base)
+        self.bases.insert(index, source.base)
+        self.sources.insert(index, source)
+
+    def find(self, pos):
+        '''
+        位置所在的源代码
+        '''
+        return self.sources[bisect.bisect_right(self.bases, pos) - 1]
+
+    def file(self, pos):
+        return self.find(pos).file
+
+    def line(self, pos):
+        return self.find(pos).line(pos)
 
-    def advance(self, current_char):
-        self.index += 1
-        self.col += 1
-        if current_char == '\n':
-            self.col = 0
-            self.ln += 1
+    def column(self, pos):
+        return self.find(pos).column(pos)
 
-    def copy(self):
-        return Position(self.index, self.ln, self.col, self.file, self.text)
\ No newline at end of file
+sources = SourceSet()
\ No newline at end of file
@@ -0,0 +1,143 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+from lk_ast_node import *
+
+'''
+作用域解析
+在语法分析之后运行, 把每个变量绑定到(层数, 槽位)
+函数的局部变量存放在调用帧的槽位中, 全局变量和内建变量仍按名字在符号表中查找
+
+解析结果记录在AST节点上:
+VarAccessNode.scope, VarAssignNode.scope, AugAssignNode.scope 读取变量时依次尝试的位置
+VarAssignNode.slot, AugAssignNode.slot, ForNode.slot, FuncNode.slot 写入变量的槽位, 为None时写入全局符号表
+FuncNode.slot_count 函数调用帧的槽位数
+'''
+
+def children(node):
+    '''
+    子节点, 不包括函数体
+    '''
+    if isinstance(node, BlockNode):
+        return node.statement_nodes
+    elif isinstance(node, ListNode):
+        return node.element_nodes
+    elif isinstance(node, VarAssignNode) or isinstance(node, AugAssignNode):
+        return [node.value_node]
+    elif isinstance(node, BinaryOpNode):
+        return [node.lnode, node.rnode]
+    elif isinstance(node, UnaryOpNode):
+        return [node.node]
+    elif isinstance(node, IfNode):
+        res = []
+        for condition, expr in node.case:
+            res += [condition, expr]
+        if node.else_case is not None:
+            res.append(node.else_case)
+        return res
+    elif isinstance(node, ForNode):
+        res = [node.start_value_node, node.end_value_node]
+        if node.step_value_node is not None:
+            res.append(node.step_value_node)
+        res.append(node.body_node)
+        return res
+    elif isinstance(node, WhileNode):
+        return [node.condition_node, node.body_node]
+    elif isinstance(node, CallNode):
+        return [node.func_node] + node.arg_nodes
+    elif isinstance(node, ReturnNode):
+        return [node.node] if node.node is not None else []
+    elif isinstance(node, InlineNode):
+        return node.assign_nodes + [node.body_node]
+    return []
+
+# 作用域解析器
+class Resolver(object):
+
+    def __init__(self):
+        # 函数作用域栈, 每层为 变量名 -> 槽位
+        self.scopes = []
+
+    def resolve(self, node):
+        method_name = f'resolve_{type(node).__name__}'
+        method = getattr(self, method_name, self.resolveChildren)
+        method(node)
+        return node
+
+    def resolveChildren(self, node):
+        for i in children(node):
+            self.resolve(i)
+
+    def lookup(self, name):
+        '''
+        由内向外生成变量的查找链 (层数, 槽位, 外层查找链)
+        局部变量未赋值时继续在外层查找, 与原先符号表逐层查找的行为一致
+        最外层为全局符号表, 槽位为None
+        '''
+        scope = (len(self.scopes), None, None)
+        for i, symbols in enumerate(self.scopes):
+            if name in symbols:
+                scope = (len(self.scopes) - 1 - i, symbols[name], scope)
+        return scope
+
+    def target(self, name):
+        '''
+        赋值写入当前作用域
+        '''
+        if len(self.scopes) == 0:
+            return None
+        return self.scopes[-1][name]
+
+    def declare(self, node, names):
+        '''
+        收集函数体中赋值的变量, 不进入嵌套函数的函数体
+        '''
+        if isinstance(node, VarAssignNode) or isinstance(node, AugAssignNode):
+            names.append(node.name_token.value)
+        elif isinstance(node, ForNode):
+            names.append(node.var_name_token.value)
+        elif isinstance(node, FuncNode):
+            if node.name_token is not None:
+                names.append(node.name_token.value)
+            return
+        for i in children(node):
+            self.declare(i, names)
+
+    def resolve_VarAccessNode(self, node):
+        node.scope = self.lookup(node.name_token.value)
+
+    def resolve_VarAssignNode(self, node):
+        node.scope = self.lookup(node.name_token.value)
+        node.slot = self.target(node.name_token.value)
+        self.resolve(node.value_node)
+
+    def resolve_AugAssignNode(self, node):
+        self.resolve_VarAssignNode(node)
+
+    def resolve_InlineNode(self, node):
+        # 被调用的函数只在报告错误时读取
+        self.resolve(node.func_node)
+        self.resolveChildren(node)
+
+    def resolve_ForNode(self, node):
+        node.slot = self.target(node.var_name_token.value)
+        self.resolveChildren(node)
+
+    def resolve_FuncNode(self, node):
+        node.slot = self.target(node.name_token.value) if node.name_token is not None else None
+
+        # 参数占用前面的槽位, 同名参数以最后一个为准
+        symbols = {}
+        for i, arg in enumerate(node.arg_name_tokens):
+            symbols[arg.value] = i
+        node.slot_count = len(node.arg_name_tokens)
+        names = []
+        self.declare(node.body_node, names)
+        for name in names:
+            if name not in symbols:
+                symbols[name] = node.slot_count
+                node.slot_count += 1
+
+        self.scopes.append(symbols)
+        self.resolve(node.body_node)
+        self.scopes.pop()
\ No newline at end of file
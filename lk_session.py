@@ -0,0 +1,190 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+from lk_lexer import Lexer
+from lk_parser import Parser
+from lk_optimizer import Optimizer, INLINE_SIZE
+from lk_resolver import Resolver
+from lk_analyzer import ValueAnalyzer
+from lk_interpreter import Interpreter
+from lk_compiler import Compiler
+from lk_vm import VM, MAX_DEPTH
+from lk_closure import ClosureCompiler
+from lk_builtin import global_symbol_table
+from lk_ast_node import BlockNode
+from lk_engine import Engine
+
+from collections import OrderedDict
+import copy
+import re
+
+'''
+交互式会话
+缓冲区按顶层的换行符分为语句, 每条语句单独进行词法和语法分析, 分析结果按语句的文本缓存
+修改缓冲区后再次执行时, 只分析文本改变的语句, 其余语句使用缓存的AST
+函数定义编译后的函数体保存在FuncNode中, 再次执行时不重新编译
+顶层变量都在全局符号表中, 单独分析的语句与整个缓冲区一起分析得到的AST相同
+语法错误在出错的语句中报告, 而不是报告上一条语句之后应为运算符
+'''
+
+# 最多缓存的语句数, 超出时淘汰最久未使用的语句, 最后执行的缓冲区中的语句总是保留
+CACHE_SIZE = 1024
+
+# 划分语句时只区分注释, 字符串, 括号和分隔符, 规则与词法分析相同
+# 注释包括行尾的换行符, 不分隔语句
+SPLIT_REGEX = re.compile(r"//[^\n]*\n?|'(?:[^'\\]|\\.)*'?|[^/'(){}\[\]\n;]+|.", re.S)
+
+def splitStatements(text):
+    '''
+    按顶层的换行符, 分号和}划分语句, 不生成Token
+    @return 每条语句的(开始索引, 结束索引), 没有闭合的括号数
+    '''
+    statements = []
+    depth = 0
+    start = 0
+    # 当前语句是否包含注释和空白以外的内容
+    content = False
+    for m in SPLIT_REGEX.finditer(text):
+        char = text[m.start()]
+        if char == '\n' or char == ';':
+            if depth == 0:
+                if content:
+                    statements.append((start, m.start()))
+                start = m.end()
+                content = False
+            continue
+        if char in '([{':
+            depth += 1
+        elif char in ')]}':
+            depth = max(depth - 1, 0)
+        elif m.group().startswith('//') or m.group().isspace():
+            continue
+        content = True
+        # }之后可以直接开始新的语句
+        if char == '}' and depth == 0:
+            statements.append((start, m.end()))
+            start = m.end()
+            content = False
+    if content:
+        statements.append((start, len(text)))
+    return statements, depth
+
+# 交互式会话
+class Session(object):
+
+    def __init__(self, file='<stdin>', backend='interpreter', optimize=False, max_depth=MAX_DEPTH, inline_size=INLINE_SIZE, debug=False):
+        '''
+        @param file 报告错误时的文件名
+        @param backend 执行后端
+        @param optimize 是否进行常量折叠, 死代码消除和函数内联
+        @param max_depth vm后端的最大调用深度
+        @param inline_size 内联函数体的最大节点数
+        @param debug 是否输出重新分析的语句的Token和vm的字节码
+        '''
+        self.file = file
+        self.backend = backend
+        self.optimize = optimize
+        self.inline_size = inline_size
+        self.debug = debug
+        # 语句的文本 -> (Source, 语句的BlockNode), 按使用顺序排列
+        # 优化时缓存语法分析的结果, 每次执行前复制后对整个缓冲区优化, 否则缓存作用域解析和值使用分析之后的结果
+        self.cache = OrderedDict()
+        self.parsed = 0
+        self.reused = 0
+
+        # 导入的模块使用会话的执行后端和选项, 在会话中只加载一次
+        self.context = Engine(backend, optimize, max_depth, inline_size, not debug).newContext(global_symbol_table)
+        self.interpreter = Interpreter()
+        self.vm = VM(max_depth)
+        self.closure_compiler = ClosureCompiler()
+
+    def incomplete(self, text):
+        '''
+        缓冲区中是否有没有闭合的括号, 交互式Shell继续读取下一行
+        '''
+        _, depth = splitStatements(text)
+        return depth > 0
+
+    def parseStatement(self, text, first_line):
+        '''
+        分析一条语句
+        @param first_line 语句在缓冲区中的行号
+        @return 语句的BlockNode, 错误
+        '''
+        lexer = Lexer(self.file, text)
+        lexer.source.first_line = first_line
+        if self.debug:
+            tokens, err = lexer.makeTokens()
+            if err is not None:
+                return None, err
+            print(tokens)
+        else:
+            tokens = lexer.generateTokens()
+
+        ast = Parser(tokens).parse()
+        if ast.error is not None:
+            return None, ast.error
+        if not self.optimize:
+            Resolver().resolve(ast.node)
+            ValueAnalyzer().analyze(ast.node)
+        self.parsed += 1
+        return (lexer.source, ast.node), None
+
+    def parse(self, text):
+        '''
+        分析缓冲区, 文本没有改变的语句使用缓存
+        @return 所有语句组成的根节点, 错误
+        '''
+        statements = []
+        used = set()
+        line = 0
+        index = 0
+        for start, end in splitStatements(text)[0]:
+            line += text.count('\n', index, start)
+            index = start
+            key = text[start:end]
+            entry = self.cache.get(key)
+            # 同一缓冲区中重复的语句在不同的行, 重新分析
+            if entry is not None and key not in used:
+                self.cache.move_to_end(key)
+                entry[0].first_line = line
+                self.reused += 1
+            else:
+                entry, err = self.parseStatement(key, line)
+                if err is not None:
+                    return None, err
+                if key not in used:
+                    self.cache[key] = entry
+            used.add(key)
+            statements.append(entry[1])
+        # 当前缓冲区的语句都在末尾, 语句数超过CACHE_SIZE时也全部保留
+        while len(self.cache) > max(CACHE_SIZE, len(used)):
+            self.cache.popitem(last=False)
+
+        if len(statements) == 0:
+            return None, None
+        program = BlockNode([i for block in statements for i in block.statement_nodes], statements[0].pos_start, statements[-1].pos_end)
+        if self.optimize:
+            program = Optimizer(self.inline_size).optimizeProgram(copy.deepcopy(program))
+            Resolver().resolve(program)
+            ValueAnalyzer().analyze(program)
+        return program, None
+
+    def run(self, text):
+        '''
+        执行缓冲区, 全局变量在多次执行之间保留
+        @return 每条顶层语句的值组成的数组, 错误
+        '''
+        program, err = self.parse(text)
+        if program is None:
+            return None, err
+
+        if self.backend == 'vm':
+            code = Compiler.compileProgram(program)
+            if self.debug:
+                print(code.disassemble())
+            return self.vm.run(code, self.context)
+        elif self.backend == 'closure':
+            return self.closure_compiler.run(program, self.context)
+
+        return self.interpreter.run(program, self.context)
\ No newline at end of file
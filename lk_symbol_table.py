@@ -5,6 +5,14 @@
 符号表
 '''
 
+# 未赋值的局部变量槽位
+class Unbound(object):
+
+    def __repr__(self):
+        return '<unbound>'
+
+UNBOUND = Unbound()
+
 class SymbolTable(object):
 
     def __init__(self, parent=None):
@@ -12,11 +20,30 @@ class SymbolTable(object):
         self.symbols = {}
         # 作用域
         self.parent = parent
+        # 导入但还没有读取的变量, 变量名 -> LazyImport
+        self.imports = {}
 
     def get(self, name):
-        value = self.symbols.get(name, None)
-        if value is None and self.parent is not None:
-            return self.parent.get(name)
+        if name in self.symbols:
+            return self.symbols[name]
+        # 导入的变量遮蔽上层作用域中的同名变量, 如内建函数
+        if name in self.imports:
+            return self.resolveImport(name)
+        table = self.parent
+        while table is not None:
+            if name in table.symbols:
+                return table.symbols[name]
+            table = table.parent
+        return None
+
+    def resolveImport(self, name):
+        '''
+        第一次读取导入的变量时加载模块, 之后直接从符号表读取
+        '''
+        # 加载失败时保留, 再次读取时报告同一错误
+        value = self.imports[name].load()
+        del self.imports[name]
+        self.symbols[name] = value
         return value
 
     def set(self, name, value):
@@ -1,13 +1,6 @@
 #!/usr/bin/env python3
 # -*- coding: utf-8 -*-
 
-import string
-
-# 常量
-DIGITS = '0123456789'
-LETTERS = string.ascii_letters
-LETTERS_DIGITS = LETTERS + DIGITS
-
 # 类型
 T_INT = 'INT'
 T_FLOAT = 'FLOAT'
@@ -46,8 +39,18 @@ T_EOF = 'EOF' # 终止符
 
 EQS = (T_EQ, T_PLUSEQ, T_MINUSEQ, T_MULEQ, T_DIVEQ, T_POWEQ, T_MODEQ)
 
+# 复合赋值对应的二元运算
+AUG_OPS = {
+    T_PLUSEQ: T_PLUS,
+    T_MINUSEQ: T_MINUS,
+    T_MULEQ: T_MUL,
+    T_DIVEQ: T_DIV,
+    T_POWEQ: T_POW,
+    T_MODEQ: T_MOD
+}
+
 # 关键字
-KEYWORDS = (
+KEYWORDS = {
     'var',
     'and',
     'or',
@@ -62,18 +65,26 @@ KEYWORDS = (
     'func',
     'return',
     'continue',
-    'break'
-)
+    'break',
+    'import',
+    'from'
+}
 
 class Token(object):
 
+    __slots__ = ('type', 'value', 'pos_start', 'pos_end')
+
     def __init__(self, type_, value=None, pos_start=None, pos_end=None):
+        '''
+        @param pos_start 起始位置
+        @param pos_end 结束位置, 默认为起始位置的下一个字符
+        '''
         self.type = type_
         self.value = value
         if pos_start is not None:
-            self.pos_start = pos_start.copy()
-            self.pos_end = pos_start.copy()
-            self.pos_end.advance(self.value)
+            self.pos_start = pos_start
+            if pos_end is None:
+                pos_end = pos_start + 1
         if pos_end is not None:
             self.pos_end = pos_end
 
@@ -3,9 +3,10 @@
 
 from lk_error import *
 from lk_symbol_table import *
-import lk_interpreter
 
 import math
+import operator
+from collections import OrderedDict
 
 class Value(object):
 
@@ -133,7 +134,7 @@ class Number(Value):
     def __repr__(self):
         return str(self.value)
 
-# 内建变量
+# 内建变量, 运行时使用原始值, 见文件末尾
 Number.null = Number(0)
 Number.false = Number(0)
 Number.true = Number(1)
@@ -183,6 +184,26 @@ class List(Value):
     def __init__(self, elements):
         super().__init__()
         self.elements = elements
+        # 是否可能被多处引用, 为True时就地修改前先复制
+        self.shared = False
+
+    def extend(self, other):
+        '''
+        就地追加另一个数组的元素, 被多处引用时返回新数组
+        '''
+        if self.shared:
+            return List(self.elements + other.elements)
+        self.elements.extend(other.elements)
+        return self
+
+    def repeat(self, count):
+        '''
+        就地重复元素, 被多处引用时返回新数组
+        '''
+        if self.shared:
+            return List(self.elements * count)
+        self.elements *= count
+        return self
 
     def addBy(self, other):
         if isinstance(other, List):
@@ -209,86 +230,179 @@ class List(Value):
             return None, self.illegalOperation(other)
 
     def copy(self):
-        return List(self.elements).setContext(self.context).setPos(self.pos_start, self.pos_end)
+        res = List(self.elements).setContext(self.context).setPos(self.pos_start, self.pos_end)
+        # 副本与原数组共用元素
+        res.shared = True
+        return res
 
     def __str__(self):
-        return ', '.join([str(i) for i in self.elements])
+        return ', '.join([valueStr(i) for i in self.elements])
 
     def __repr__(self):
-        return f'[{", ".join([str(i) for i in self.elements])}]'
+        return f'[{str(self)}]'
 
 # 函数
 class Function(Value):
 
-    def __init__(self, name, arg_name, body_node, auto_return):
+    def __init__(self, name, arg_name, body_node, auto_return, slot_count=0):
+        '''
+        @param slot_count 调用帧的槽位数, 由Resolver计算
+        '''
         super().__init__()
         self.name = name or '<anonymous>'
         self.arg_name = arg_name
         self.body_node = body_node
         self.auto_return = auto_return
+        self.slot_count = slot_count
+        # 记忆化缓存, 由内建函数memo设置
+        self.memo = None
 
-    def execute(self, args, itp):
-        res = lk_interpreter.RunResult()
-
-        new_ctx = lk_interpreter.Context(self.name, self.context, self.pos_start)
-        new_ctx.symbol_table = SymbolTable(new_ctx.parent.symbol_table)
+    def setMemo(self, memo):
+        self.memo = memo
+        return self
 
+    def callPos(self, node):
+        '''
+        调用位置, 值本身不记录调用位置
+        @param node CallNode, 为None时使用函数定义的位置
+        '''
+        if node is None:
+            return self.pos_start, self.pos_end
+        return node.pos_start, node.pos_end
+
+    def checkArgs(self, args, pos_start, pos_end):
+        '''
+        检查参数个数, 不匹配时抛出RTException
+        '''
         if len(args) > len(self.arg_name):
-            return res.failure(RTError(self.pos_start, self.pos_end, f'{len(args) - len(self.arg_name)} more arguments passed into {self.name}', self.context))
+            raise RTException(RTError(pos_start, pos_end, f'{len(args) - len(self.arg_name)} more arguments passed into {self.name}', self.context))
         elif len(args) < len(self.arg_name):
-            return res.failure(RTError(self.pos_start, self.pos_end, f'{len(self.arg_name) - len(args)} fewer arguments passed into {self.name}', self.context))
-
-        for i in range(len(args)):
-            arg_name = self.arg_name[i]
-            arg_value = args[i]
-            arg_value.setContext(new_ctx)
-            new_ctx.symbol_table.set(arg_name, arg_value)
-
-        value = res.register(itp.visit(self.body_node, new_ctx))
-        if res.shouldReturn() and res.func_return_value is None:
-            return res
-        return_value = (value if self.auto_return else None) or res.func_return_value or Number.null
-        return res.success(return_value)
+            raise RTException(RTError(pos_start, pos_end, f'{len(self.arg_name) - len(args)} fewer arguments passed into {self.name}', self.context))
+
+    def execute(self, args, itp, node=None):
+        '''
+        @param args 参数
+        @param itp 解释器
+        @param node CallNode
+        @return 返回值, 出错时抛出RTException
+        '''
+        pos_start, pos_end = self.callPos(node)
+        self.checkArgs(args, pos_start, pos_end)
+        return self.invoke(args, itp, node)
+
+    def invoke(self, args, itp, node=None):
+        '''
+        调用参数个数已检查的函数, 调用点的内联缓存命中时直接调用
+        '''
+        memo = self.memo
+        key = memo.key(args) if memo is not None else None
+        if key is not None:
+            value = memo.get(key)
+            if value is not None:
+                return value
+
+        func = self
+        # 尾调用返回TailCall, 在此循环中执行, 不增加递归深度, 参数个数已在调用点检查
+        while True:
+            pos_start, _ = func.callPos(node)
+
+            # 参数占用前面的槽位
+            new_ctx = lk_interpreter.Context(func.name, func.context, pos_start, args + [UNBOUND] * (func.slot_count - len(args)))
+
+            try:
+                value = itp.visit(func.body_node, new_ctx)
+                if not func.auto_return:
+                    value = None
+            except lk_interpreter.ReturnSignal as e:
+                value = e.value
+            # break和continue不在此处理, 继续传给调用者
+            if type(value) is not lk_interpreter.TailCall:
+                break
+            func, args, node = value.func, value.args, value.node
+
+        if value is None:
+            value = NULL
+        if key is not None:
+            memo.put(key, value)
+        return value
 
     def copy(self):
-        return Function(self.name, self.arg_name, self.body_node, self.auto_return).setContext(self.context).setPos(self.pos_start, self.pos_end)
+        return Function(self.name, self.arg_name, self.body_node, self.auto_return, self.slot_count).setContext(self.context).setPos(self.pos_start, self.pos_end).setMemo(self.memo)
 
     def __repr__(self):
         return f'<function {self.name}>'
 
+# 记忆化缓存
+class Memo(object):
+
+    def __init__(self, max_size):
+        '''
+        @param max_size 最多缓存的结果数, 超出时淘汰最久未使用的结果
+        '''
+        self.max_size = max_size
+        # 参数 -> 返回值, 按使用顺序排列
+        self.cache = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+
+    def key(self, args):
+        '''
+        只缓存参数都是数字和字符串的调用, 数组等参数返回None, 不经过缓存
+        参数类型也作为键的一部分, 避免1, 1.0, true互相命中
+        '''
+        for i in args:
+            if type(i) not in NUMBER and type(i) is not str:
+                return None
+        return tuple(args), tuple(map(type, args))
+
+    def get(self, key):
+        '''
+        @return 缓存的返回值, 未命中时为None
+        '''
+        value = self.cache.get(key)
+        if value is None:
+            self.misses += 1
+            return None
+        self.hits += 1
+        self.cache.move_to_end(key)
+        return value
+
+    def put(self, key, value):
+        # 返回值同时被缓存引用
+        self.cache[key] = share(value)
+        if len(self.cache) > self.max_size:
+            self.cache.popitem(last=False)
+
 # 内建函数
 class BuiltinFunction(Function):
 
     def __init__(self, name):
-        super().__init__(name, None, None, None)
+        # 执行方法和参数名在创建时查找一次
+        self.method = getattr(self, f'execute_{name}', self.noExecuteMethod)
+        super().__init__(name, self.method.arg_name, None, None)
 
-    def execute(self, args, _):
-        res = lk_interpreter.RunResult()
+    def invoke(self, args, _, node=None):
+        pos_start, _ = self.callPos(node)
 
-        new_ctx = lk_interpreter.Context(self.name, self.context, self.pos_start)
+        new_ctx = lk_interpreter.Context(self.name, self.context, pos_start)
         new_ctx.symbol_table = SymbolTable()
 
-        method_name = f'execute_{self.name}'
-        method = getattr(self, method_name, self.noExecuteMethod)
-
-        if len(args) > len(method.arg_name):
-            return res.failure(RTError(self.pos_start, self.pos_end, f'{len(args) - len(method.arg_name)} more arguments passed into {self.name}', self.context))
-        elif len(args) < len(method.arg_name):
-            return res.failure(RTError(self.pos_start, self.pos_end, f'{len(method.arg_name) - len(args)} fewer arguments passed into {self.name}', self.context))
-
         for i in range(len(args)):
-            arg_name = method.arg_name[i]
-            arg_value = args[i]
-            arg_value.setContext(new_ctx)
+            arg_name = self.arg_name[i]
+            # 内建函数的错误信息需要参数的位置, 在包装值上记录, 不修改传入的值
+            arg_value = box(args[i])
+            # 函数的上下文是定义时的作用域, 不能替换
+            if not isinstance(arg_value, Function):
+                arg_value.setContext(new_ctx)
+            if node is not None:
+                arg_value.setPos(node.arg_nodes[i].pos_start, node.arg_nodes[i].pos_end)
             new_ctx.symbol_table.set(arg_name, arg_value)
 
-        return_value = res.register(method(new_ctx))
-        if res.shouldReturn():
-            return res
-        return res.success(return_value)
+        return self.method(new_ctx)
 
-    def noExecuteMethod(self, node, context):
+    def noExecuteMethod(self, ctx):
         raise Exception(f'No execute_{self.name}')
+    noExecuteMethod.arg_name = []
 
     def copy(self):
         return BuiltinFunction(self.name).setContext(self.context).setPos(self.pos_start, self.pos_end)
@@ -299,27 +413,158 @@ class BuiltinFunction(Function):
 
 
     def execute_print(self, ctx):
-        print(ctx.symbol_table.get('value').value)
-        return lk_interpreter.RunResult().success(Number.null)
+        # 数组按元素输出, 函数输出其表示
+        print(unbox(ctx.symbol_table.get('value')))
+        return NULL
     execute_print.arg_name = ['value']
 
     def execute_input(self, ctx):
-        return lk_interpreter.RunResult().success(String(input()))
+        return input()
     execute_input.arg_name = []
 
     def execute_int(self, ctx):
         value = ctx.symbol_table.get('value')
         try:
-            return lk_interpreter.RunResult().success(Number(int(value.value)))
+            return int(value.value)
         except ValueError:
-            return lk_interpreter.RunResult().failure(RTError(value.pos_start, value.pos_end, f'{value} cannot be converted to an int', value.context))
+            raise RTException(RTError(value.pos_start, value.pos_end, f'{value} cannot be converted to an int', value.context))
     execute_int.arg_name = ['value']
 
     def execute_str(self, ctx):
-        return lk_interpreter.RunResult().success(String(str(ctx.symbol_table.get('value').value)))
+        return str(unbox(ctx.symbol_table.get('value')))
     execute_str.arg_name = ['value']
 
+    def execute_memo(self, ctx):
+        func = ctx.symbol_table.get('func')
+        size = ctx.symbol_table.get('size')
+        if not isinstance(func, Function) or isinstance(func, BuiltinFunction):
+            raise RTException(RTError(func.pos_start, func.pos_end, f'{func} cannot be memoised', func.context))
+        max_size = unbox(size)
+        if type(max_size) is not int or max_size <= 0:
+            raise RTException(RTError(size.pos_start, size.pos_end, f'{size} is not a positive int', size.context))
+        # func是传入函数的副本, 原函数不受影响
+        return func.setMemo(Memo(max_size))
+    execute_memo.arg_name = ['func', 'size']
+
+    def execute_memo_stats(self, ctx):
+        func = ctx.symbol_table.get('func')
+        if getattr(func, 'memo', None) is None:
+            raise RTException(RTError(func.pos_start, func.pos_end, f'{func} is not memoised', func.context))
+        memo = func.memo
+        return List([memo.hits, memo.misses, len(memo.cache)])
+    execute_memo_stats.arg_name = ['func']
+
 BuiltinFunction.print = BuiltinFunction('print')
 BuiltinFunction.input = BuiltinFunction('input')
 BuiltinFunction.int = BuiltinFunction('int')
-BuiltinFunction.str = BuiltinFunction('str')
\ No newline at end of file
+BuiltinFunction.str = BuiltinFunction('str')
+BuiltinFunction.memo = BuiltinFunction('memo')
+BuiltinFunction.memo_stats = BuiltinFunction('memo_stats')
+
+'''
+原始值
+运行时数字和字符串直接使用Python的int, float, bool, str, 数组和函数仍为Value对象
+只在出错或调用内建函数时包装为Number和String, 以便记录位置和上下文
+'''
+
+# 数字的原始类型
+NUMBER = (int, float, bool)
+
+NULL = Number.null.value
+
+# 两个数字之间的二元运算
+NUMBER_OPS = {
+    'addBy': operator.add,
+    'subBy': operator.sub,
+    'mulBy': operator.mul,
+    'divBy': operator.truediv,
+    'powBy': operator.pow,
+    'modBy': operator.mod,
+    'compEE': operator.eq,
+    'compNE': operator.ne,
+    'compLT': operator.lt,
+    'compGT': operator.gt,
+    'compLTE': operator.le,
+    'compGTE': operator.ge
+}
+
+def box(value):
+    '''
+    包装为可以记录位置的Value, 数组和函数返回副本, 没有值的None不包装
+    '''
+    if value is None:
+        return None
+    elif type(value) in NUMBER:
+        return Number(value)
+    elif type(value) is str:
+        return String(value)
+    return value.copy()
+
+def unbox(value):
+    if type(value) is Number or type(value) is String:
+        return value.value
+    return value
+
+def binaryOp(method_name, left, right):
+    '''
+    原始值之间的二元运算, 除数字之外的运算和错误交给包装后的Value方法
+    错误不含位置, 由调用者按AST节点生成
+    @return 结果, 错误
+    '''
+    if type(left) in NUMBER and type(right) in NUMBER:
+        try:
+            return NUMBER_OPS[method_name](left, right), None
+        except ZeroDivisionError:
+            pass
+    if left is None:
+        # 没有值的操作数不能参与运算
+        return None, RTError(None, None, 'Illegal Operation', None)
+    result, err = getattr(box(left), method_name)(box(right))
+    return unbox(result), err
+
+def inplaceOp(method_name, left, right):
+    '''
+    复合赋值的运算, 字符串累加时直接生成结果, 不经过包装
+    数组没有被多处引用时就地修改, 均摊O(1)追加
+    @return 结果, 错误
+    '''
+    if method_name == 'addBy':
+        if type(left) is str and type(right) is str:
+            return left + right, None
+        elif type(left) is List and type(right) is List:
+            return left.extend(right), None
+    elif method_name == 'mulBy' and type(right) is int:
+        if type(left) is str:
+            return left * right, None
+        elif type(left) is List:
+            return left.repeat(right), None
+    return binaryOp(method_name, left, right)
+
+def share(value):
+    '''
+    读取变量, 或使用赋值表达式的值时, 数组可能被多处引用, 之后的复合赋值不再就地修改
+    '''
+    if type(value) is List:
+        value.shared = True
+    return value
+
+def negate(value):
+    if type(value) in NUMBER:
+        return -value
+    return binaryOp('mulBy', value, -1)[0]
+
+def logicNot(value):
+    if type(value) in NUMBER:
+        return not value
+    return unbox(box(value).logicNot()[0])
+
+def valueStr(value):
+    '''
+    与包装后的值相同的字符串表示
+    '''
+    if type(value) is str:
+        return repr(String(value))
+    return str(value)
+
+# lk_interpreter从本模块导入全部名字, 在定义完成后再导入, 使两个模块以任意顺序导入都能完成初始化
+import lk_interpreter
\ No newline at end of file
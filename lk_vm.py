@@ -0,0 +1,469 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+from lk_opcode import *
+from lk_type import List, Function, BuiltinFunction, NUMBER, NULL, binaryOp, inplaceOp, negate, logicNot, share
+from lk_symbol_table import UNBOUND
+from lk_interpreter import Context, binaryError, inlineError, BreakSignal, ContinueSignal, BREAK, CONTINUE
+from lk_error import RTError, RTException
+import lk_module
+
+'''
+栈式虚拟机
+'''
+
+# 编译后的函数
+class CompiledFunction(Function):
+
+    def __init__(self, code):
+        super().__init__(code.name, code.arg_name, None, code.auto_return)
+        self.code = code
+
+    def invoke(self, args, vm, node=None):
+        pos_start, _ = self.callPos(node)
+        return vm.call(self, args, pos_start)
+
+    def copy(self):
+        return CompiledFunction(self.code).setContext(self.context).setPos(self.pos_start, self.pos_end).setMemo(self.memo)
+
+# 默认的最大调用深度
+MAX_DEPTH = 100000
+
+# 虚拟机
+class VM(object):
+
+    def __init__(self, max_depth=MAX_DEPTH):
+        '''
+        @param max_depth 最大调用深度, 函数调用不使用Python栈, 深度不受Python递归限制
+        '''
+        self.max_depth = max_depth
+
+    def run(self, code, context):
+        '''
+        执行顶层程序
+        @param code Compiler.compileProgram得到的Code
+        @param context 上下文
+        @return 运行结果, 错误
+        '''
+        try:
+            return self.execute(code, context), None
+        except RTException as e:
+            return None, e.error
+        except (BreakSignal, ContinueSignal):
+            # 没有在循环中的调用者时, break和continue结束程序
+            return None, None
+
+    def call(self, func, args, pos_start):
+        '''
+        调用参数个数已检查的编译后的函数
+        '''
+        memo = func.memo
+        key = memo.key(args) if memo is not None else None
+        if key is not None:
+            value = memo.get(key)
+            if value is not None:
+                return value
+
+        # 参数占用前面的槽位
+        new_ctx = Context(func.name, func.context, pos_start, args + [UNBOUND] * (func.code.slot_count - len(args)))
+        value = self.execute(func.code, new_ctx)
+        if value is None:
+            value = NULL
+        if key is not None:
+            memo.put(key, value)
+        return value
+
+    def checkCall(self, func, args, node, context):
+        '''
+        检查被调用的函数和参数个数, 通过后记录在调用点的内联缓存中
+        虚拟机只能调用编译后的函数和内建函数
+        '''
+        if not (isinstance(func, CompiledFunction) or isinstance(func, BuiltinFunction)):
+            if isinstance(func, Function):
+                raise Exception(f'{func} cannot be called by the VM')
+            raise RTException(RTError(node.pos_start, node.pos_end, 'Illegal Operation', context))
+        func.checkArgs(args, node.pos_start, node.pos_end)
+        node.cache = func
+
+    def unwindLoop(self, frames, is_break):
+        '''
+        弹出调用帧, 直到调用点在循环中
+        @return 调用者的执行状态, 跳转位置; 所有调用帧都不在循环中时抛出BreakSignal或ContinueSignal
+        '''
+        while len(frames) > 0:
+            frame = frames.pop()
+            target = frame[0].loop_calls.get(frame[1])
+            if target is not None:
+                pc, depth = target[:2] if is_break else target[2:]
+                del frame[2][depth:]
+                return frame, pc
+        raise BREAK if is_break else CONTINUE
+
+    def binaryError(self, op, node, left, right, context):
+        return RTException(binaryError(node, BINARY_METHODS[op], left, right, context))
+
+    def undefined(self, name, node, context):
+        return RTException(RTError(node.pos_start, node.pos_end, f'{name} is undefined', context))
+
+    def loadFast(self, value, node, context):
+        '''
+        局部变量未赋值时, 在外层作用域查找
+        外层变量的数组同时被局部变量引用, 标记为被多处引用
+        '''
+        name = node.name_token.value
+        if value is UNBOUND:
+            value = share(context.lookup(name, node.scope[2]))
+        if value is None:
+            raise self.undefined(name, node, context)
+        return value
+
+    def execute(self, code, context):
+        '''
+        执行字节码
+        @param code Code
+        @param context 上下文
+        '''
+        ops = code.code
+        consts = code.consts
+        names = code.names
+        nodes = code.nodes
+        slots = context.slots
+        # 全局变量所在的顶层上下文
+        global_ctx = context
+        for _ in range(code.level):
+            global_ctx = global_ctx.parent
+        global_table = global_ctx.symbol_table
+        get = global_table.get
+
+        stack = []
+        push = stack.append
+        pop = stack.pop
+        pc = 0
+        # 调用者的执行状态: 字节码, pc, 栈, 上下文, 全局符号表, 被调用函数的记忆化缓存和参数
+        frames = []
+
+        try:
+            while True:
+                op = ops[pc]
+                arg = ops[pc + 1]
+                pc += 2
+
+                if op == LOAD_FAST:
+                    value = slots[arg]
+                    if value is UNBOUND or value is None:
+                        value = self.loadFast(value, nodes[pc - 2], context)
+                    if type(value) is List:
+                        value.shared = True
+                    push(value)
+
+                elif op == LOAD_FAST_FAST:
+                    value = slots[arg]
+                    if value is UNBOUND or value is None:
+                        value = self.loadFast(value, nodes[pc - 2], context)
+                    if type(value) is List:
+                        value.shared = True
+                    push(value)
+                    arg = ops[pc + 1]
+                    pc += 2
+                    value = slots[arg]
+                    if value is UNBOUND or value is None:
+                        value = self.loadFast(value, nodes[pc - 2], context)
+                    if type(value) is List:
+                        value.shared = True
+                    push(value)
+
+                elif op == LOAD_FAST_CONST:
+                    value = slots[arg]
+                    if value is UNBOUND or value is None:
+                        value = self.loadFast(value, nodes[pc - 2], context)
+                    if type(value) is List:
+                        value.shared = True
+                    push(value)
+                    push(consts[ops[pc + 1]])
+                    pc += 2
+
+                elif op == STORE_FAST:
+                    slots[arg] = stack[-1]
+
+                elif op == LOAD_FAST_UPDATE:
+                    value = slots[arg]
+                    if value is UNBOUND or value is None:
+                        value = self.loadFast(value, nodes[pc - 2], context)
+                    push(value)
+
+                elif op == LOAD_NAME:
+                    value = get(names[arg])
+                    if value is None:
+                        raise self.undefined(names[arg], nodes[pc - 2], context)
+                    if type(value) is List:
+                        value.shared = True
+                    push(value)
+
+                elif op == LOAD_NAME_NAME:
+                    value = get(names[arg])
+                    if value is None:
+                        raise self.undefined(names[arg], nodes[pc - 2], context)
+                    if type(value) is List:
+                        value.shared = True
+                    push(value)
+                    arg = ops[pc + 1]
+                    pc += 2
+                    value = get(names[arg])
+                    if value is None:
+                        raise self.undefined(names[arg], nodes[pc - 2], context)
+                    if type(value) is List:
+                        value.shared = True
+                    push(value)
+
+                elif op == LOAD_NAME_CONST:
+                    value = get(names[arg])
+                    if value is None:
+                        raise self.undefined(names[arg], nodes[pc - 2], context)
+                    if type(value) is List:
+                        value.shared = True
+                    push(value)
+                    push(consts[ops[pc + 1]])
+                    pc += 2
+
+                elif op == LOAD_NAME_UPDATE:
+                    value = get(names[arg])
+                    if value is None:
+                        raise self.undefined(names[arg], nodes[pc - 2], context)
+                    push(value)
+
+                elif op == LOAD_CONST:
+                    push(consts[arg])
+
+                elif op == STORE_NAME:
+                    global_table.symbols[names[arg]] = stack[-1]
+
+                elif op == POP:
+                    pop()
+
+                elif op == FOR_ITER:
+                    state = stack[-1]
+                    i = state[0]
+                    if (i <= state[1]) if state[3] else (i >= state[1]):
+                        state[0] = i + state[2]
+                        push(i)
+                    else:
+                        pop()
+                        pc = arg
+
+                elif op == JUMP:
+                    pc = arg
+
+                elif op == POP_JUMP_IF_FALSE:
+                    if not pop():
+                        pc = arg
+
+                elif op == JUMP_IF_FALSE_OR_POP:
+                    if stack[-1]:
+                        pop()
+                    else:
+                        pc = arg
+
+                elif op == JUMP_IF_TRUE_OR_POP:
+                    if stack[-1]:
+                        pc = arg
+                    else:
+                        pop()
+
+                elif op == ADD or op == SUB or op == MUL or op == LT or op == GT or op == EE:
+                    right = pop()
+                    left = stack[-1]
+                    if type(left) in NUMBER and type(right) in NUMBER:
+                        if op == ADD:
+                            stack[-1] = left + right
+                        elif op == SUB:
+                            stack[-1] = left - right
+                        elif op == MUL:
+                            stack[-1] = left * right
+                        elif op == LT:
+                            stack[-1] = left < right
+                        elif op == GT:
+                            stack[-1] = left > right
+                        else:
+                            stack[-1] = left == right
+                    else:
+                        result, err = binaryOp(BINARY_METHODS[op], left, right)
+                        if err is not None:
+                            raise self.binaryError(op, nodes[pc - 2], left, right, context)
+                        stack[-1] = result
+
+                elif op == INPLACE_OP:
+                    right = pop()
+                    left = stack[-1]
+                    if type(left) in NUMBER and type(right) in NUMBER and arg != DIV and (arg != MOD or right):
+                        if arg == ADD:
+                            stack[-1] = left + right
+                        elif arg == SUB:
+                            stack[-1] = left - right
+                        elif arg == MUL:
+                            stack[-1] = left * right
+                        elif arg == MOD:
+                            stack[-1] = left % right
+                        else:
+                            stack[-1] = left ** right
+                    else:
+                        result, err = inplaceOp(BINARY_METHODS[arg], left, right)
+                        if err is not None:
+                            raise self.binaryError(arg, nodes[pc - 2], left, right, context)
+                        stack[-1] = result
+
+                elif op == CALL or op == TAIL_CALL:
+                    if arg:
+                        args = stack[-arg:]
+                        del stack[-arg:]
+                    else:
+                        args = []
+                    func = pop()
+                    node = nodes[pc - 2]
+                    # 与上次调用的函数相同时, 类型和参数个数已检查过
+                    if func is not node.cache:
+                        self.checkCall(func, args, node, context)
+                    if type(func) is not CompiledFunction:
+                        push(func.invoke(args, self, node))
+                        continue
+
+                    # 记忆化的函数在返回时缓存结果, 尾调用也需要保存调用者的执行状态
+                    memo = func.memo
+                    key = None
+                    if memo is not None:
+                        key = memo.key(args)
+                        if key is not None:
+                            value = memo.get(key)
+                            if value is not None:
+                                push(value)
+                                continue
+                        op = CALL
+
+                    if op == CALL and len(frames) >= self.max_depth:
+                        raise RTException(RTError(node.pos_start, node.pos_end, 'Maximum recursion depth exceeded', context))
+                    # 参数占用前面的槽位
+                    new_ctx = Context(func.name, func.context, node.pos_start, args + [UNBOUND] * (func.code.slot_count - len(args)))
+                    if op == CALL:
+                        # 调用者的执行状态保存在frames中, 不占用Python栈
+                        frames.append((code, pc, stack, context, global_table, memo, key))
+                        stack = []
+                        push = stack.append
+                        pop = stack.pop
+                    else:
+                        # 尾调用不保存当前调用帧
+                        stack.clear()
+                    context = new_ctx
+                    code = func.code
+                    ops = code.code
+                    consts = code.consts
+                    names = code.names
+                    nodes = code.nodes
+                    slots = context.slots
+                    global_ctx = context
+                    for _ in range(code.level):
+                        global_ctx = global_ctx.parent
+                    global_table = global_ctx.symbol_table
+                    get = global_table.get
+                    pc = 0
+
+                elif op == RETURN_VALUE:
+                    value = pop()
+                    if len(frames) == 0:
+                        return value
+                    code, pc, stack, context, global_table, memo, key = frames.pop()
+                    ops = code.code
+                    consts = code.consts
+                    names = code.names
+                    nodes = code.nodes
+                    slots = context.slots
+                    get = global_table.get
+                    push = stack.append
+                    pop = stack.pop
+                    if value is None:
+                        value = NULL
+                    if key is not None:
+                        memo.put(key, value)
+                    push(value)
+
+                elif op == UNWIND_LOOP:
+                    (code, _, stack, context, global_table, _, _), pc = self.unwindLoop(frames, arg)
+                    ops = code.code
+                    consts = code.consts
+                    names = code.names
+                    nodes = code.nodes
+                    slots = context.slots
+                    get = global_table.get
+                    push = stack.append
+                    pop = stack.pop
+
+                elif op in BINARY_METHODS:
+                    right = pop()
+                    left = stack[-1]
+                    result, err = binaryOp(BINARY_METHODS[op], left, right)
+                    if err is not None:
+                        raise self.binaryError(op, nodes[pc - 2], left, right, context)
+                    stack[-1] = result
+
+                elif op == NEG:
+                    stack[-1] = negate(stack[-1])
+
+                elif op == NOT:
+                    stack[-1] = logicNot(stack[-1])
+
+                elif op == LIST_APPEND:
+                    value = pop()
+                    stack[-arg].elements.append(value)
+
+                elif op == BUILD_LIST:
+                    if arg:
+                        elements = stack[-arg:]
+                        del stack[-arg:]
+                    else:
+                        elements = []
+                    push(List(elements))
+
+                elif op == SHARE:
+                    if type(stack[-1]) is List:
+                        stack[-1].shared = True
+
+                elif op == NONE_TO_NULL:
+                    if stack[-1] is None:
+                        stack[-1] = NULL
+
+                elif op == LOAD_NONE:
+                    push(None)
+
+                elif op == LOAD_DEREF:
+                    value = context.lookup(names[arg], nodes[pc - 2].scope)
+                    if value is None:
+                        raise self.undefined(names[arg], nodes[pc - 2], context)
+                    if type(value) is List:
+                        value.shared = True
+                    push(value)
+
+                elif op == CHECK_NAME:
+                    if context.lookup(names[arg], nodes[pc - 2].scope) is None:
+                        raise self.undefined(names[arg], nodes[pc - 2], context)
+
+                elif op == FOR_PREP:
+                    step_value = pop()
+                    end_value = pop()
+                    start_value = pop()
+                    push([start_value, end_value, step_value, step_value >= 0])
+
+                elif op == MAKE_FUNCTION:
+                    node = nodes[pc - 2]
+                    push(CompiledFunction(consts[arg]).setContext(context).setPos(node.pos_start, node.pos_end))
+
+                elif op == IMPORT_NAMES:
+                    lk_module.bind(nodes[pc - 2], context)
+                    push(NULL)
+
+                else:
+                    raise Exception(f'Unknown opcode {op}')
+        except RTException as e:
+            # 内联的函数体中的错误补上调用帧, 嵌套的内联中里层的范围在前
+            for start, end, node in code.inline_ranges:
+                if start <= pc - 2 < end:
+                    inlineError(e.error, node, context)
+                    break
+            raise
\ No newline at end of file
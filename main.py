@@ -1,48 +1,104 @@
 #!/usr/bin/env python3
 # -*- coding: utf-8 -*-
 
-from lk_lexer import Lexer
-from lk_parser import Parser
-from lk_interpreter import Interpreter, Context
+from lk_optimizer import INLINE_SIZE
+from lk_vm import MAX_DEPTH
+from lk_session import Session
+from lk_position import sources
 from lk_builtin import global_symbol_table
+from lk_engine import Engine, BACKENDS, compileSource, execute, cacheTag, reserveSource, loadProgram
+from lk_batch import runBatch
 
+import lk_cache
+
+import argparse
+import multiprocessing
+import os
 import sys
 
-def run(file, text, debug=False):
-    lexer = Lexer(file, text)
-    tokens, err = lexer.makeTokens()
+def run(file, text, debug=False, backend='interpreter', need_result=True, optimize=False, max_depth=MAX_DEPTH, inline_size=INLINE_SIZE):
+    '''
+    在主程序的全局符号表中执行, 全局变量在多次调用之间保留, 相互隔离的多次执行使用Engine
+    每次调用使用新的Engine, 导入的模块不在调用之间共用
+    @param need_result 是否需要运行结果, 为False时不收集顶层语句的值, 结果为None
+    @param optimize 是否进行常量折叠, 死代码消除和函数内联
+    @param max_depth vm后端的最大调用深度
+    @param inline_size 内联函数体的最大节点数
+    '''
+    engine = Engine(backend, optimize, max_depth, inline_size)
+    program, err = compileSource(sources.share(file, text), debug, backend, need_result, optimize, inline_size)
     if err is not None:
         return None, err
-    if debug:
-        print(tokens)
+    return execute(program, backend, max_depth, engine.newContext(global_symbol_table))
+
+def precompileFile(args):
+    '''
+    分析和编译一个脚本并写入缓存, 不执行, 在进程池中运行
+    @return 文件, 错误信息
+    '''
+    file_path, backend, optimize, inline_size = args
+    try:
+        with open(file_path, 'r', encoding='UTF-8') as f:
+            script = f.read()
+    except Exception as e:
+        return file_path, f'Fail to load script {file_path}, error: {e}'
 
-    parser = Parser(tokens)
-    ast = parser.parse()
-    if ast.error is not None:
-        return None, ast.error
-    # if debug:
-    #     print(ast.node)
+    tag = cacheTag(backend, False, optimize, inline_size)
+    key = lk_cache.cacheKey(script, tag)
+    source = reserveSource(file_path, script, key)
+    program, err = compileSource(source, False, backend, False, optimize, inline_size)
+    if err is not None:
+        return file_path, err.getError()
+    if not lk_cache.store(lk_cache.cachePath(file_path, tag), key, program, source.base):
+        return file_path, f'Fail to write cache of {file_path}'
+    return file_path, None
 
-    interpreter = Interpreter()
-    context = Context('<program>')
-    context.symbol_table = global_symbol_table
-    res = interpreter.visit(ast.node, context)
+def precompile(path, backend='interpreter', optimize=False, inline_size=INLINE_SIZE, jobs=None):
+    '''
+    用多个进程预先编译目录中的所有脚本, 选项与运行脚本时相同
+    @param jobs 进程数, 为None时与CPU核数相同
+    @return 是否全部编译成功
+    '''
+    if os.path.isdir(path):
+        files = []
+        for root, dirs, names in os.walk(path):
+            dirs[:] = sorted(i for i in dirs if i != lk_cache.CACHE_DIR)
+            files += [os.path.join(root, i) for i in sorted(names) if i.endswith('.lk')]
+    else:
+        files = [path]
 
-    return res.value, res.error
+    failed = 0
+    with multiprocessing.Pool(jobs) as pool:
+        tasks = [(i, backend, optimize, inline_size) for i in files]
+        for file_path, error in pool.imap_unordered(precompileFile, tasks):
+            if error is not None:
+                failed += 1
+                print(error)
+    print(f'Compiled {len(files) - failed} of {len(files)} scripts')
+    return failed == 0
 
-def shell():
+def shell(backend='interpreter', optimize=False, max_depth=MAX_DEPTH, inline_size=INLINE_SIZE, debug=False):
     print('LakiScript Shell')
     print()
 
+    session = Session('<stdin>', backend, optimize, max_depth, inline_size, debug)
     while True:
         text = input('> ')
-        res, err = run('<stdin>', text, debug=True)
+        # 括号没有闭合时继续读取下一行, 整个缓冲区一起执行
+        while session.incomplete(text):
+            text += '\n' + input('. ')
+        if text.strip() == '':
+            continue
+        res, err = session.run(text)
         if err is not None:
             print(err.getError())
         else:
             print(res)
 
-def runFile(file_path):
+def runFile(file_path, backend='interpreter', optimize=False, max_depth=MAX_DEPTH, inline_size=INLINE_SIZE, debug=False, cache=True):
+    '''
+    @param cache 是否使用编译缓存, 输出Token和字节码时不使用
+    '''
     try:
         with open(file_path, 'r', encoding='UTF-8') as f:
             script = f.read()
@@ -50,15 +106,47 @@ def runFile(file_path):
         print(f'Fail to load script {file_path}, error: {e}')
         raise
 
-    res, err = run(file_path, script, debug=False)
+    engine = Engine(backend, optimize, max_depth, inline_size, cache and not debug)
+    if cache and not debug:
+        program, err = loadProgram(file_path, script, backend, False, optimize, inline_size)
+    else:
+        program, err = compileSource(sources.add(file_path, script), debug, backend, False, optimize, inline_size)
+    if err is None:
+        res, err = execute(program, backend, max_depth, engine.newContext(global_symbol_table))
     if err is not None:
         print(err.getError())
     # else:
     #     print(res)
 
 if __name__ == '__main__':
-    if len(sys.argv) > 1:
-        file_path = sys.argv[1]
-        runFile(file_path)
+    arg_parser = argparse.ArgumentParser(description='LakiScript')
+    arg_parser.add_argument('file', nargs='?', help='script file, start the shell if omitted')
+    arg_parser.add_argument('-b', '--backend', choices=BACKENDS, default='interpreter', help='execution backend')
+    arg_parser.add_argument('-O', '--optimize', action='store_true', help='fold constants, remove dead code and inline small functions before running')
+    arg_parser.add_argument('--max-depth', type=int, default=MAX_DEPTH, help=f'maximum call depth of the vm backend, default: {MAX_DEPTH}')
+    arg_parser.add_argument('--inline-size', type=int, default=INLINE_SIZE, help=f'maximum body size in AST nodes of functions inlined by -O, 0 disables inlining, default: {INLINE_SIZE}')
+    arg_parser.add_argument('-d', '--debug', action='store_true', help='print tokens and vm bytecode')
+    arg_parser.add_argument('--no-cache', action='store_true', help=f'do not read or write compiled scripts in {lk_cache.CACHE_DIR}')
+    arg_parser.add_argument('--compile', action='store_true', help=f'compile the script, or all scripts in the directory, into {lk_cache.CACHE_DIR} without running them')
+    arg_parser.add_argument('-j', '--jobs', type=int, help='processes used by --compile and --batch, default: number of CPUs')
+    arg_parser.add_argument('--batch', metavar='RECORDS', help="run the script once for each line of RECORDS ('-' for stdin) in a process pool, the line is in the variable record and the value of output is written")
+    arg_parser.add_argument('--chunk-size', type=int, default=1000, help='records sent to a process at a time by --batch, default: 1000')
+    arg_parser.add_argument('--unordered', action='store_true', help='write the output of --batch as chunks finish instead of in record order')
+    arg_parser.add_argument('-o', '--output', help='file the output of --batch is written to, default: stdout')
+    args = arg_parser.parse_args()
+
+    if args.compile:
+        if args.file is None:
+            arg_parser.error('--compile requires a script file or directory')
+        if not precompile(args.file, args.backend, args.optimize, args.inline_size, args.jobs):
+            sys.exit(1)
+    elif args.batch is not None:
+        if args.file is None:
+            arg_parser.error('--batch requires a script file')
+        engine = Engine(args.backend, args.optimize, args.max_depth, args.inline_size, not args.no_cache)
+        if not runBatch(args.file, args.batch, engine, args.jobs, args.chunk_size, not args.unordered, args.output):
+            sys.exit(1)
+    elif args.file is not None:
+        runFile(args.file, args.backend, args.optimize, args.max_depth, args.inline_size, args.debug, not args.no_cache)
     else:
-        shell()
\ No newline at end of file
+        shell(args.backend, args.optimize, args.max_depth, args.inline_size, args.debug)
\ No newline at end of file
@@ -0,0 +1,286 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+from lk_engine import Engine, BACKENDS, INLINE_SIZE, cacheTag, loadProgram
+from lk_position import sources
+
+import lk_cache
+
+import contextlib
+import gc
+import hashlib
+import io
+import os
+import pickle
+import sys
+import tempfile
+import threading
+import unittest
+import weakref
+
+'''
+执行后端的差异测试
+同一脚本在每个执行后端上, 优化和不优化时的输出, 结果和错误都应与不优化的interpreter相同
+'''
+
+EXAMPLE = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'example.lk')
+
+def runScript(text, backend, optimize, stdin='', file='<test>'):
+    '''
+    在独立的全局符号表中执行脚本
+    @param stdin input读取的内容
+    @param file 脚本的文件名, 导入的模块相对于其所在的目录
+    @return 输出, 顶层语句的值组成的数组的字符串表示, 包含错误栈的错误信息
+    '''
+    script, err = Engine(backend, optimize, cache=False).compile(text, file)
+    if err is not None:
+        return '', None, err.getError()
+    out = io.StringIO()
+    old_stdin = sys.stdin
+    sys.stdin = io.StringIO(stdin)
+    try:
+        with contextlib.redirect_stdout(out):
+            result, err = script.run()
+    finally:
+        sys.stdin = old_stdin
+    if err is not None:
+        return out.getvalue(), None, err.getError()
+    return out.getvalue(), str(result.value), None
+
+# 执行后端的差异测试
+class BackendTest(unittest.TestCase):
+
+    def assertSame(self, text, stdin='', file='<test>'):
+        '''
+        所有后端和优化选项的执行结果相同
+        @return 不优化的interpreter的输出, 结果, 错误
+        '''
+        expected = runScript(text, 'interpreter', False, stdin, file)
+        for backend in BACKENDS:
+            for optimize in (False, True):
+                with self.subTest(backend=backend, optimize=optimize):
+                    self.assertEqual(runScript(text, backend, optimize, stdin, file), expected)
+        return expected
+
+    def test_example(self):
+        with open(EXAMPLE, 'r', encoding='UTF-8') as f:
+            text = f.read()
+        out, _, err = self.assertSame(text, '5\n5\n')
+        self.assertEqual(out, '120\n120\n')
+        self.assertIsNone(err)
+
+    def test_language(self):
+        # 闭包, 尾递归, 记忆化, 数组和字符串, 循环的值
+        text = '''func adder(x) -> {
+    func add(y) -> x + y
+
+    return add
+}
+
+var add = adder(1)
+print(add(2))
+
+func sum(n, acc) -> {
+    if n == 0 {
+        return acc
+    }
+    return sum(n - 1, acc + n)
+}
+
+print(sum(5000, 0))
+
+func fib(n) -> {
+    if n < 2 {
+        return n
+    }
+    return fib(n - 1) + fib(n - 2)
+}
+
+print(fib(15))
+var l = [1, 2]
+l += [3]
+l *= 2
+var s = 'ab' * 2 + 'c'
+print(s)
+var i = 0
+var w = while i < 5 {
+    i += 1
+    if i == 2 {
+        continue
+    }
+    if i == 4 {
+        break
+    }
+    i * 10
+}
+'''
+        out, _, err = self.assertSame(text)
+        self.assertEqual(out, '3\n12502500\n610\nababc\n')
+        self.assertIsNone(err)
+
+    def test_memo(self):
+        # 命中和未命中的次数, 淘汰最久未使用的结果, 数组参数不经过缓存
+        text = '''func double(x) -> x * 2
+
+var m = memo(double, 2)
+m(1)
+m(2)
+m(1)
+m(3)
+print(memo_stats(m))
+m(1)
+m(2)
+print(str(memo_stats(m)))
+print(m([1, 2]))
+print(m([1, 2]))
+print(memo_stats(m))
+'''
+        out, _, err = self.assertSame(text)
+        self.assertEqual(out, '1, 3, 2\n2, 4, 2\n1, 2, 1, 2\n1, 2, 1, 2\n2, 4, 2\n')
+        self.assertIsNone(err)
+
+    def test_mutual_recursion_inline(self):
+        # 相互递归的箭头函数不能无限内联
+        text = 'func isodd(n) -> n != 0 and iseven(n - 1)\n\nfunc iseven(n) -> n == 0 or isodd(n - 1)\n\nprint(iseven(4))\n'
+        out, _, err = self.assertSame(text)
+        self.assertEqual(out, 'True\n')
+        self.assertIsNone(err)
+
+    def test_inline_traceback(self):
+        # 内联的函数体中的错误与不内联时的错误栈相同
+        text = 'func a() -> b()\n\nfunc b() -> c()\n\nfunc c() -> 1 / 0\n\na()\n'
+        _, _, err = self.assertSame(text)
+        self.assertIn('line 3, in <program>\nFile <test>, line 5, in c\n', err)
+        text = 'func sq(x) -> x * x\n\nfunc f(n) -> {\n    var s = sq(n) + 1\n    return sq(s)\n}\n\nf(2)\nf([1])\n'
+        self.assertSame(text)
+
+    def test_inline_temporaries(self):
+        # 内联时参数的临时变量不是全局变量
+        for backend in BACKENDS:
+            with self.subTest(backend=backend):
+                script, _ = Engine(backend, True, cache=False).compile('func sq(x) -> x * x\n\nvar a = 3\nvar b = sq(a)\n')
+                result, _ = script.run()
+                self.assertEqual(result.globals(), {'sq': result.globals()['sq'], 'a': 3, 'b': 9})
+
+    def test_none_operand(self):
+        # 没有值的操作数报告运行时错误
+        for text in ('var c = 1\nvar d = c + if 0 {\n1\n}\n', 'var c = 1\nc += if 0 {\n1\n}\n'):
+            _, _, err = self.assertSame(text)
+            self.assertIn('Runtime Error: Illegal Operation', err)
+
+    def test_loop_jump_in_function(self):
+        # 函数中循环外的break和continue结束调用者所在的循环
+        text = 'func f() -> {\n    break\n}\n\nfor i = 1 to 3 {\n    f()\n}\n'
+        _, value, _ = self.assertSame(text)
+        self.assertEqual(value, '<function f>, ')
+        # 没有在循环中的调用者时结束程序
+        text = 'func f() -> {\n    break\n}\n\nf()\nprint(5)\n'
+        out, value, _ = self.assertSame(text)
+        self.assertEqual((out, value), ('', 'None'))
+        # 经过多层调用的continue, 循环的值不包含跳过的迭代
+        text = 'func g() -> {\n    continue\n}\n\nfunc f(n) -> {\n    if n == 2 {\n        g()\n    }\n    n\n}\n\nvar a = for i = 1 to 4 {\n    f(i)\n}\nvar w = 0\nvar b = while w < 3 {\n    w += 1\n    f(w)\n}\n'
+        self.assertSame(text)
+
+    def test_return_call_in_loop(self):
+        # 循环中return的调用不是尾调用, 被调用的函数中的break结束return所在的循环
+        text = "func g() -> {\n    break\n}\n\nfunc f() -> {\n    for i = 1 to 3 {\n        print(i)\n        return g()\n    }\n    print('after')\n    7\n}\n\nvar r = for j = 1 to 2 {\n    print(f())\n}\nprint('done')\n"
+        out, _, _ = self.assertSame(text)
+        self.assertEqual(out, '1\nafter\n0\n1\nafter\n0\ndone\n')
+
+    def test_import_shadows_builtin(self):
+        # 导入的变量遮蔽同名的内建函数
+        with tempfile.TemporaryDirectory() as path:
+            with open(os.path.join(path, 'lib.lk'), 'w', encoding='UTF-8') as f:
+                f.write('func print(x) -> x * 2\n')
+            text = "import print from 'lib'\nprint(21)\n"
+            out, value, err = self.assertSame(text, file=os.path.join(path, 'main.lk'))
+        self.assertEqual((out, value, err), ('', '0, 42', None))
+
+    def test_engine_modules(self):
+        # 每个引擎有自己的模块加载器, 模块在其中只执行一次, 使用该引擎的选项, 引擎之间互不影响
+        with tempfile.TemporaryDirectory() as path:
+            with open(os.path.join(path, 'lib.lk'), 'w', encoding='UTF-8') as f:
+                f.write("print('load')\nfunc sq(x) -> x * x\n")
+            main = os.path.join(path, 'main.lk')
+            text = "import sq from 'lib'\nsq(3)\n"
+            engines = [Engine(backend, optimize, cache=False) for backend in BACKENDS for optimize in (False, True)]
+            out = io.StringIO()
+            with contextlib.redirect_stdout(out):
+                for engine in engines:
+                    script, _ = engine.compile(text, main)
+                    for _ in range(2):
+                        result, err = script.run()
+                        self.assertIsNone(err)
+                        self.assertEqual(result.results(), [0, 9])
+            self.assertEqual(out.getvalue(), 'load\n' * len(engines))
+            for engine in engines:
+                module, = engine.modules.modules.values()
+                self.assertEqual(module.symbol_table.get('sq').name, 'sq')
+            # 多个线程同时第一次读取同一模块的变量, 只加载一次, 不报告循环导入
+            script, _ = Engine('vm', cache=False).compile(text, main)
+            results = []
+            threads = [threading.Thread(target=lambda: results.append(script.run())) for _ in range(8)]
+            out = io.StringIO()
+            with contextlib.redirect_stdout(out):
+                for thread in threads:
+                    thread.start()
+                for thread in threads:
+                    thread.join()
+            self.assertEqual(out.getvalue(), 'load\n')
+            self.assertEqual([err for _, err in results], [None] * 8)
+
+    def test_run_releases_globals(self):
+        # 执行结束后调用点的内联缓存不再引用本次执行的函数和全局变量
+        for backend in BACKENDS:
+            with self.subTest(backend=backend):
+                script, _ = Engine(backend, cache=False).compile('func f(x) -> x + 1\n\nf(1)\n')
+                result, _ = script.run()
+                symbol_table = weakref.ref(result.symbol_table)
+                del result
+                gc.collect()
+                self.assertIsNone(symbol_table())
+
+    def test_release_sources(self):
+        # 相同的脚本复用位置空间, 不再使用的脚本的源代码被移除
+        engine = Engine(cache=False)
+        count = len(sources.sources)
+        scripts = [engine.compile('var x = 1\n')[0] for _ in range(10)]
+        self.assertEqual(len(sources.sources), count + 1)
+        scripts += [engine.compile(f'var x = {i}\n')[0] for i in range(10)]
+        del scripts
+        gc.collect()
+        self.assertEqual(len(sources.sources), count)
+        # 执行错误在脚本被回收后仍可以报告
+        script, _ = engine.compile('var x = 1\nx / 0\n', '<error>')
+        _, err = script.run()
+        del script
+        gc.collect()
+        self.assertIn('File <error>, line 2', err.getError())
+        _, syntax_err = engine.compile('var x = (\n', '<error>')
+        self.assertIn('File <error>, line 2', syntax_err.getError())
+        del err, syntax_err
+        gc.collect()
+        self.assertEqual(len(sources.sources), count)
+
+    def test_untrusted_cache(self):
+        # 同组或其他用户可写的缓存文件, 引用AST节点以外的对象的缓存不被读取
+        text = 'var x = 1\n'
+        with tempfile.TemporaryDirectory() as path:
+            main = os.path.join(path, 'main.lk')
+            tag = cacheTag('interpreter', True, False, INLINE_SIZE)
+            cache_path = lk_cache.cachePath(main, tag)
+            key = lk_cache.cacheKey(text, tag)
+            base = lk_cache.cacheBase(main, key)
+            loadProgram(main, text)
+            self.assertIsNotNone(lk_cache.load(cache_path, key, base))
+            if hasattr(os, 'getuid'):
+                os.chmod(cache_path, 0o664)
+                self.assertIsNone(lk_cache.load(cache_path, key, base))
+            payload = pickle.dumps((base, os.system), pickle.HIGHEST_PROTOCOL)
+            with open(cache_path, 'wb') as f:
+                f.write(lk_cache.MAGIC + key + hashlib.sha256(payload).digest() + payload)
+            os.chmod(cache_path, 0o644)
+            self.assertIsNone(lk_cache.load(cache_path, key, base))
+
+if __name__ == '__main__':
+    unittest.main()
\ No newline at end of file